@@ -0,0 +1,255 @@
+"""
+TripPlannerAgent 复用池
+
+创建 TripPlannerAgent 时 MCPTool 要启动一次 npx 子进程来发现高德工具，并创建 LLM 客户端。
+这里按有效 Key 组合缓存已初始化的 Agent，复用时省去这次工具发现和客户端创建。
+MCPTool 的每次工具调用仍会单独启动 npx 子进程，复用 Agent 并不能让 MCP 服务常驻。
+- 每组 Key 最多保留 AGENT_POOL_SIZE 个空闲实例，超出部分用完即关闭
+- 所有 Key 的实例（空闲 + 借出）合计不超过 AGENT_POOL_MAX_TOTAL 个：达到上限时先关闭最久未用的空闲实例，
+  全部借出时拒绝新建（AgentPoolExhausted，接口返回 429）
+- 空闲超过 AGENT_POOL_IDLE_TTL 秒的实例被淘汰，后台任务每 AGENT_POOL_REAP_INTERVAL 秒检查一次
+- 空闲超过 AGENT_POOL_HEALTH_INTERVAL 秒的实例在复用前做一次 MCP 探活，失败则重建 MCPTool
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.config import get_settings
+from app.services.executors import mcp_executor
+from app.services.metrics import get_request_id
+from .trip_planner_agent import TripPlannerAgent
+
+logger = logging.getLogger(__name__)
+
+# 参与构建 TripPlannerAgent 的 Key（Unsplash Key 与 Agent 无关）
+AGENT_KEY_FIELDS = ["llm_api_key", "llm_model_id", "llm_base_url", "amap_api_key"]
+
+
+@dataclass
+class _PooledAgent:
+    agent: TripPlannerAgent
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    uses: int = 0
+
+
+class AgentPoolExhausted(Exception):
+    """Agent 总数已达上限且没有可关闭的空闲实例"""
+
+    def __init__(self, max_total: int):
+        super().__init__(f"Agent 池已满（{max_total} 个均在使用中），请稍后再试")
+        self.max_total = max_total
+
+
+def pool_key(effective_keys: Dict[str, str]) -> str:
+    """由 get_effective_keys 的结果生成池键，避免在字典键中保存明文 Key"""
+    raw = "\x1f".join(effective_keys.get(name) or "" for name in AGENT_KEY_FIELDS)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class AgentPool:
+    def __init__(self, max_idle: Optional[int] = None, idle_ttl: Optional[float] = None,
+                 health_interval: Optional[float] = None, max_total: Optional[int] = None):
+        settings = get_settings()
+        self.max_idle = max_idle if max_idle is not None else settings.agent_pool_size
+        self.max_total = max(1, max_total if max_total is not None else settings.agent_pool_max_total)
+        self.idle_ttl = idle_ttl if idle_ttl is not None else settings.agent_pool_idle_ttl
+        self.health_interval = health_interval if health_interval is not None else settings.agent_pool_health_interval
+        self._lock = threading.Lock()
+        self._idle: Dict[str, List[_PooledAgent]] = {}
+        self._in_use: Dict[str, int] = {}
+        self._leased: Dict[int, _PooledAgent] = {}
+        # 已占用名额、正在构建的实例数
+        self._creating = 0
+        self._stats = {"created": 0, "reused": 0, "recycled": 0, "evicted": 0, "discarded": 0, "rejected": 0}
+        self._reaper: Optional[asyncio.Task] = None
+
+    def _total(self) -> int:
+        """空闲、借出和正在构建的实例总数（调用方持有锁）"""
+        return sum(len(idle) for idle in self._idle.values()) + len(self._leased) + self._creating
+
+    def _reserve(self) -> None:
+        """为新建实例占用一个名额，达到上限时关闭最久未用的空闲实例，没有空闲实例则拒绝"""
+        victim = None
+        with self._lock:
+            if self._total() >= self.max_total:
+                candidates = [(p.last_used, key) for key, idle in self._idle.items() for p in idle]
+                if not candidates:
+                    self._stats["rejected"] += 1
+                    raise AgentPoolExhausted(self.max_total)
+                _, key = min(candidates)
+                idle = self._idle[key]
+                victim = min(idle, key=lambda p: p.last_used)
+                idle.remove(victim)
+                if not idle:
+                    del self._idle[key]
+                self._stats["evicted"] += 1
+            self._creating += 1
+        if victim is not None:
+            victim.agent.close()
+
+    def _create(self, effective_keys: Dict[str, str]) -> _PooledAgent:
+        agent = TripPlannerAgent(
+            amap_api_key=effective_keys["amap_api_key"],
+            llm_api_key=effective_keys["llm_api_key"],
+            llm_model_id=effective_keys["llm_model_id"],
+            llm_base_url=effective_keys["llm_base_url"]
+        )
+        with self._lock:
+            self._stats["created"] += 1
+        return _PooledAgent(agent=agent)
+
+    def _take_idle(self, key: str) -> Optional[_PooledAgent]:
+        with self._lock:
+            idle = self._idle.get(key)
+            return idle.pop() if idle else None
+
+    def acquire(self, effective_keys: Dict[str, str]) -> TripPlannerAgent:
+        """取出一个可用的 Agent，没有空闲实例时新建（阻塞调用）"""
+        self.evict_idle()
+        key = pool_key(effective_keys)
+        pooled = self._take_idle(key)
+
+        if pooled and time.monotonic() - pooled.last_used > self.health_interval:
+            if not pooled.agent.check_health():
+                pooled = self._recycle(pooled)
+
+        created = pooled is None
+        if pooled:
+            with self._lock:
+                self._stats["reused"] += 1
+        else:
+            self._reserve()
+            try:
+                pooled = self._create(effective_keys)
+            except Exception:
+                with self._lock:
+                    self._creating -= 1
+                raise
+
+        pooled.uses += 1
+        with self._lock:
+            if created:
+                self._creating -= 1
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+            self._leased[id(pooled.agent)] = pooled
+        return pooled.agent
+
+    def release(self, effective_keys: Dict[str, str], agent: TripPlannerAgent) -> None:
+        """归还 Agent：清空对话历史，MCP 异常时先重建，池满则关闭"""
+        key = pool_key(effective_keys)
+        with self._lock:
+            self._in_use[key] = max(0, self._in_use.get(key, 0) - 1)
+            pooled = self._leased.pop(id(agent), None) or _PooledAgent(agent=agent)
+
+        if not agent.reusable:
+            # 超时的检索线程可能仍在使用该 Agent，不能再借给其他请求
+            with self._lock:
+                self._stats["discarded"] += 1
+            agent.close()
+            return
+
+        agent.reset()
+        if not agent.mcp_healthy:
+            pooled = self._recycle(pooled)
+            if pooled is None:
+                return
+
+        pooled.last_used = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(pooled)
+                return
+            self._stats["discarded"] += 1
+        agent.close()
+
+    def _recycle(self, pooled: _PooledAgent) -> Optional[_PooledAgent]:
+        """重建 MCPTool，失败则丢弃该 Agent"""
+        try:
+            pooled.agent.recycle_mcp()
+            with self._lock:
+                self._stats["recycled"] += 1
+            return pooled
+        except Exception as e:
+            logger.error(f"Failed to recycle MCP tool, dropping agent: {e}")
+            pooled.agent.close()
+            with self._lock:
+                self._stats["discarded"] += 1
+            return None
+
+    def evict_idle(self) -> int:
+        """关闭空闲过久的 Agent，返回淘汰数量"""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for key, idle in list(self._idle.items()):
+                keep = [p for p in idle if now - p.last_used <= self.idle_ttl]
+                expired.extend(p for p in idle if now - p.last_used > self.idle_ttl)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+            self._stats["evicted"] += len(expired)
+        for pooled in expired:
+            pooled.agent.close()
+        if expired:
+            logger.info(f"request={get_request_id()} 淘汰空闲 Agent {len(expired)} 个")
+        return len(expired)
+
+    async def _reap_loop(self) -> None:
+        interval = max(1.0, get_settings().agent_pool_reap_interval)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await mcp_executor.run(self.evict_idle)
+            except Exception as e:
+                logger.warning(f"Agent pool reaper failed: {e}")
+
+    def start_reaper(self) -> None:
+        """启动后台淘汰任务，空闲实例不必等到下一次 acquire 才被关闭"""
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_loop())
+
+    async def stop_reaper(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None
+
+    def close(self) -> None:
+        with self._lock:
+            pooled_agents = [p for idle in self._idle.values() for p in idle]
+            self._idle.clear()
+        for pooled in pooled_agents:
+            pooled.agent.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "idle": sum(len(idle) for idle in self._idle.values()),
+                "in_use": sum(self._in_use.values()),
+                "total": self._total(),
+                "max_total": self.max_total,
+                "keys": len(set(self._idle) | {k for k, v in self._in_use.items() if v}),
+                "max_idle_per_key": self.max_idle,
+            }
+
+    @asynccontextmanager
+    async def lease(self, effective_keys: Dict[str, str]) -> AsyncIterator[TripPlannerAgent]:
+        """在协程中借用 Agent，新建（MCP 工具发现）和探活在 mcp 线程池中执行"""
+        agent = await mcp_executor.run(self.acquire, effective_keys)
+        try:
+            yield agent
+        finally:
+            await mcp_executor.run(self.release, effective_keys, agent)
+
+
+agent_pool = AgentPool()
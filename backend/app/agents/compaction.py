@@ -0,0 +1,152 @@
+"""
+规划输入压缩
+
+检索 Agent 的回答往往是数千字符的自由文本，直接拼进规划提示词会放大输入 token 和首 token 延迟。
+这里改为解析检索阶段记录下来的高德工具原始结果，只保留规划用到的字段：
+- POI（景点/酒店）: 名称、地址、坐标、评分、价格
+- 天气: 每日预报
+景点与酒店结果按名称去重（同一 POI 只保留在酒店中），景点数量按行程天数封顶。
+某一类没有解析出结构化记录时（例如 Agent 没有调用工具），保留该 Agent 的原始回答。
+"""
+
+import json
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.services.cache import normalize_key
+
+logger = logging.getLogger(__name__)
+
+_decoder = json.JSONDecoder()
+
+
+def _parse_json_values(raw: Any) -> Iterator[Any]:
+    """工具结果可能是 dict，也可能是前后带说明文字的 JSON 字符串"""
+    if isinstance(raw, (dict, list)):
+        yield raw
+        return
+    text = str(raw or "")
+    pos = text.find("{")
+    while pos != -1:
+        try:
+            value, end = _decoder.raw_decode(text, pos)
+        except ValueError:
+            pos = text.find("{", pos + 1)
+            continue
+        yield value
+        pos = text.find("{", end)
+
+
+def _find_lists(value: Any, key: str) -> Iterator[List[Any]]:
+    if isinstance(value, dict):
+        for k, v in value.items():
+            if k == key and isinstance(v, list):
+                yield v
+            else:
+                yield from _find_lists(v, key)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _find_lists(item, key)
+
+
+def _clean(value: Any) -> Optional[str]:
+    # 高德接口的空字段返回 [] 或 ""
+    if value in (None, "", [], {}):
+        return None
+    return str(value).strip() or None
+
+
+def parse_pois(raw: Any) -> List[Dict[str, Any]]:
+    records = []
+    for value in _parse_json_values(raw):
+        for pois in _find_lists(value, "pois"):
+            for poi in pois:
+                if not isinstance(poi, dict) or not _clean(poi.get("name")):
+                    continue
+                biz_ext = poi.get("biz_ext") if isinstance(poi.get("biz_ext"), dict) else {}
+                location = poi.get("location")
+                if isinstance(location, dict):
+                    location = f"{location.get('longitude', location.get('lng'))},{location.get('latitude', location.get('lat'))}"
+                records.append({
+                    "name": _clean(poi.get("name")),
+                    "address": _clean(poi.get("address")),
+                    "location": _clean(location),
+                    "rating": _clean(biz_ext.get("rating") or poi.get("rating")),
+                    "price": _clean(biz_ext.get("cost") or poi.get("cost") or poi.get("price")),
+                })
+    return records
+
+
+def parse_forecasts(raw: Any) -> List[Dict[str, Any]]:
+    records = []
+    for value in _parse_json_values(raw):
+        for key in ("casts", "forecasts"):
+            for casts in _find_lists(value, key):
+                for cast in casts:
+                    if not isinstance(cast, dict) or not cast.get("date"):
+                        continue
+                    records.append({
+                        "date": cast.get("date"),
+                        "day_weather": _clean(cast.get("dayweather")),
+                        "night_weather": _clean(cast.get("nightweather")),
+                        "day_temp": _clean(cast.get("daytemp")),
+                        "night_temp": _clean(cast.get("nighttemp")),
+                        "wind_direction": _clean(cast.get("daywind")),
+                        "wind_power": _clean(cast.get("daypower")),
+                    })
+    unique = {}
+    for record in records:
+        unique.setdefault(record["date"], record)
+    return [unique[date] for date in sorted(unique)]
+
+
+def _dedupe(records: List[Dict[str, Any]], exclude: set = frozenset()) -> List[Dict[str, Any]]:
+    seen = set(exclude)
+    result = []
+    for record in records:
+        key = normalize_key(record["name"])
+        if key not in seen:
+            seen.add(key)
+            result.append(record)
+    return result
+
+
+def _format_poi(record: Dict[str, Any]) -> str:
+    parts = [record["name"]]
+    for label, field in (("地址", "address"), ("坐标", "location"), ("评分", "rating"), ("价格", "price")):
+        if record.get(field):
+            parts.append(f"{label}: {record[field]}")
+    return "- " + " | ".join(parts)
+
+
+def _format_forecast(record: Dict[str, Any]) -> str:
+    return (
+        f"- {record['date']}: 白天{record['day_weather'] or '-'} {record['day_temp'] or '-'}℃, "
+        f"夜间{record['night_weather'] or '-'} {record['night_temp'] or '-'}℃, "
+        f"{record['wind_direction'] or ''}风 {record['wind_power'] or ''}级"
+    )
+
+
+def compact_research(tool_outputs: Dict[str, List[Any]], days: int,
+                     attractions_per_day: int, max_hotels: int) -> Dict[str, str]:
+    """
+    把各检索 Agent 记录的工具调用 [(工具名, 参数, 结果)] 压缩为规划用的文本
+
+    返回 {检索名: 文本}，没有解析出结构化记录的检索名不在结果中。
+    """
+    hotels = _dedupe([r for _, _, raw in tool_outputs.get("hotel", []) for r in parse_pois(raw)])[:max_hotels]
+    hotel_names = {normalize_key(r["name"]) for r in hotels}
+    attractions = _dedupe(
+        [r for _, _, raw in tool_outputs.get("attraction", []) for r in parse_pois(raw)],
+        exclude=hotel_names,
+    )[:max(days, 1) * attractions_per_day]
+    forecasts = [r for _, _, raw in tool_outputs.get("weather", []) for r in parse_forecasts(raw)]
+
+    compacted = {}
+    if attractions:
+        compacted["attraction"] = "\n".join(_format_poi(r) for r in attractions)
+    if hotels:
+        compacted["hotel"] = "\n".join(_format_poi(r) for r in hotels)
+    if forecasts:
+        compacted["weather"] = "\n".join(_format_forecast(r) for r in forecasts)
+    return compacted
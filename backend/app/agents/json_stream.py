@@ -0,0 +1,300 @@
+"""
+规划 Agent 输出的 JSON 解析
+
+- DayStreamParser: LLM 按 token 流式返回行程 JSON 时逐字符扫描（区分字符串字面量中的括号），
+  顶层对象中 "days" 数组的每个元素闭合时立即解析并返回，前端无需等待整份计划生成完毕。
+- extract_json_object: 从完整输出中提取顶层 JSON 对象，按括号配对截取（忽略前后的 markdown
+  代码块标记和说明文字），修复尾随逗号、未闭合的字符串/数组/对象等常见缺陷；
+  仍无法解析时抛出 JSONExtractionError，给出出错的行列号和 JSON 路径（如 days[2].meals）。
+"""
+
+import json
+import logging
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+JSONPath = Tuple[Union[str, int], ...]
+
+_CLOSERS = {"{": "}", "[": "]"}
+# 对象末尾只有键（或键和不完整的值）而被截断的情况
+_DANGLING_KEY_RE = re.compile(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*(?::\s*([^\s"{}\[\],:]*))?\s*$')
+# 顶层对象的开头：左花括号后紧跟一个键，避免误用说明文字中的 "{城市}"
+_OBJECT_START_RE = re.compile(r'\{\s*"')
+
+
+class JSONExtractionError(ValueError):
+    def __init__(self, message: str, text: str, pos: int, path: JSONPath):
+        self.message = message
+        self.text = text
+        self.pos = pos
+        self.path = path
+        self.lineno = text.count("\n", 0, pos) + 1
+        self.colno = pos - text.rfind("\n", 0, pos)
+        snippet = text[max(pos - 40, 0):pos + 40].replace("\n", " ")
+        super().__init__(
+            f"{message} (line {self.lineno} column {self.colno}, path {format_path(path)}): ...{snippet}..."
+        )
+
+
+def format_path(path: JSONPath) -> str:
+    parts = []
+    for part in path:
+        if isinstance(part, int):
+            parts.append(f"[{part}]")
+        elif part is not None:
+            parts.append(f".{part}" if parts else str(part))
+    return "".join(parts) or "$"
+
+
+def _strip_trailing_comma(out: List[str]) -> None:
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i]
+
+
+def _is_literal(token: str) -> bool:
+    try:
+        json.loads(token)
+        return True
+    except ValueError:
+        return False
+
+
+def repair_json(text: str) -> str:
+    """
+    修复从第一个左花括号开始的 JSON 文本
+
+    去掉闭合括号前的尾随逗号；遇到不匹配的闭合括号时先补齐内层未闭合的数组/对象，多余的闭合括号丢弃；
+    字符串中的裸换行转义为 \\n；顶层对象闭合后的内容忽略；文本被截断时补齐字符串和括号，
+    并去掉末尾没有值的键。
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            elif ch == "\n":
+                ch = "\\n"
+            out.append(ch)
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if not any(_CLOSERS[opener] == ch for opener in stack):
+                continue
+            _strip_trailing_comma(out)
+            while _CLOSERS[stack[-1]] != ch:
+                out.append(_CLOSERS[stack.pop()])
+                _strip_trailing_comma(out)
+            stack.pop()
+            out.append(ch)
+            if not stack:
+                break
+            continue
+        out.append(ch)
+
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    if stack:
+        repaired = "".join(out)
+        if stack[-1] == "{":
+            match = _DANGLING_KEY_RE.search(repaired)
+            if match and not (match.group(2) and _is_literal(match.group(2))):
+                repaired = repaired[:match.start()] + match.group(1)
+        out = list(repaired)
+        for opener in reversed(stack):
+            _strip_trailing_comma(out)
+            out.append(_CLOSERS[opener])
+    return "".join(out)
+
+
+def _structure(text: str) -> Iterator[Tuple[int, str, JSONPath]]:
+    """
+    扫描 JSON 文本中的结构字符，产出 (位置, 字符, 当前路径)
+
+    左括号产出的是容器本身的路径，右括号产出的是闭合后所在位置的路径（即刚闭合的值的路径）。
+    """
+    stack: List[list] = []  # [括号, 当前键或下标]
+    in_string = False
+    escape = False
+    key_start: Optional[int] = None
+    expecting_key = False
+    for pos, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if key_start is not None:
+                    stack[-1][1] = text[key_start + 1:pos]
+                    key_start = None
+                    yield pos, ch, tuple(entry[1] for entry in stack)
+            continue
+        if ch == '"':
+            in_string = True
+            if expecting_key:
+                key_start = pos
+                expecting_key = False
+        elif ch in "{[":
+            yield pos, ch, tuple(entry[1] for entry in stack)
+            stack.append([ch, 0 if ch == "[" else None])
+            expecting_key = ch == "{"
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            expecting_key = False
+            yield pos, ch, tuple(entry[1] for entry in stack)
+        elif ch == "," and stack:
+            if stack[-1][0] == "[":
+                stack[-1][1] += 1
+            else:
+                expecting_key = True
+            yield pos, ch, tuple(entry[1] for entry in stack)
+
+
+def json_path_at(text: str, pos: int) -> JSONPath:
+    """pos 处所在的 JSON 路径"""
+    path: JSONPath = ()
+    for at, ch, current in _structure(text):
+        if at > pos:
+            break
+        path = current
+    return path
+
+
+def value_span(text: str, path: JSONPath) -> Optional[Tuple[int, int]]:
+    """路径对应的对象/数组在文本中的起止位置"""
+    start = None
+    for pos, ch, current in _structure(text):
+        if current != path:
+            continue
+        if ch in "{[" and start is None:
+            start = pos
+        elif ch in "}]" and start is not None:
+            return start, pos + 1
+    return None
+
+
+def extract_json_text(text: str) -> str:
+    """截取并修复 LLM 输出中的顶层 JSON 对象文本（不保证一定能解析）"""
+    match = _OBJECT_START_RE.search(text)
+    if match is None:
+        raise JSONExtractionError("No JSON object found in the response", text, 0, ())
+    return repair_json(text[match.start():])
+
+
+def extract_json_object(text: str) -> Dict[str, Any]:
+    """提取并修复 LLM 输出中的顶层 JSON 对象"""
+    repaired = extract_json_text(text)
+    try:
+        value = json.loads(repaired)
+    except json.JSONDecodeError as e:
+        raise JSONExtractionError(e.msg, repaired, e.pos, json_path_at(repaired, e.pos)) from e
+    if not isinstance(value, dict):
+        raise JSONExtractionError("Top-level JSON value is not an object", repaired, 0, ())
+    return value
+
+
+class DayStreamParser:
+    def __init__(self, array_key: str = "days"):
+        self.array_key = array_key
+        self._chunks: List[str] = []
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        # 顶层对象中最近的字符串（可能是键）及当前键
+        self._string_chars: Optional[List[str]] = None
+        self._last_string: Optional[str] = None
+        self._current_key: Optional[str] = None
+        # "days" 数组所在的栈深度，以及正在收集的元素文本
+        self._array_depth: Optional[int] = None
+        self._item_chars: Optional[List[str]] = None
+        self.items_parsed = 0
+
+    @property
+    def text(self) -> str:
+        """到目前为止的完整输出"""
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """输入一段新文本，返回其中新闭合的数组元素"""
+        self._chunks.append(chunk)
+        completed = []
+        for ch in chunk:
+            item = self._consume(ch)
+            if item is not None:
+                completed.append(item)
+        return completed
+
+    def _consume(self, ch: str) -> Optional[Dict[str, Any]]:
+        if self._item_chars is not None:
+            self._item_chars.append(ch)
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if self._string_chars is not None:
+                    self._last_string = "".join(self._string_chars)
+                    self._string_chars = None
+                return None
+            if self._string_chars is not None:
+                self._string_chars.append(ch)
+            return None
+
+        if ch == '"':
+            self._in_string = True
+            if len(self._stack) == 1:
+                self._string_chars = []
+        elif ch == ":" and len(self._stack) == 1:
+            self._current_key = self._last_string
+        elif ch == "," and len(self._stack) == 1:
+            self._current_key = None
+        elif ch in "{[":
+            if not self._stack and ch == "[":
+                return None  # 顶层对象之前的方括号（说明文字）不计入
+            self._stack.append(ch)
+            depth = len(self._stack)
+            if ch == "[" and depth == 2 and self._current_key == self.array_key:
+                self._array_depth = depth
+            elif ch == "{" and self._array_depth is not None and depth == self._array_depth + 1:
+                self._item_chars = [ch]
+        elif ch in "}]" and self._stack:
+            self._stack.pop()
+            depth = len(self._stack)
+            if ch == "]" and self._array_depth is not None and depth == self._array_depth - 1:
+                self._array_depth = None
+            elif ch == "}" and self._item_chars is not None and depth == self._array_depth:
+                return self._finish_item()
+        return None
+
+    def _finish_item(self) -> Optional[Dict[str, Any]]:
+        raw = "".join(self._item_chars)
+        self._item_chars = None
+        try:
+            item = json.loads(repair_json(raw))
+        except ValueError as e:
+            logger.warning(f"Failed to parse streamed {self.array_key} item: {e}")
+            return None
+        self.items_parsed += 1
+        return item
@@ -85,3 +85,73 @@ PLANNER_AGENT_PROMPT = """你是行程规划专家。
 6. 确保输出是一个合法的 JSON 字符串，可以直接被 json.loads() 解析。
 7. search_keywords 必须包含5个与本次旅行相关的搜索关键词，用于在小红书等平台搜索攻略。
 """
+
+# 预算由代码根据门票、餐饮和酒店费用计算时使用的规划提示词（不输出 budget 字段，减少输出 token）
+_PLANNER_BUDGET_FIELD = """  "budget": {
+    "total_attractions": 200,
+    "total_hotels": 1000,
+    "total_meals": 500,
+    "total_transportation": 100,
+    "total": 1800
+  },
+"""
+PLANNER_AGENT_PROMPT_NO_BUDGET = PLANNER_AGENT_PROMPT.replace(_PLANNER_BUDGET_FIELD, "") + """8. 不要输出 budget 字段，预算由系统根据门票、餐饮和酒店费用自动计算。
+"""
+
+PLAN_FRAGMENT_REPAIR_PROMPT = """下面是旅行计划 JSON 中 {path} 部分的内容，解析时出错：
+{error}
+
+{fragment}
+
+请只返回修正后的这一个 JSON 对象，字段要求与上面规定的输出格式中对应部分一致。
+不要返回完整计划，不要包含 Markdown 代码块标签或解释文字。
+"""
+
+PLANNER_SKELETON_PROMPT = """你是行程规划专家，现在只需要给出行程骨架（把景点分配到每一天），详细安排会在之后逐天生成。
+
+**输出格式:**
+必须严格按照以下JSON格式返回，不要包含任何Markdown代码块标签（如 ```json ），不要包含任何解释文字。
+{
+  "days": [
+    {"day_index": 0, "theme": "当日主题（一句话）", "attractions": ["景点名1", "景点名2"], "hotel": "酒店名"}
+  ],
+  "weather_info": [
+    {"date": "YYYY-MM-DD", "day_weather": "晴", "night_weather": "多云", "day_temp": 25, "night_temp": 15, "wind_direction": "北风", "wind_power": "3级"}
+  ],
+  "overall_suggestions": "总体建议",
+  "search_keywords": ["城市旅游攻略", "城市必去景点", "城市美食推荐", "具体景点攻略", "城市N日游路线"]
+}
+
+**规划要求:**
+1. days 必须覆盖全部天数，day_index 从0开始。
+2. 每天安排2-3个景点，地理位置相近的景点安排在同一天，景点名称必须来自提供的景点信息。
+3. 确保所有数值（如温度）为纯数字，输出可以直接被 json.loads() 解析。
+4. search_keywords 必须包含5个与本次旅行相关的搜索关键词。
+"""
+
+PLANNER_DAY_PROMPT = """你是行程规划专家，负责生成多日行程中某一天的详细安排。
+
+**输出格式:**
+必须严格按照以下JSON格式返回一个对象，不要包含任何Markdown代码块标签（如 ```json ），不要包含任何解释文字。
+{
+  "date": "YYYY-MM-DD",
+  "day_index": 0,
+  "description": "当日行程总体描述",
+  "transportation": "建议交通方式",
+  "accommodation": "住宿安排描述",
+  "hotel": {"name": "酒店名", "address": "地址", "estimated_cost": 500},
+  "attractions": [
+    {"name": "景点名", "address": "地址", "description": "描述", "visit_duration": 120, "ticket_price": 60, "location": {"longitude": 116.4, "latitude": 39.9}}
+  ],
+  "meals": [
+    {"type": "breakfast", "name": "餐厅名", "estimated_cost": 30},
+    {"type": "lunch", "name": "餐厅名", "estimated_cost": 80},
+    {"type": "dinner", "name": "餐厅名", "estimated_cost": 100}
+  ]
+}
+
+**规划要求:**
+1. 只安排指定的景点，使用提供的景点信息中的地址和经纬度。
+2. meals 必须是一个对象列表，每个对象包含 type, name, estimated_cost。
+3. 确保所有数值（如价格）为纯数字，输出可以直接被 json.loads() 解析。
+"""
@@ -0,0 +1,61 @@
+"""
+检索 Agent 结果缓存
+
+景点、天气、酒店检索只取决于各自的查询（城市、偏好、住宿类型），与日期、天数和预算无关，
+因此可以在用户填写表单时预取，或由离线任务提前预热。结果持久化在 SQLite 中，多个 worker 进程共享；
+天气检索使用单独的命名空间和较短的有效期。只缓存成功的结果。
+
+research_flight 合并同时进行的相同检索：规划请求遇到正在预取的检索时等待同一个结果，而不是再跑一遍。
+"""
+
+import os
+from typing import Any, Dict, Optional
+
+from app.config import get_settings
+from app.services.cache import SQLiteCache, normalize_key
+from app.services.single_flight import SingleFlight
+
+# 使用较短有效期的检索
+SHORT_LIVED_STEPS = ("weather",)
+
+_caches: Dict[str, SQLiteCache] = {}
+
+research_flight = SingleFlight()
+
+
+def research_key(name: str, query: str) -> str:
+    return f"{name}:{normalize_key(query)}"
+
+
+def _get_cache(name: str) -> SQLiteCache:
+    namespace = "research_weather" if name in SHORT_LIVED_STEPS else "research"
+    if namespace not in _caches:
+        settings = get_settings()
+        _caches[namespace] = SQLiteCache(
+            path=os.path.join(settings.cache_dir, "cache.sqlite3"),
+            namespace=namespace,
+            ttl=settings.research_cache_weather_ttl if name in SHORT_LIVED_STEPS else settings.research_cache_ttl,
+            max_entries=settings.research_cache_max_entries
+        )
+    return _caches[namespace]
+
+
+def get_research(name: str, query: str) -> Optional[Dict[str, Any]]:
+    """返回 ResearchResult.to_checkpoint() 格式的缓存结果（阻塞调用）"""
+    if not get_settings().research_cache_enabled:
+        return None
+    return _get_cache(name).get(research_key(name, query))
+
+
+def store_research(name: str, query: str, record: Dict[str, Any]) -> None:
+    if not get_settings().research_cache_enabled or record.get("error") is not None:
+        return
+    _get_cache(name).set(research_key(name, query), record)
+
+
+def research_cache_stats() -> Dict[str, Any]:
+    return {
+        "research": _get_cache("attraction").stats(),
+        "research_weather": _get_cache("weather").stats(),
+        "single_flight": research_flight.stats(),
+    }
@@ -0,0 +1,171 @@
+"""
+MCP 工具调用结果缓存
+
+所有 TripPlannerAgent 实例（以及 Agent 池中的多个实例）共享同一个进程内缓存，
+以 工具名 + 规范化后的参数 为键。天气类工具有效期较短，POI 搜索等相对静态的数据有效期较长，
+总大小超过上限时按 LRU 淘汰。只缓存解析为成功的结果：MCPTool 出错时返回错误文本而不是抛出异常，
+高德接口出错时返回的 JSON 里带失败状态，这些都不写入缓存。
+
+record_tool_calls() 在当前上下文中记录工具调用的原始结果（检索 Agent 在各自线程中运行，互不干扰），
+供规划前的输入压缩使用。
+"""
+
+import json
+import logging
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from hello_agents.tools.builtin.protocol_tools import MCPTool
+from app.config import get_settings
+from app.services.cache import MemoryCache, normalize_key
+from app.services.metrics import get_request_id, span
+from app.services.executors import mcp_executor
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# MCP 工具名（不带 amap_ 前缀）-> 有效期（秒），未列出的工具使用 POI 有效期
+TOOL_CACHE_TTLS = {
+    "maps_weather": settings.mcp_cache_weather_ttl,
+}
+
+# MCPTool 成功调用工具时的返回格式，其余返回（"MCP 操作失败: …"、"异步操作失败: …"、"错误：…"）都是失败
+_SUCCESS_RESULT = re.compile(r"^工具 '[^']*' 执行结果:\n(.*)$", re.S)
+
+# MCPTool 连接或启动 MCP 服务失败时的返回前缀（不同于高德接口返回的业务错误）
+_MCP_FAILURE_PREFIXES = ("MCP 操作失败", "异步操作失败")
+
+# list_tools 成功时的返回格式
+_TOOL_LIST_RESULT = re.compile(r"^找到 [1-9]\d* 个工具:")
+
+# 结果中这些字段存在时必须非空
+_DATA_FIELDS = ("pois", "forecasts")
+
+
+def is_mcp_failure(value: Any) -> bool:
+    """MCPTool.run 的返回是否表示 MCP 服务本身不可用"""
+    return isinstance(value, str) and value.startswith(_MCP_FAILURE_PREFIXES)
+
+
+def is_tool_list(value: Any) -> bool:
+    """MCPTool.run({"action": "list_tools"}) 是否返回了非空的工具列表"""
+    return isinstance(value, str) and _TOOL_LIST_RESULT.match(value) is not None
+
+
+def is_successful_result(value: Any) -> bool:
+    """MCPTool.call_tool 的返回是否为成功的结果：格式正确、内容为 JSON、状态成功且数据非空"""
+    match = _SUCCESS_RESULT.match(value) if isinstance(value, str) else None
+    if match is None:
+        return False
+    try:
+        data = json.loads(match.group(1))
+    except ValueError:
+        return False
+    if isinstance(data, list):
+        return bool(data)
+    if not isinstance(data, dict) or not data:
+        return False
+    # 高德 Web 服务接口的 status 为 "1" 表示成功
+    if "status" in data and str(data["status"]) != "1":
+        return False
+    return all(data[field] for field in _DATA_FIELDS if field in data)
+
+
+def _normalize_arguments(arguments: Any) -> Any:
+    if isinstance(arguments, dict):
+        return {k: _normalize_arguments(v) for k, v in arguments.items()}
+    if isinstance(arguments, list):
+        return [_normalize_arguments(v) for v in arguments]
+    if isinstance(arguments, str):
+        return normalize_key(arguments)
+    return arguments
+
+
+class ToolResultCache:
+    def __init__(self, max_bytes: int):
+        self._cache = MemoryCache(max_bytes)
+        self._lock = threading.Lock()
+        # 工具名 -> {"hits": n, "misses": n}
+        self._per_tool: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def make_key(tool_name: str, arguments: Any) -> str:
+        args = json.dumps(_normalize_arguments(arguments or {}), sort_keys=True, ensure_ascii=False)
+        return f"{tool_name}:{args}"
+
+    def ttl_for(self, tool_name: str) -> float:
+        return TOOL_CACHE_TTLS.get(tool_name, settings.mcp_cache_poi_ttl)
+
+    def get(self, tool_name: str, arguments: Any) -> Any:
+        value = self._cache.get(self.make_key(tool_name, arguments))
+        with self._lock:
+            counter = self._per_tool.setdefault(tool_name, {"hits": 0, "misses": 0})
+            counter["hits" if value is not None else "misses"] += 1
+        return value
+
+    def set(self, tool_name: str, arguments: Any, value: Any) -> None:
+        if not is_successful_result(value):
+            return
+        self._cache.set(self.make_key(tool_name, arguments), value, self.ttl_for(tool_name))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_tool = {name: dict(counter) for name, counter in self._per_tool.items()}
+        return {**self._cache.stats(), "tools": per_tool}
+
+
+tool_cache = ToolResultCache(max_bytes=settings.mcp_cache_max_bytes)
+
+# (工具名, 参数, 原始结果)
+ToolCall = Tuple[str, Any, Any]
+_recorded_calls: ContextVar[Optional[List[ToolCall]]] = ContextVar("recorded_tool_calls", default=None)
+
+
+@contextmanager
+def record_tool_calls() -> Iterator[List[ToolCall]]:
+    calls: List[ToolCall] = []
+    token = _recorded_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _recorded_calls.reset(token)
+
+
+def _record(tool_name: str, arguments: Any, result: Any) -> None:
+    calls = _recorded_calls.get()
+    if calls is not None:
+        calls.append((tool_name, arguments, result))
+
+
+class CachedMCPTool(MCPTool):
+    """
+    带结果缓存的 MCPTool
+
+    展开后的子工具最终也通过 run({"action": "call_tool", ...}) 调用，因此在这里统一拦截。
+    未命中缓存的调用在 mcp 线程池中执行，限制同时进行的 MCP 调用数。
+    """
+
+    def run(self, parameters: Dict[str, Any]) -> Any:
+        if parameters.get("action") != "call_tool":
+            return super().run(parameters)
+        tool_name = parameters.get("tool_name", "")
+        arguments = parameters.get("arguments", {})
+        with span("mcp_tool", tool_name) as labels:
+            cached = tool_cache.get(tool_name, arguments) if settings.mcp_cache_enabled else None
+            if cached is not None:
+                logger.info(f"request={get_request_id()} 工具缓存命中: {tool_name}")
+                labels["status"] = "hit"
+                result = cached
+            else:
+                result = mcp_executor.call(super().run, parameters)
+                if settings.mcp_cache_enabled:
+                    tool_cache.set(tool_name, arguments, result)
+        _record(tool_name, arguments, result)
+        return result
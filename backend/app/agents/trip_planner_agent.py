@@ -2,13 +2,83 @@ from hello_agents import HelloAgentsLLM, SimpleAgent
 # from hello_agents.tools import MCPTool
 from hello_agents.tools.builtin.protocol_tools import MCPTool
 from app.config import get_settings
-from app.models.schemas import TripPlanRequest, TripPlan
-from .prompts import ATTRACTION_AGENT_PROMPT, WEATHER_AGENT_PROMPT, HOTEL_AGENT_PROMPT, PLANNER_AGENT_PROMPT
+from app.models.schemas import TripPlanRequest, TripPlan, DayPlan, WeatherInfo
+from app.services.budget import compute_budget
+from app.services.routing import optimize_routes
+from app.services.metrics import get_request_id, span
+from app.services.executors import io_executor, llm_executor
+from app.services.llm_client import UsageRecordingLLM, ainvoke, arun_agent, astream_agent, uses_async_llm
+from .tool_cache import CachedMCPTool, is_mcp_failure, is_tool_list, record_tool_calls
+from .research_cache import get_research, research_flight, research_key, store_research
+from .compaction import compact_research
+from .json_stream import JSONExtractionError, JSONPath, extract_json_object, extract_json_text, format_path, value_span
+from .prompts import (
+    ATTRACTION_AGENT_PROMPT, WEATHER_AGENT_PROMPT, HOTEL_AGENT_PROMPT, PLANNER_AGENT_PROMPT,
+    PLANNER_AGENT_PROMPT_NO_BUDGET, PLAN_FRAGMENT_REPAIR_PROMPT, PLANNER_SKELETON_PROMPT, PLANNER_DAY_PROMPT
+)
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+from pydantic import ValidationError
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+import asyncio
 import json
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+# 检索类 Agent 的名称（按原先的顺序），规划 Agent 需要全部结果
+RESEARCH_STEPS = ["attraction", "weather", "hotel"]
+
+# 解析失败时可以单独重新生成的数组字段（按元素修复）
+REPAIRABLE_LISTS = ("days", "weather_info")
+
+@dataclass
+class ResearchResult:
+    """单个检索 Agent 的结果槽位"""
+    name: str
+    content: str = ""
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    # 检索过程中的工具调用 [(工具名, 参数, 原始结果)]，以及由其压缩得到的规划输入
+    tool_calls: List[Any] = field(default_factory=list)
+    compact_text: Optional[str] = None
+    compacted: bool = False
+    # 来自检索缓存（预取或预热）
+    cached: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_checkpoint(self) -> Dict[str, Any]:
+        """可 JSON 序列化的原始结果（不含压缩结果，恢复后重新压缩）"""
+        return {
+            "name": self.name,
+            "content": self.content,
+            "error": self.error,
+            "elapsed": self.elapsed,
+            "tool_calls": [list(call) for call in self.tool_calls],
+        }
+
+    def as_prompt_text(self) -> str:
+        """供规划 Agent 使用的文本，失败时给出占位说明"""
+        if self.ok:
+            return self.compact_text or self.content
+        return f"（暂无数据: {self.error}，请根据常识合理安排）"
+
+
+def research_queries(request: Any) -> Dict[str, str]:
+    """三个检索 Agent 的查询，只取决于城市、偏好和住宿类型（预取请求同样适用）"""
+    return {
+        "attraction": f"请搜索{request.city}的{request.preferences}景点",
+        "weather": f"请查询{request.city}的天气",
+        "hotel": f"请搜索{request.city}的{request.accommodation}酒店",
+    }
+
+
 class TripPlannerAgent:
     def __init__(self, amap_api_key: str = None, llm_api_key: str = None, llm_model_id: str = None, llm_base_url: str = None):
         settings = get_settings()
@@ -25,26 +95,93 @@ class TripPlannerAgent:
         self.llm = HelloAgentsLLM(**llm_kwargs) if llm_kwargs else HelloAgentsLLM()
         
         # 使用传入的 key 或默认配置
-        effective_amap_key = amap_api_key or settings.amap_api_key
+        self.amap_api_key = amap_api_key or settings.amap_api_key
+        self.mcp_tool = self._create_mcp_tool()
+        # 工具调用返回 MCP 服务不可用的错误后置为 False，由 AgentPool 重建 MCPTool
+        self.mcp_healthy = True
+        # 有检索线程超时仍在后台运行时置为 False，该实例不再复用
+        self.reusable = True
+        # 正在本实例上运行的检索数（合并给其他请求的检索可能比本请求持续更久）
+        self._research_running = 0
+        # 最近一次规划输入压缩的统计
+        self.compaction_stats: Optional[Dict[str, Any]] = None
 
-        self.mcp_tool = MCPTool(
-            name="amap_mcp",
-            server_command=["npx", "-y", "@sugarforever/amap-mcp-server"],
-            env={"AMAP_API_KEY": effective_amap_key}
-        )
-
-        self.attraction_agent = SimpleAgent(name="AttractionSearchAgent", llm=self.llm, system_prompt=ATTRACTION_AGENT_PROMPT)
+        # 经由 Agent.run / stream_run 的 LLM 调用按调用名记录 token 用量
+        self.attraction_agent = SimpleAgent(name="AttractionSearchAgent", llm=UsageRecordingLLM(self.llm, "attraction"),
+                                            system_prompt=ATTRACTION_AGENT_PROMPT)
         self.attraction_agent.add_tool(self.mcp_tool)
 
-        self.weather_agent = SimpleAgent(name="WeatherQueryAgent", llm=self.llm, system_prompt=WEATHER_AGENT_PROMPT)
+        self.weather_agent = SimpleAgent(name="WeatherQueryAgent", llm=UsageRecordingLLM(self.llm, "weather"),
+                                         system_prompt=WEATHER_AGENT_PROMPT)
         self.weather_agent.add_tool(self.mcp_tool)
 
-        self.hotel_agent = SimpleAgent(name="HotelAgent", llm=self.llm, system_prompt=HOTEL_AGENT_PROMPT)
+        self.hotel_agent = SimpleAgent(name="HotelAgent", llm=UsageRecordingLLM(self.llm, "hotel"),
+                                       system_prompt=HOTEL_AGENT_PROMPT)
         self.hotel_agent.add_tool(self.mcp_tool)
         
-        self.planner_agent = SimpleAgent(name="PlannerAgent", llm=self.llm, system_prompt=PLANNER_AGENT_PROMPT)
+        # 预算由代码计算时规划 Agent 不再输出 budget 字段
+        planner_prompt = PLANNER_AGENT_PROMPT_NO_BUDGET if settings.budget_in_code else PLANNER_AGENT_PROMPT
+        self.planner_agent = SimpleAgent(name="PlannerAgent", llm=UsageRecordingLLM(self.llm, "planner"),
+                                         system_prompt=planner_prompt)
 
-    def _build_planner_query(self, request: TripPlanRequest, attraction_response: str, weather_response: str, hotel_response: str) -> str:
+    def _create_mcp_tool(self) -> MCPTool:
+        return CachedMCPTool(
+            name="amap_mcp",
+            server_command=["npx", "-y", "@sugarforever/amap-mcp-server"],
+            env={"AMAP_API_KEY": self.amap_api_key}
+        )
+
+    @property
+    def tool_agents(self) -> List[SimpleAgent]:
+        return [self.attraction_agent, self.weather_agent, self.hotel_agent]
+
+    def reset(self) -> None:
+        """清空各 Agent 的对话历史，复用前必须调用，避免请求之间串数据"""
+        for agent in self.tool_agents + [self.planner_agent]:
+            agent.clear_history()
+
+    def check_health(self) -> bool:
+        """
+        探测 MCP 服务是否可用
+
+        MCPTool.run 出错时返回错误文本而不抛出异常，因此按返回内容判断。
+        创建时没有发现任何工具（检索 Agent 没有可用工具）同样视为不可用。
+        """
+        if not self.mcp_healthy:
+            return False
+        result = self.mcp_tool.run({"action": "list_tools"})
+        if not self.mcp_tool._available_tools or not is_tool_list(result):
+            logger.warning(f"MCP health check failed: {str(result)[:200]}")
+            self.mcp_healthy = False
+        return self.mcp_healthy
+
+    def recycle_mcp(self) -> None:
+        """重新创建 MCPTool（重新发现工具），重新挂到各检索 Agent 上"""
+        self.mcp_tool = self._create_mcp_tool()
+        # 同名工具注册时会覆盖旧实例
+        for agent in self.tool_agents:
+            agent.add_tool(self.mcp_tool)
+        self.mcp_healthy = True
+        logger.info(f"request={get_request_id()} MCP 服务已重建")
+
+    def close(self) -> None:
+        """
+        释放 LLM 客户端的连接池
+
+        MCPTool 没有需要关闭的资源：每次调用都单独启动 npx 子进程，调用结束即退出。
+        """
+        try:
+            self.llm._client.close()
+        except Exception as e:
+            logger.warning(f"Failed to close LLM client: {e}")
+
+    def _build_planner_query(self, request: TripPlanRequest, attraction_response: str, weather_response: str, hotel_response: str,
+                             task: Optional[str] = None) -> str:
+        if task is None:
+            if get_settings().budget_in_code:
+                task = "请生成详细的旅行计划,包括每天的景点安排、餐饮推荐和住宿信息（含门票、餐饮和酒店费用）。"
+            else:
+                task = "请生成详细的旅行计划,包括每天的景点安排、餐饮推荐、住宿信息和预算明细。"
         return f"""
 请根据以下信息生成{request.city}的{request.days}日旅行计划:
 
@@ -66,64 +203,477 @@ class TripPlannerAgent:
 **酒店信息:**
 {hotel_response}
 
-请生成详细的旅行计划,包括每天的景点安排、餐饮推荐、住宿信息和预算明细。
+{task}
 """
 
     def _parse_trip_plan(self, planner_response: str) -> TripPlan:
+        """
+        解析规划结果
+
+        先容错提取 JSON（括号配对、修复尾随逗号和截断）；仍有语法或字段错误且能定位到
+        days / weather_info 中的某一项时，只让规划 Agent 重写这一项并拼回原文，不重新生成整份计划。
+        """
+        text = planner_response
+        attempts = get_settings().plan_repair_attempts
+        for attempt in range(attempts + 1):
+            try:
+                with span("json_parse", "trip_plan"):
+                    return TripPlan.model_validate(extract_json_object(text))
+            except JSONExtractionError as e:
+                logger.error(f"Failed to parse trip plan JSON: {e}")
+                error, base, path = str(e), e.text, e.path
+            except ValidationError as e:
+                logger.error(f"Pydantic validation error: {e}")
+                details = e.errors()
+                error = "; ".join(f"{format_path(tuple(d['loc']))}: {d['msg']}" for d in details[:5])
+                base, path = extract_json_text(text), tuple(details[0]["loc"])
+
+            repaired = self._repair_plan_fragment(base, path, error) if attempt < attempts else None
+            if repaired is None:
+                logger.error(f"Raw planner response: {planner_response}")
+                raise ValueError(f"Could not generate a valid trip plan: {error}")
+            text = repaired
+
+    def _repair_plan_fragment(self, text: str, path: JSONPath, error: str) -> Optional[str]:
+        """让规划 Agent 只重写出错的数组元素，返回拼接后的完整文本；无法定位时返回 None"""
+        if len(path) < 2 or path[0] not in REPAIRABLE_LISTS or not isinstance(path[1], int):
+            return None
+        unit = tuple(path[:2])
+        bounds = value_span(text, unit)
+        if bounds is None:
+            return None
+        start, end = bounds
+        logger.info(f"request={get_request_id()} 规划结果 {format_path(unit)} 有误，单独重新生成该部分")
+        prompt = PLAN_FRAGMENT_REPAIR_PROMPT.format(path=format_path(unit), error=error, fragment=text[start:end])
+        # 不经过 planner_agent.run，避免修复对话进入规划历史
+        messages = [
+            {"role": "system", "content": self.planner_agent.system_prompt},
+            {"role": "user", "content": prompt},
+        ]
+        try:
+            with span("llm", "plan_repair"):
+                response = UsageRecordingLLM(self.llm, "plan_repair").invoke(messages)
+            fragment = extract_json_object(getattr(response, "content", response))
+        except Exception as e:
+            logger.error(f"Failed to repair {format_path(unit)}: {e}")
+            return None
+        return text[:start] + json.dumps(fragment, ensure_ascii=False) + text[end:]
+
+    def _research_tasks(self, request: TripPlanRequest) -> Dict[str, Tuple[SimpleAgent, str]]:
+        """三个检索 Agent 及其查询，彼此之间没有依赖"""
+        agents = {"attraction": self.attraction_agent, "weather": self.weather_agent, "hotel": self.hotel_agent}
+        return {name: (agents[name], query) for name, query in research_queries(request).items()}
+
+    def _research_failed(self, name: str, e: Exception) -> ResearchResult:
+        logger.error(f"{name} agent failed: {e}")
+        return ResearchResult(name=name, error=str(e))
+
+    def _research_succeeded(self, name: str, content: str, calls: List[Any]) -> ResearchResult:
+        # MCPTool 调用失败时只返回错误文本，Agent 照常给出回答，这里从工具调用的原始结果中识别
+        if any(is_mcp_failure(result) for _, _, result in calls):
+            self.mcp_healthy = False
+        return ResearchResult(name=name, content=content, tool_calls=calls)
+
+    @staticmethod
+    def _research_done(result: ResearchResult, started: float) -> ResearchResult:
+        result.elapsed = time.perf_counter() - started
+        logger.info(f"request={get_request_id()} {result.name} 完成: {len(result.content)} 字符, 耗时 {result.elapsed:.1f}s, 错误: {result.error}")
+        return result
+
+    def _run_research_step(self, name: str, agent: SimpleAgent, query: str) -> ResearchResult:
+        """运行单个检索 Agent，异常写入结果槽位而不是向上抛出"""
+        started = time.perf_counter()
+        try:
+            with span("agent", name), record_tool_calls() as calls:
+                content = agent.run(query)
+            result = self._research_succeeded(name, content, calls)
+        except Exception as e:
+            result = self._research_failed(name, e)
+        return self._research_done(result, started)
+
+    async def _arun_research_step(self, name: str, agent: SimpleAgent, query: str) -> ResearchResult:
+        """_run_research_step 的异步版本，等待 LLM 时不占用线程"""
+        started = time.perf_counter()
+        try:
+            with span("agent", name), record_tool_calls() as calls:
+                content = await arun_agent(agent, query, name)
+            result = self._research_succeeded(name, content, calls)
+        except Exception as e:
+            result = self._research_failed(name, e)
+        return self._research_done(result, started)
+
+    def run_research(self, request: TripPlanRequest) -> Dict[str, ResearchResult]:
+        """同步执行检索阶段：并行模式下 fan-out 到线程池，超时的 Agent 记为失败"""
+        settings = get_settings()
+        tasks = self._research_tasks(request)
+
+        if not settings.research_parallel:
+            return {name: self._run_research_step(name, agent, query) for name, (agent, query) in tasks.items()}
+
+        executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="research")
         try:
-            # Clean the response by finding the JSON object
-            start_index = planner_response.find('{')
-            end_index = planner_response.rfind('}') + 1
-            if start_index == -1 or end_index == 0:
-                raise ValueError("No JSON object found in the response")
-            
-            json_str = planner_response[start_index:end_index]
-            plan_dict = json.loads(json_str)
+            futures = {
+                name: executor.submit(self._run_research_step, name, agent, query)
+                for name, (agent, query) in tasks.items()
+            }
+            wait(futures.values(), timeout=settings.research_timeout)
+            results = {}
+            for name, future in futures.items():
+                if future.done():
+                    results[name] = future.result()
+                else:
+                    self.reusable = False
+                    results[name] = ResearchResult(name=name, error="timeout", elapsed=settings.research_timeout)
+            return results
+        finally:
+            # 超时的线程无法中断，不等待其结束
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _research_step(self, name: str, agent: SimpleAgent, query: str) -> ResearchResult:
+        """运行单个检索（带超时），成功的结果写入检索缓存"""
+        settings = get_settings()
+        if uses_async_llm(self.llm):
+            step = self._arun_research_step(name, agent, query)
+        else:
+            step = llm_executor.run(self._run_research_step, name, agent, query)
+        self._research_running += 1
+        try:
+            result = await asyncio.wait_for(step, timeout=settings.research_timeout)
+        except asyncio.TimeoutError:
+            self.reusable = False
+            return ResearchResult(name=name, error="timeout", elapsed=settings.research_timeout)
+        finally:
+            self._research_running -= 1
+        if result.ok:
+            await io_executor.run(store_research, name, query, result.to_checkpoint())
+        return result
+
+    async def iter_research(self, request: TripPlanRequest, skip: Iterable[str] = ()) -> AsyncIterator[ResearchResult]:
+        """
+        异步执行检索阶段，按完成顺序逐个产出结果（供 SSE 使用），skip 中的检索已有结果，不再运行
+
+        先查检索缓存；其他请求（例如预取）正在运行相同的检索时等待它的结果。
+        """
+        settings = get_settings()
+        skip = set(skip)
+        tasks = {name: task for name, task in self._research_tasks(request).items() if name not in skip}
+
+        async def run_one(name: str, agent: SimpleAgent, query: str) -> ResearchResult:
+            cached = await io_executor.run(get_research, name, query)
+            if cached is not None:
+                logger.info(f"request={get_request_id()} 检索缓存命中: {name}")
+                return ResearchResult(**{**cached, "elapsed": 0.0, "cached": True})
+            result = await research_flight.do(
+                research_key(name, query), lambda: self._research_step(name, agent, query)
+            )
+            # 合并的请求各自压缩检索结果，不能共享同一个对象
+            return replace(result, tool_calls=list(result.tool_calls))
+
+        pending = []
+        try:
+            if not settings.research_parallel:
+                for name, (agent, query) in tasks.items():
+                    yield await run_one(name, agent, query)
+                return
+            pending = [asyncio.create_task(run_one(name, agent, query)) for name, (agent, query) in tasks.items()]
+            for next_done in asyncio.as_completed(pending):
+                yield await next_done
+        finally:
+            for task in pending:
+                task.cancel()
+            if self._research_running:
+                # 请求中途退出，本实例上的检索仍在为其他等待者运行，归还后不能借给其他请求
+                self.reusable = False
+
+    async def astream_planner(self, planner_query: str) -> AsyncIterator[str]:
+        """流式运行规划 Agent，按 token 产出文本片段（同步 LLM 流在线程中消费）"""
+        if uses_async_llm(self.llm):
+            async for chunk in astream_agent(self.planner_agent, planner_query, "planner_stream"):
+                yield chunk
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+        end = object()
+
+        def produce() -> None:
             try:
-                return TripPlan.model_validate(plan_dict)
-            except Exception as ve:
-                logger.error(f"Pydantic validation error: {ve}")
-                raise ve
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.error(f"Failed to parse trip plan JSON: {e}")
-            logger.error(f"Raw planner response: {planner_response}")
-            # Fallback or error handling
-            raise ValueError(f"Could not generate a valid trip plan: {str(e)}")
+                for chunk in self.planner_agent.stream_run(planner_query):
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                loop.call_soon_threadsafe(queue.put_nowait, end)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
 
-    def plan_trip(self, request: TripPlanRequest) -> TripPlan:
-        print(f"[AGENT DEBUG] 开始处理旅行计划请求: {request.city}")
-        
-        # Step 1: Attraction Search
-        print("[AGENT DEBUG] 步骤1: 搜索景点")
-        attraction_response = self.attraction_agent.run(
-            f"请搜索{request.city}的{request.preferences}景点"
+        producer = llm_executor.run(produce)
+        try:
+            with span("llm", "planner_stream"):
+                while True:
+                    item = await queue.get()
+                    if item is end:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+        finally:
+            # 消费方提前退出时通知生产线程停止读取剩余 token
+            stopped.set()
+        await producer
+
+    def _check_research(self, results: Dict[str, ResearchResult]) -> None:
+        """全部检索失败时没有规划的依据，直接报错"""
+        if not any(r.ok for r in results.values()):
+            errors = "; ".join(f"{r.name}: {r.error}" for r in results.values())
+            raise ValueError(f"All research agents failed: {errors}")
+
+    def compact_research(self, request: TripPlanRequest, results: Dict[str, ResearchResult]) -> Dict[str, Any]:
+        """把检索结果压缩为结构化记录，返回压缩前后的规划输入字符数（重复调用不会重复压缩）"""
+        settings = get_settings()
+        if self.compaction_stats is not None and all(r.compacted for r in results.values()):
+            return self.compaction_stats
+        before = sum(len(r.content if r.ok else r.as_prompt_text()) for r in results.values())
+        if settings.planner_compaction:
+            compacted = compact_research(
+                {name: r.tool_calls for name, r in results.items() if r.ok},
+                request.days,
+                attractions_per_day=settings.compact_attractions_per_day,
+                max_hotels=settings.compact_max_hotels,
+            )
+            for name, text in compacted.items():
+                results[name].compact_text = text
+        for r in results.values():
+            r.compacted = True
+        after = sum(len(r.as_prompt_text()) for r in results.values())
+        self.compaction_stats = {
+            "before_chars": before,
+            "after_chars": after,
+            "reduction": round(1 - after / before, 3) if before else 0.0,
+        }
+        logger.info(f"request={get_request_id()} 规划输入压缩: {before} -> {after} 字符 ({self.compaction_stats['reduction']:.0%})")
+        return self.compaction_stats
+
+    def build_planner_query(self, request: TripPlanRequest, results: Dict[str, ResearchResult]) -> str:
+        """由检索结果槽位构建规划查询"""
+        self._check_research(results)
+        self.compact_research(request, results)
+        return self._build_planner_query(
+            request,
+            results["attraction"].as_prompt_text(),
+            results["weather"].as_prompt_text(),
+            results["hotel"].as_prompt_text(),
         )
-        print(f"[AGENT DEBUG] 景点搜索完成: {len(attraction_response)} 字符")
 
-        # Step 2: Weather Query
-        print("[AGENT DEBUG] 步骤2: 查询天气")
-        weather_response = self.weather_agent.run(
-            f"请查询{request.city}的天气"
+    def finalize_plan(self, request: TripPlanRequest, trip_plan: TripPlan) -> TripPlan:
+        """
+        解析后的后处理：按坐标优化景点路线，由行程中的门票、餐饮和酒店费用计算预算
+
+        预算只在这里计算：开启 budget_in_code 时覆盖 LLM 给出的预算，计划中没有预算（逐天规划）时总是计算。
+        """
+        settings = get_settings()
+        if settings.route_optimization in ("order", "cluster"):
+            try:
+                optimize_routes(trip_plan, recluster=settings.route_optimization == "cluster")
+            except Exception as e:
+                logger.warning(f"Route optimization failed: {e}")
+        if settings.budget_in_code or trip_plan.budget is None:
+            trip_plan.budget = compute_budget(trip_plan, request.transportation)
+        return trip_plan
+
+    def use_per_day_planning(self, request: TripPlanRequest) -> bool:
+        """长行程先生成骨架再逐天并行生成，避免单次输出过长"""
+        settings = get_settings()
+        if settings.planning_mode == "per_day":
+            return True
+        return settings.planning_mode == "auto" and request.days >= settings.per_day_planning_min_days
+
+    @staticmethod
+    def _planner_messages(system_prompt: str, query: str) -> List[Dict[str, str]]:
+        # 逐天并行生成时不能共享 planner_agent 的对话历史，直接无状态调用 LLM
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": query},
+        ]
+
+    def _invoke_planner(self, system_prompt: str, query: str, call: str) -> str:
+        with span("llm", call):
+            response = UsageRecordingLLM(self.llm, call).invoke(self._planner_messages(system_prompt, query))
+        # hello-agents 0.2.9 的 invoke 返回文本，兼容带 content 属性的响应对象
+        return getattr(response, "content", response)
+
+    async def _ainvoke_planner(self, system_prompt: str, query: str, call: str) -> str:
+        if uses_async_llm(self.llm):
+            return await ainvoke(self.llm, self._planner_messages(system_prompt, query), call)
+        return await llm_executor.run(self._invoke_planner, system_prompt, query, call)
+
+    @staticmethod
+    def _day_date(request: TripPlanRequest, day_index: int) -> str:
+        try:
+            start = datetime.strptime(request.start_date, "%Y-%m-%d")
+        except ValueError:
+            return request.start_date
+        return (start + timedelta(days=day_index)).strftime("%Y-%m-%d")
+
+    def _skeleton_query(self, request: TripPlanRequest, results: Dict[str, ResearchResult]) -> str:
+        self._check_research(results)
+        self.compact_research(request, results)
+        return self._build_planner_query(
+            request,
+            results["attraction"].as_prompt_text(),
+            results["weather"].as_prompt_text(),
+            results["hotel"].as_prompt_text(),
+            task=f"请把景点分配到{request.days}天中，生成行程骨架。",
         )
-        print(f"[AGENT DEBUG] 天气查询完成: {len(weather_response)} 字符")
 
-        # Step 3: Hotel Recommendation
-        print("[AGENT DEBUG] 步骤3: 搜索酒店")
-        hotel_response = self.hotel_agent.run(
-            f"请搜索{request.city}的{request.accommodation}酒店"
+    def plan_skeleton(self, request: TripPlanRequest, results: Dict[str, ResearchResult]) -> Dict[str, Any]:
+        """骨架调用：只把景点分配到每一天，并给出天气、总体建议和搜索关键词"""
+        response = self._invoke_planner(PLANNER_SKELETON_PROMPT, self._skeleton_query(request, results), "planner_skeleton")
+        return self._parse_skeleton(request, response)
+
+    async def aplan_skeleton(self, request: TripPlanRequest, results: Dict[str, ResearchResult]) -> Dict[str, Any]:
+        query = self._skeleton_query(request, results)
+        response = await self._ainvoke_planner(PLANNER_SKELETON_PROMPT, query, "planner_skeleton")
+        return self._parse_skeleton(request, response)
+
+    def _parse_skeleton(self, request: TripPlanRequest, response: str) -> Dict[str, Any]:
+        skeleton = extract_json_object(response)
+        outlines = {}
+        for outline in skeleton.get("days", []):
+            if isinstance(outline, dict) and isinstance(outline.get("day_index"), int):
+                outlines.setdefault(outline["day_index"], outline)
+        # 骨架的天数与请求不一致时以请求为准
+        skeleton["days"] = [
+            outlines.get(i, {"day_index": i, "theme": "", "attractions": [], "hotel": ""})
+            for i in range(request.days)
+        ]
+        logger.info(f"request={get_request_id()} 行程骨架生成完成: {request.days} 天")
+        return skeleton
+
+    def _day_query(self, request: TripPlanRequest, results: Dict[str, ResearchResult],
+                   skeleton: Dict[str, Any], day_index: int) -> str:
+        outline = skeleton["days"][day_index]
+        date = self._day_date(request, day_index)
+        attractions = "、".join(str(name) for name in outline.get("attractions", [])) or "自由安排"
+        return f"""
+请生成{request.city}第{day_index + 1}天（{date}，day_index 为 {day_index}）的详细行程:
+
+**用户需求:**
+- 偏好: {request.preferences}
+- 预算: {request.budget}
+- 交通方式: {request.transportation}
+- 住宿类型: {request.accommodation}
+
+**当日安排:**
+- 主题: {outline.get("theme") or "无"}
+- 景点: {attractions}
+- 酒店: {outline.get("hotel") or "从酒店信息中选择"}
+
+**景点信息:**
+{results["attraction"].as_prompt_text()}
+
+**酒店信息:**
+{results["hotel"].as_prompt_text()}
+"""
+
+    def plan_day(self, request: TripPlanRequest, results: Dict[str, ResearchResult],
+                 skeleton: Dict[str, Any], day_index: int) -> DayPlan:
+        """按骨架生成某一天的详细行程，失败时退回只含景点名称的当日安排"""
+        try:
+            query = self._day_query(request, results, skeleton, day_index)
+            return self._parse_day(request, day_index, self._invoke_planner(PLANNER_DAY_PROMPT, query, "planner_day"))
+        except Exception as e:
+            logger.error(f"Failed to plan day {day_index}: {e}")
+            return self._outline_day(request, skeleton, day_index)
+
+    async def aplan_day(self, request: TripPlanRequest, results: Dict[str, ResearchResult],
+                        skeleton: Dict[str, Any], day_index: int) -> DayPlan:
+        try:
+            query = self._day_query(request, results, skeleton, day_index)
+            response = await self._ainvoke_planner(PLANNER_DAY_PROMPT, query, "planner_day")
+            return self._parse_day(request, day_index, response)
+        except Exception as e:
+            logger.error(f"Failed to plan day {day_index}: {e}")
+            return self._outline_day(request, skeleton, day_index)
+
+    def _parse_day(self, request: TripPlanRequest, day_index: int, response: str) -> DayPlan:
+        day = extract_json_object(response)
+        day.update(date=self._day_date(request, day_index), day_index=day_index)
+        return DayPlan.model_validate(day)
+
+    def _outline_day(self, request: TripPlanRequest, skeleton: Dict[str, Any], day_index: int) -> DayPlan:
+        outline = skeleton["days"][day_index]
+        return DayPlan(
+            date=self._day_date(request, day_index),
+            day_index=day_index,
+            description=outline.get("theme") or "今日行程安排",
+            attractions=[{"name": str(name)} for name in outline.get("attractions", [])],
         )
-        print(f"[AGENT DEBUG] 酒店搜索完成: {len(hotel_response)} 字符")
 
-        # Step 4: Consolidate and Generate Plan
-        print("[AGENT DEBUG] 步骤4: 生成旅行计划")
-        planner_query = self._build_planner_query(
-            request, attraction_response, weather_response, hotel_response
+    def assemble_plan(self, request: TripPlanRequest, skeleton: Dict[str, Any], days: List[DayPlan]) -> TripPlan:
+        """由骨架和逐天结果组装完整计划，预算由代码汇总"""
+        weather_info = []
+        for item in skeleton.get("weather_info", []):
+            try:
+                weather_info.append(WeatherInfo.model_validate(item))
+            except ValidationError as e:
+                logger.warning(f"Skipping invalid weather info: {e}")
+        trip_plan = TripPlan(
+            city=request.city,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            days=sorted(days, key=lambda day: day.day_index),
+            weather_info=weather_info,
+            overall_suggestions=skeleton.get("overall_suggestions") or "祝您旅途愉快！",
+            search_keywords=[str(k) for k in skeleton.get("search_keywords", [])],
         )
-        planner_response = self.planner_agent.run(planner_query)
-        print(f"[AGENT DEBUG] 计划生成完成: {len(planner_response)} 字符")
+        return self.finalize_plan(request, trip_plan)
+
+    def plan_per_day(self, request: TripPlanRequest, results: Dict[str, ResearchResult]) -> TripPlan:
+        skeleton = self.plan_skeleton(request, results)
+        workers = max(1, min(get_settings().per_day_planning_concurrency, request.days))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plan-day") as executor:
+            days = list(executor.map(lambda i: self.plan_day(request, results, skeleton, i), range(request.days)))
+        return self.assemble_plan(request, skeleton, days)
+
+    async def iter_day_plans(self, request: TripPlanRequest, results: Dict[str, ResearchResult],
+                             skeleton: Dict[str, Any], skip: Iterable[int] = ()) -> AsyncIterator[DayPlan]:
+        """并行生成每一天，按完成顺序产出（供 SSE 使用），skip 中的天已生成，不再运行"""
+        semaphore = asyncio.Semaphore(max(1, get_settings().per_day_planning_concurrency))
+
+        async def run_one(day_index: int) -> DayPlan:
+            async with semaphore:
+                return await self.aplan_day(request, results, skeleton, day_index)
+
+        skip = set(skip)
+        pending = [asyncio.create_task(run_one(i)) for i in range(request.days) if i not in skip]
+        try:
+            for next_done in asyncio.as_completed(pending):
+                yield await next_done
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def plan_trip(self, request: TripPlanRequest) -> TripPlan:
+        logger.info(f"request={get_request_id()} 开始处理旅行计划请求: {request.city}")
+        
+        # Step 1-3: Attraction / Weather / Hotel (fan-out)
+        logger.info(f"request={get_request_id()} 步骤1-3: 搜索景点、查询天气、搜索酒店")
+        research = self.run_research(request)
+
+        # Step 4: Consolidate and Generate Plan (fan-in)
+        logger.info(f"request={get_request_id()} 步骤4: 生成旅行计划")
+        if self.use_per_day_planning(request):
+            trip_plan = self.plan_per_day(request, research)
+            logger.info(f"request={get_request_id()} 旅行计划处理完成（逐天并行生成）")
+            return trip_plan
+        planner_query = self.build_planner_query(request, research)
+        with span("agent", "planner"):
+            planner_response = self.planner_agent.run(planner_query)
+        logger.info(f"request={get_request_id()} 计划生成完成: {len(planner_response)} 字符")
 
         # Step 5: Parse JSON and validate with Pydantic
-        print("[AGENT DEBUG] 步骤5: 解析JSON")
-        trip_plan = self._parse_trip_plan(planner_response)
-        print("[AGENT DEBUG] 旅行计划处理完成")
+        logger.info(f"request={get_request_id()} 步骤5: 解析JSON")
+        trip_plan = self.finalize_plan(request, self._parse_trip_plan(planner_response))
+        logger.info(f"request={get_request_id()} 旅行计划处理完成")
         return trip_plan
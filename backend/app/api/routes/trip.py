@@ -1,120 +1,209 @@
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from app.models.schemas import TripPlanRequest, TripPlan
-from app.agents.trip_planner_agent import TripPlannerAgent
-from app.services.unsplash_service import UnsplashService
+from app.models.schemas import TripPlanRequest, TripPlan, TripPrefetchRequest
+from app.agents.agent_pool import AgentPoolExhausted, agent_pool
+from app.agents.tool_cache import tool_cache
+from app.agents.research_cache import research_cache_stats
+from app.services import plan_cache
+from app.services.cache import normalize_key
+from app.services.single_flight import SingleFlight, StreamFlight
+from app.services.trip_pipeline import plan_events, prefetch_research
+from app.services.jobs import JobQueueFull, job_queue
+from app.services.executors import ExecutorSaturated, executor_stats, io_executor, llm_executor
+from app.services.metrics import get_request_id
 from app.config import get_settings, get_effective_keys
 import json
 import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 并发的相同请求共享同一次计算
+plan_flight = SingleFlight()
+plan_stream_flight = StreamFlight()
+prefetch_flight = SingleFlight()
+# 后台运行中的预取任务（保持引用，避免被回收）
+_prefetch_tasks = set()
+
+
+def _keys_digest(api_keys) -> str:
+    effective_keys = get_effective_keys(api_keys)
+    return hashlib.sha256(json.dumps(effective_keys, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _flight_key(request: TripPlanRequest) -> str:
+    """相同的行程参数、日期和实际使用的 API Key 才合并"""
+    return "|".join([
+        plan_cache.plan_cache_key(request),
+        request.start_date,
+        request.end_date,
+        str(request.use_cache),
+        _keys_digest(request.api_keys),
+    ])
+
+
+async def _generate_plan(request: TripPlanRequest) -> TripPlan:
+    # 与流式接口走同一条流水线，阻塞调用分别在各自的线程池中执行，不长期占用一个线程
+    result = None
+    async for event in plan_events(request):
+        result = event
+    return TripPlan.model_validate(result["data"])
+
+
+def _busy(e: Exception) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+
+
+def _check_admission(joining: bool = False) -> None:
+    """
+    LLM 线程池排队已满时直接拒绝新的规划请求，而不是让它们排在后面超时
+
+    joining 为 True 时请求会合并到正在进行的相同请求上，不增加负载，不做准入检查。
+    """
+    if not joining and llm_executor.saturated():
+        raise _busy(ExecutorSaturated(llm_executor.name, llm_executor.max_queue))
+
+
+def _sse(event: dict, request_id: Optional[str]) -> str:
+    """SSE 事件附带请求 ID，便于和服务端日志对应"""
+    return f"data: {json.dumps({**event, 'request_id': request_id}, ensure_ascii=False)}\n\n"
+
+
 @router.post("/plan", response_model=TripPlan)
 async def create_trip_plan(request: TripPlanRequest) -> TripPlan:
-    print(f"[DEBUG] 收到旅行计划请求: {request.city}")
+    logger.info(f"request={get_request_id()} 收到旅行计划请求: {request.city}")
+    key = _flight_key(request)
+    _check_admission(joining=plan_flight.in_flight(key))
     try:
-        effective_keys = get_effective_keys(request.api_keys)
-        agent = TripPlannerAgent(
-            amap_api_key=effective_keys["amap_api_key"],
-            llm_api_key=effective_keys["llm_api_key"],
-            llm_model_id=effective_keys["llm_model_id"],
-            llm_base_url=effective_keys["llm_base_url"]
-        )
-        unsplash_service = UnsplashService(effective_keys["unsplash_access_key"])
-        
-        trip_plan = await asyncio.to_thread(agent.plan_trip, request)
-
-        for day in trip_plan.days:
-            for attraction in day.attractions:
-                if not attraction.image_urls:
-                    attraction.image_urls = unsplash_service.get_photo_urls(
-                        f"{attraction.name} {trip_plan.city}", count=5
-                    )
-        
-        return trip_plan
+        return await plan_flight.do(key, lambda: _generate_plan(request))
+    except (ExecutorSaturated, AgentPoolExhausted) as e:
+        raise _busy(e)
     except Exception as e:
-        print(f"[DEBUG] 发生错误: {str(e)}")
+        logger.error(f"request={get_request_id()} 发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _run_prefetch(key: str, request: TripPrefetchRequest) -> None:
+    try:
+        await prefetch_flight.do(key, lambda: prefetch_research(request))
+    except Exception as e:
+        logger.warning(f"request={get_request_id()} 检索预取失败: {request.city} {e}")
+
+@router.post("/prefetch", status_code=202)
+async def prefetch_trip_research(request: TripPrefetchRequest):
+    """填写表单时预取景点、天气（和酒店）检索，立即返回；随后的规划请求复用缓存或进行中的检索"""
+    if not get_settings().prefetch_enabled:
+        return {"status": "disabled"}
+    key = "|".join([
+        normalize_key(request.city),
+        normalize_key(request.preferences),
+        normalize_key(request.accommodation or ""),
+        _keys_digest(request.api_keys),
+    ])
+    if prefetch_flight.in_flight(key):
+        return {"status": "accepted", "city": request.city}
+    # 预取优先级最低：正式规划请求排队时不再增加负载
+    _check_admission()
+    if prefetch_flight.stats()["in_flight"] >= get_settings().prefetch_max_inflight:
+        raise _busy(RuntimeError("预取任务过多，请稍后再试"))
+    task = asyncio.create_task(_run_prefetch(key, request))
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
+    return {"status": "accepted", "city": request.city}
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """行程缓存、检索缓存、MCP 工具缓存、Agent 池和线程池的统计信息"""
+    return {
+        "plan": await io_executor.run(plan_cache.get_plan_cache().stats),
+        "research": await io_executor.run(research_cache_stats),
+        "tools": tool_cache.stats(),
+        "agent_pool": agent_pool.stats(),
+        "single_flight": {
+            "plan": plan_flight.stats(),
+            "plan_stream": plan_stream_flight.stats(),
+            "prefetch": prefetch_flight.stats(),
+        },
+        "executors": executor_stats(),
+    }
+
 @router.post("/plan/stream")
 async def create_trip_plan_stream(request: TripPlanRequest):
-    """流式返回旅行计划生成进度"""
+    """流式返回旅行计划生成进度，相同请求的订阅者收到同一组事件"""
+    key = _flight_key(request)
+    _check_admission(joining=plan_stream_flight.in_flight(key))
+    # 合并的请求共享首个请求的事件，事件中的 request_id 也是首个请求的
+    request_id = get_request_id()
+
     async def event_generator():
         try:
-            effective_keys = get_effective_keys(request.api_keys)
-            agent = TripPlannerAgent(
-                amap_api_key=effective_keys["amap_api_key"],
-                llm_api_key=effective_keys["llm_api_key"],
-                llm_model_id=effective_keys["llm_model_id"],
-                llm_base_url=effective_keys["llm_base_url"]
-            )
-            unsplash_service = UnsplashService(effective_keys["unsplash_access_key"])
-            
-            # 定义步骤
-            steps = [
-                {"step": 1, "status": "🔍 正在搜索景点...", "progress": 15},
-                {"step": 2, "status": "🌤️ 正在查询天气...", "progress": 35},
-                {"step": 3, "status": "🏨 正在搜索酒店...", "progress": 55},
-                {"step": 4, "status": "📋 正在生成行程计划...", "progress": 75},
-                {"step": 5, "status": "🖼️ 正在获取图片...", "progress": 90},
-            ]
-            
-            # 步骤1: 搜索景点
-            yield f"data: {json.dumps(steps[0], ensure_ascii=False)}\n\n"
-            await asyncio.sleep(0)  # 让出控制权确保数据发送
-            attraction_response = await asyncio.to_thread(
-                agent.attraction_agent.run,
-                f"请搜索{request.city}的{request.preferences}景点"
-            )
-            
-            # 步骤2: 查询天气
-            yield f"data: {json.dumps(steps[1], ensure_ascii=False)}\n\n"
-            await asyncio.sleep(0)
-            weather_response = await asyncio.to_thread(
-                agent.weather_agent.run,
-                f"请查询{request.city}的天气"
-            )
-            
-            # 步骤3: 搜索酒店
-            yield f"data: {json.dumps(steps[2], ensure_ascii=False)}\n\n"
-            await asyncio.sleep(0)
-            hotel_response = await asyncio.to_thread(
-                agent.hotel_agent.run,
-                f"请搜索{request.city}的{request.accommodation}酒店"
-            )
-            
-            # 步骤4: 生成计划
-            yield f"data: {json.dumps(steps[3], ensure_ascii=False)}\n\n"
-            await asyncio.sleep(0)
-            planner_query = agent._build_planner_query(
-                request, attraction_response, weather_response, hotel_response
-            )
-            planner_response = await asyncio.to_thread(
-                agent.planner_agent.run,
-                planner_query
-            )
-            trip_plan = agent._parse_trip_plan(planner_response)
-            
-            # 步骤5: 获取图片
-            yield f"data: {json.dumps(steps[4], ensure_ascii=False)}\n\n"
-            await asyncio.sleep(0)
-            for day in trip_plan.days:
-                for attraction in day.attractions:
-                    if not attraction.image_urls:
-                        attraction.image_urls = unsplash_service.get_photo_urls(
-                            f"{attraction.name} {trip_plan.city}", count=5
-                        )
-            
-            # 完成
-            result = {"step": 6, "status": "✅ 完成！", "progress": 100, "data": trip_plan.model_dump()}
-            yield f"data: {json.dumps(result, ensure_ascii=False)}\n\n"
-            
+            async for event in plan_events(request):
+                yield _sse(event, request_id)
         except Exception as e:
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"request={request_id} 流式规划失败: {e}")
             error = {"error": str(e), "status": "❌ 发生错误"}
-            yield f"data: {json.dumps(error, ensure_ascii=False)}\n\n"
+            yield _sse(error, request_id)
     
+    return StreamingResponse(
+        plan_stream_flight.subscribe(key, event_generator),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
+    )
+
+
+def _job_or_404(job):
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job
+
+@router.post("/jobs", status_code=202)
+async def submit_trip_job(request: TripPlanRequest):
+    """提交后台规划任务，立即返回任务 ID；队列已满时返回 429"""
+    logger.info(f"request={get_request_id()} 收到旅行计划任务: {request.city}")
+    try:
+        job = await job_queue.submit(request)
+    except JobQueueFull as e:
+        raise _busy(e)
+    return job.summary()
+
+@router.get("/jobs/stats")
+async def get_job_stats():
+    return job_queue.stats()
+
+@router.get("/jobs/{job_id}")
+async def get_trip_job(job_id: str):
+    """任务状态，完成后 data 为完整行程"""
+    return _job_or_404(await job_queue.get(job_id)).summary()
+
+@router.post("/jobs/{job_id}/retry", status_code=202)
+async def retry_trip_job(job_id: str):
+    """重试失败的任务，从最后完成的步骤继续；自带 API Key 的任务在服务重启后无法重试，返回 409"""
+    try:
+        job = await job_queue.retry(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except JobQueueFull as e:
+        raise _busy(e)
+    return job.summary()
+
+@router.get("/jobs/{job_id}/events")
+async def stream_trip_job(job_id: str, http_request: Request, last_event_id: Optional[int] = None):
+    """任务进度 SSE，断线重连时按 Last-Event-ID 请求头（或 last_event_id 参数）补发之后的事件"""
+    _job_or_404(await job_queue.get(job_id))
+    header = http_request.headers.get("Last-Event-ID", "")
+    if last_event_id is None:
+        last_event_id = int(header) if header.strip().isdigit() else -1
+
+    async def event_generator():
+        async for event_id, event in job_queue.events(job_id, last_event_id):
+            # 任务 ID 同时作为请求 ID（与 worker 中的日志和耗时统计对应）
+            yield f"id: {event_id}\n{_sse({**event, 'job_id': job_id}, job_id)}"
+
     return StreamingResponse(
         event_generator(),
         media_type="text/event-stream",
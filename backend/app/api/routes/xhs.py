@@ -1,9 +1,14 @@
 from fastapi import APIRouter, HTTPException, Query
 from app.models.schemas import XHSResponse, XHSNote
 from app.services.xhs_service import get_xhs_notes, check_rsshub_health
+from app.services.cache import normalize_key
+from app.services.single_flight import SingleFlight
 
 router = APIRouter()
 
+# 同一关键词的并发预览请求共享一次 RSSHub 抓取
+preview_flight = SingleFlight()
+
 
 @router.get("/health")
 async def rsshub_health_check():
@@ -24,7 +29,7 @@ async def get_xhs_previews(keyword: str = Query(..., description="搜索关键
     """
     try:
         # 调用小红书服务获取笔记数据
-        result = await get_xhs_notes(keyword)
+        result = await preview_flight.do(normalize_key(keyword), lambda: get_xhs_notes(keyword))
         
         # 将字典数据转换为 XHSNote 对象
         notes = [XHSNote(**note) for note in result.get("data", [])]
@@ -32,7 +37,8 @@ async def get_xhs_previews(keyword: str = Query(..., description="搜索关键
         return XHSResponse(
             status=result.get("status", "fallback"),
             data=notes,
-            search_url=result.get("search_url", f"https://www.xiaohongshu.com/search_result?keyword={keyword}")
+            search_url=result.get("search_url", f"https://www.xiaohongshu.com/search_result?keyword={keyword}"),
+            updated_at=result.get("updated_at")
         )
             
     except Exception as e:
@@ -6,18 +6,117 @@ from typing import Optional
 load_dotenv()
 
 class Settings(BaseSettings):
+    # 应用日志级别（日志中带请求 ID，与 /metrics 和 SSE 事件对应）
+    log_level: str = os.getenv("LOG_LEVEL", "INFO").upper()
+
     llm_model_id: str = os.getenv("LLM_MODEL_ID", "")
     llm_api_key: str = os.getenv("LLM_API_KEY", "")
     llm_base_url: str = os.getenv("LLM_BASE_URL", "")
     llm_timeout: int = int(os.getenv("LLM_TIMEOUT", "120"))
+    # 异步 LLM 调用（OpenAI 兼容接口）：共享连接池大小、空闲长连接数、每个 API Key 的最大并发请求数
+    llm_async: bool = os.getenv("LLM_ASYNC", "true").lower() == "true"
+    llm_http_max_connections: int = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "200"))
+    llm_http_max_keepalive: int = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "50"))
+    llm_max_connections_per_key: int = int(os.getenv("LLM_MAX_CONNECTIONS_PER_KEY", "64"))
     
     amap_api_key: str = os.getenv("AMAP_API_KEY", "")
     unsplash_access_key: str = os.getenv("UNSPLASH_ACCESS_KEY", "")
+    # 图片批量获取时的最大并发数（翻译 + 搜索）
+    unsplash_concurrency: int = int(os.getenv("UNSPLASH_CONCURRENCY", "4"))
+
+    # 本地缓存目录（SQLite 数据库等）
+    cache_dir: str = os.getenv("CACHE_DIR", "data")
+    # 景点名称翻译缓存
+    translation_cache_ttl: float = float(os.getenv("TRANSLATION_CACHE_TTL", str(30 * 24 * 3600)))
+    translation_cache_max_entries: int = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "20000"))
+    translation_batch: bool = os.getenv("TRANSLATION_BATCH", "true").lower() == "true"
+    # Unsplash 搜索结果缓存（空结果使用较短的负缓存有效期）
+    unsplash_cache_ttl: float = float(os.getenv("UNSPLASH_CACHE_TTL", str(7 * 24 * 3600)))
+    unsplash_negative_cache_ttl: float = float(os.getenv("UNSPLASH_NEGATIVE_CACHE_TTL", str(24 * 3600)))
+    unsplash_cache_max_entries: int = int(os.getenv("UNSPLASH_CACHE_MAX_ENTRIES", "5000"))
+    # 启动时预热的热门城市（逗号分隔）
+    unsplash_preload_cities: str = os.getenv("UNSPLASH_PRELOAD_CITIES", "")
+    # 完整行程缓存（天气预报会过时，有效期不宜过长）
+    plan_cache_enabled: bool = os.getenv("PLAN_CACHE_ENABLED", "true").lower() == "true"
+    plan_cache_ttl: float = float(os.getenv("PLAN_CACHE_TTL", str(6 * 3600)))
+    plan_cache_max_entries: int = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "500"))
+    # MCP 工具结果缓存（进程内，按工具区分有效期）
+    mcp_cache_enabled: bool = os.getenv("MCP_CACHE_ENABLED", "true").lower() == "true"
+    mcp_cache_weather_ttl: float = float(os.getenv("MCP_CACHE_WEATHER_TTL", str(30 * 60)))
+    mcp_cache_poi_ttl: float = float(os.getenv("MCP_CACHE_POI_TTL", str(24 * 3600)))
+    mcp_cache_max_bytes: int = int(os.getenv("MCP_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    # 检索 Agent 结果缓存（持久化，预取和缓存预热写入，规划时直接复用）
+    research_cache_enabled: bool = os.getenv("RESEARCH_CACHE_ENABLED", "true").lower() == "true"
+    research_cache_ttl: float = float(os.getenv("RESEARCH_CACHE_TTL", str(24 * 3600)))
+    research_cache_weather_ttl: float = float(os.getenv("RESEARCH_CACHE_WEATHER_TTL", str(30 * 60)))
+    research_cache_max_entries: int = int(os.getenv("RESEARCH_CACHE_MAX_ENTRIES", "2000"))
+    # 前端选择城市后的检索预取，同时进行的预取数上限
+    prefetch_enabled: bool = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+    prefetch_max_inflight: int = int(os.getenv("PREFETCH_MAX_INFLIGHT", "20"))
     
     # 小红书集成配置
     xhs_rsshub_base_url: str = os.getenv("XHS_RSSHUB_BASE_URL", "http://localhost:1200")
     xhs_rsshub_fallback_url: str = os.getenv("XHS_RSSHUB_FALLBACK_URL", "https://rsshub.pseudoyu.com")
     xhs_cookie: Optional[str] = os.getenv("XHS_COOKIE", None)
+    # 博主 RSS 并发抓取配置
+    xhs_fetch_concurrency: int = int(os.getenv("XHS_FETCH_CONCURRENCY", "4"))
+    xhs_host_min_interval: float = float(os.getenv("XHS_HOST_MIN_INTERVAL", "0.2"))
+    xhs_fetch_timeout: float = float(os.getenv("XHS_FETCH_TIMEOUT", "15"))
+    xhs_fetch_deadline: float = float(os.getenv("XHS_FETCH_DEADLINE", "20"))
+    # RSSHub 实例路由与熔断配置
+    xhs_router_window: int = int(os.getenv("XHS_ROUTER_WINDOW", "20"))
+    xhs_router_error_threshold: float = float(os.getenv("XHS_ROUTER_ERROR_THRESHOLD", "0.5"))
+    xhs_router_min_requests: int = int(os.getenv("XHS_ROUTER_MIN_REQUESTS", "5"))
+    xhs_router_open_seconds: float = float(os.getenv("XHS_ROUTER_OPEN_SECONDS", "60"))
+    xhs_hedge_delay: float = float(os.getenv("XHS_HEDGE_DELAY", "0"))
+    xhs_health_interval: float = float(os.getenv("XHS_HEALTH_INTERVAL", "30"))
+    # 博主笔记后台刷新配置（启用后预览接口只读取本地存储）
+    xhs_refresh_enabled: bool = os.getenv("XHS_REFRESH_ENABLED", "true").lower() == "true"
+    xhs_refresh_interval: float = float(os.getenv("XHS_REFRESH_INTERVAL", "1800"))
+    xhs_refresh_jitter: float = float(os.getenv("XHS_REFRESH_JITTER", "0.2"))
+    xhs_feed_persist: bool = os.getenv("XHS_FEED_PERSIST", "true").lower() == "true"
+    xhs_feed_max_notes_per_blogger: int = int(os.getenv("XHS_FEED_MAX_NOTES_PER_BLOGGER", "200"))
+
+    # 检索阶段（景点/天气/酒店 Agent）配置
+    research_parallel: bool = os.getenv("RESEARCH_PARALLEL", "true").lower() == "true"
+    research_timeout: float = float(os.getenv("RESEARCH_TIMEOUT", "90"))
+    # 规划结果解析失败时，单独重新生成出错部分的最大次数（0 表示不修复）
+    plan_repair_attempts: int = int(os.getenv("PLAN_REPAIR_ATTEMPTS", "1"))
+    # 规划输入压缩：把检索结果解析为结构化记录，景点数量按天数封顶
+    planner_compaction: bool = os.getenv("PLANNER_COMPACTION", "true").lower() == "true"
+    compact_attractions_per_day: int = int(os.getenv("COMPACT_ATTRACTIONS_PER_DAY", "4"))
+    compact_max_hotels: int = int(os.getenv("COMPACT_MAX_HOTELS", "5"))
+    # 景点路线优化：off 不处理；order 按酒店位置重排每天的游览顺序；cluster 先按距离重新分天再排序
+    route_optimization: str = os.getenv("ROUTE_OPTIMIZATION", "order").lower()
+    # 预算由代码根据门票、餐饮和酒店费用计算（规划 Agent 不再输出 budget 字段）
+    budget_in_code: bool = os.getenv("BUDGET_IN_CODE", "true").lower() == "true"
+    # 规划模式：single 一次生成整份计划；per_day 先生成骨架再逐天并行生成；auto 按天数自动选择
+    planning_mode: str = os.getenv("PLANNING_MODE", "auto").lower()
+    per_day_planning_min_days: int = int(os.getenv("PER_DAY_PLANNING_MIN_DAYS", "5"))
+    per_day_planning_concurrency: int = int(os.getenv("PER_DAY_PLANNING_CONCURRENCY", "4"))
+
+    # TripPlannerAgent 复用池配置
+    agent_pool_size: int = int(os.getenv("AGENT_POOL_SIZE", "4"))
+    agent_pool_idle_ttl: float = float(os.getenv("AGENT_POOL_IDLE_TTL", "600"))
+    agent_pool_health_interval: float = float(os.getenv("AGENT_POOL_HEALTH_INTERVAL", "60"))
+    agent_pool_max_total: int = int(os.getenv("AGENT_POOL_MAX_TOTAL", "16"))
+    agent_pool_reap_interval: float = float(os.getenv("AGENT_POOL_REAP_INTERVAL", "60"))
+
+    # 阻塞调用的专用线程池（线程数 / 最大排队数，排队满时返回 429）
+    llm_executor_workers: int = int(os.getenv("LLM_EXECUTOR_WORKERS", "32"))
+    llm_executor_queue: int = int(os.getenv("LLM_EXECUTOR_QUEUE", "64"))
+    mcp_executor_workers: int = int(os.getenv("MCP_EXECUTOR_WORKERS", "16"))
+    mcp_executor_queue: int = int(os.getenv("MCP_EXECUTOR_QUEUE", "64"))
+    image_executor_workers: int = int(os.getenv("IMAGE_EXECUTOR_WORKERS", "8"))
+    image_executor_queue: int = int(os.getenv("IMAGE_EXECUTOR_QUEUE", "256"))
+    io_executor_workers: int = int(os.getenv("IO_EXECUTOR_WORKERS", "8"))
+    io_executor_queue: int = int(os.getenv("IO_EXECUTOR_QUEUE", "256"))
+
+    # 后台规划任务：队列长度（满时拒绝提交）、worker 数、任务记录保留时间和最大条数
+    job_queue_size: int = int(os.getenv("JOB_QUEUE_SIZE", "50"))
+    job_workers: int = int(os.getenv("JOB_WORKERS", "4"))
+    job_ttl: float = float(os.getenv("JOB_TTL", str(24 * 3600)))
+    job_max_entries: int = int(os.getenv("JOB_MAX_ENTRIES", "1000"))
 
     class Config:
         env_file = ".env"
@@ -1,11 +1,60 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.api.routes import trip, xhs
+from app.agents.agent_pool import agent_pool
+from app.services import unsplash_service, xhs_service
+from app.services.jobs import job_queue
+from app.services.executors import shutdown_executors
+from app.services.llm_client import close_llm_client
+from app.config import get_settings
+from app.services.metrics import (
+    get_request_id, http_request_duration, new_request_id, render_metrics, reset_request_id, set_request_id,
+)
+
+logging.basicConfig(level=get_settings().log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_settings()
+    xhs_service.get_rsshub_client()
+    xhs_service.start_health_monitor()
+    preload_cities = [c.strip() for c in settings.unsplash_preload_cities.split(",") if c.strip()]
+    if preload_cities and settings.unsplash_access_key:
+        # 后台预热热门城市的图片缓存，不阻塞启动
+        try:
+            service = unsplash_service.UnsplashService(settings.unsplash_access_key)
+            app.state.preload_task = asyncio.create_task(service.preload_cities(preload_cities))
+        except Exception as e:
+            logger.warning(f"request={get_request_id()} 图片缓存预热失败: {e}")
+    if settings.xhs_refresh_enabled:
+        xhs_service.start_feed_refresher()
+    agent_pool.start_reaper()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await agent_pool.stop_reaper()
+    await xhs_service.stop_feed_refresher()
+    await xhs_service.stop_health_monitor()
+    await xhs_service.close_rsshub_client()
+    # 释放池中 Agent 的 LLM 客户端
+    agent_pool.close()
+    await unsplash_service.close_async_client()
+    await close_llm_client()
+    shutdown_executors()
+
 
 app = FastAPI(
     title="Smart Trip Planner API",
     description="An API for generating personalized travel plans using AI Agents.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS (Cross-Origin Resource Sharing)
@@ -15,11 +64,54 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
+
+def _route_template(request: Request) -> str:
+    """请求匹配到的路由模板（如 /api/xhs/{city}），避免按具体路径产生过多标签"""
+    route = request.scope.get("route")
+    if route is None:
+        return "unmatched"
+    # 较新的 FastAPI 不再复制 include 的路由，匹配到的是子路由中的原始路由，path 不含前缀
+    return _ROUTE_PREFIXES.get(id(route), "") + route.path
+
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    # 请求 ID 沿用调用方传入的 X-Request-ID，日志和 SSE 事件中据此关联
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = set_request_id(request_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        http_request_duration.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=_route_template(request),
+            status=status,
+        )
+        reset_request_id(token)
+
+
 app.include_router(trip.router, prefix="/api/trip", tags=["Trip Planning"])
 app.include_router(xhs.router, prefix="/api/xhs", tags=["XiaoHongShu"])
+_ROUTE_PREFIXES = {
+    id(route): prefix
+    for router, prefix in ((trip.router, "/api/trip"), (xhs.router, "/api/xhs"))
+    for route in router.routes
+}
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Smart Trip Planner API"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -128,6 +128,14 @@ class TripPlanRequest(BaseModel):
     transportation: str
     accommodation: str
     api_keys: Optional[ApiKeys] = None
+    use_cache: bool = True  # 为 False 时跳过行程缓存重新生成（结果仍会写入缓存）
+
+class TripPrefetchRequest(BaseModel):
+    """填写表单时的检索预取，只需要检索查询用到的字段"""
+    city: str
+    preferences: str = ""
+    accommodation: Optional[str] = None  # 为空时不预取酒店检索
+    api_keys: Optional[ApiKeys] = None
 
 # 小红书相关模型
 class XHSNote(BaseModel):
@@ -146,3 +154,4 @@ class XHSResponse(BaseModel):
     status: str = Field(..., description="响应状态：success/fallback")
     data: List[XHSNote] = Field(default_factory=list, description="笔记数据列表")
     search_url: str = Field(..., description="搜索页面URL")
+    updated_at: Optional[str] = Field(default=None, description="笔记数据更新时间")
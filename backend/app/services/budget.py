@@ -0,0 +1,49 @@
+"""
+行程预算计算
+
+预算的各项输入在结构化行程中都已存在（景点门票、餐饮费用、酒店每晚费用），由代码汇总，
+不依赖 LLM 计算。交通费用没有对应字段，按交通方式估算每天的费用。
+"""
+
+from app.models.schemas import Budget, TripPlan
+
+# 交通方式关键词 -> 每天的交通费用估算（元），按顺序匹配
+DAILY_TRANSPORTATION_COSTS = [
+    ("自驾", 150),
+    ("租车", 150),
+    ("打车", 120),
+    ("出租", 120),
+    ("公共交通", 40),
+    ("地铁", 40),
+    ("公交", 40),
+    ("步行", 10),
+]
+DEFAULT_DAILY_TRANSPORTATION_COST = 60
+
+
+def estimate_daily_transportation(transportation: str) -> int:
+    for keyword, cost in DAILY_TRANSPORTATION_COSTS:
+        if keyword in (transportation or ""):
+            return cost
+    return DEFAULT_DAILY_TRANSPORTATION_COST
+
+
+def compute_budget(trip_plan: TripPlan, transportation: str = "") -> Budget:
+    """
+    由行程计算预算
+
+    酒店按晚计算：多日行程的最后一天返程，不计住宿。
+    """
+    days = trip_plan.days
+    total_attractions = sum(a.ticket_price for day in days for a in day.attractions)
+    total_meals = sum(m.estimated_cost for day in days for m in day.meals)
+    nights = days[:-1] if len(days) > 1 else days
+    total_hotels = sum(day.hotel.estimated_cost for day in nights if day.hotel)
+    total_transportation = estimate_daily_transportation(transportation) * len(days)
+    return Budget(
+        total_attractions=total_attractions,
+        total_hotels=total_hotels,
+        total_meals=total_meals,
+        total_transportation=total_transportation,
+        total=total_attractions + total_hotels + total_meals + total_transportation,
+    )
@@ -0,0 +1,205 @@
+"""
+缓存工具
+
+SQLiteCache: 基于 SQLite 的持久化键值缓存，支持 TTL 过期和按最近访问时间（LRU）淘汰，
+值以 JSON 形式存储，多个命名空间可以共用同一个数据库文件（每个命名空间一张表）。
+MemoryCache: 进程内缓存，每个条目单独指定 TTL，总大小超过 max_bytes 时按 LRU 淘汰。
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_key(text: str) -> str:
+    """统一全角/半角、大小写和空白，作为缓存键"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class SQLiteCache:
+    def __init__(self, path: str, namespace: str, ttl: float, max_entries: int):
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", namespace):
+            raise ValueError(f"Invalid cache namespace: {namespace}")
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {namespace} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {namespace}_last_access ON {namespace}(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """批量读取，返回命中的键值；过期条目视为未命中并删除"""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self._lock:
+            placeholders = ",".join("?" * len(keys))
+            rows = self._conn.execute(
+                f"SELECT key, value, created_at FROM {self.namespace} WHERE key IN ({placeholders})", keys
+            ).fetchall()
+            expired = []
+            for key, value, created_at in rows:
+                if now - created_at > self.ttl:
+                    expired.append(key)
+                else:
+                    found[key] = json.loads(value)
+            if expired:
+                self._conn.executemany(f"DELETE FROM {self.namespace} WHERE key = ?", [(k,) for k in expired])
+            if found:
+                self._conn.executemany(
+                    f"UPDATE {self.namespace} SET last_access = ? WHERE key = ?", [(now, k) for k in found]
+                )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value: Any) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.namespace} (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                [(k, json.dumps(v, ensure_ascii=False), now, now) for k, v in items.items()]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """超出容量时删除最久未访问的条目（调用方持有锁）"""
+        count = self._conn.execute(f"SELECT COUNT(*) FROM {self.namespace}").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.namespace} WHERE key IN "
+                f"(SELECT key FROM {self.namespace} ORDER BY last_access ASC LIMIT ?)", (overflow,)
+            )
+            logger.info(f"[{self.namespace}] LRU 淘汰 {overflow} 条缓存")
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """全部未过期条目（不更新访问时间，不计入命中统计）"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, value FROM {self.namespace} WHERE created_at >= ?", (cutoff,)
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.namespace}")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._conn.execute(f"SELECT COUNT(*) FROM {self.namespace}").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "size": size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def _estimate_size(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+class MemoryCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> (value, expires_at, size)，按访问顺序排列，最久未访问的在前
+        self._entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._pop(oldest)
+                self.evictions += 1
+
+    def _pop(self, key: str) -> None:
+        """调用方持有锁"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size, used = len(self._entries), self._bytes
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "bytes": used,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,132 @@
+"""
+命名的有界线程池
+
+阻塞调用按类型分到各自的线程池，一类调用的突发不会占满其他调用（以及默认线程池）的线程：
+- llm: 检索 / 规划 Agent 运行和其他 LLM 调用
+- mcp: 高德 MCP 工具调用（由检索 Agent 所在线程同步提交）
+- image: 景点名称翻译和图片搜索缓存读写
+- io: 协程中的其他阻塞读写（行程 / 检索缓存和任务记录的 SQLite 读写、小红书笔记文件）
+
+准入控制：排队中的任务数达到 max_queue 时立即拒绝（ExecutorSaturated，接口返回 429），
+而不是无限排队。排队深度、运行数、等待时间和拒绝次数通过 /metrics 输出。
+提交时复制当前 contextvars（请求 ID、工具调用记录等），与 asyncio.to_thread 的行为一致；
+协程中的阻塞调用都经由这些线程池，不使用 asyncio.to_thread（默认线程池没有上限和排队指标）。
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+from app.config import get_settings
+from app.services.metrics import executor_active, executor_queue_depth, executor_rejected, executor_wait
+
+T = TypeVar("T")
+
+# 当前线程所属的线程池
+_current = threading.local()
+
+
+class ExecutorSaturated(Exception):
+    """线程池排队已满"""
+
+    def __init__(self, name: str, max_queue: int):
+        super().__init__(f"{name} 线程池繁忙（排队 {max_queue}），请稍后再试")
+        self.name = name
+
+
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self.rejected = 0
+
+    def saturated(self) -> bool:
+        """所有线程都在运行且排队已满，新提交会被拒绝"""
+        with self._lock:
+            return self._active + self._queued >= self.max_workers + self.max_queue
+
+    def submit(self, fn: Callable[..., T], *args, **kwargs) -> "Future[T]":
+        """提交任务，超出排队上限时抛出 ExecutorSaturated"""
+        with self._lock:
+            if self._active + self._queued >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                executor_rejected.inc(executor=self.name)
+                raise ExecutorSaturated(self.name, self.max_queue)
+            self._queued += 1
+            executor_queue_depth.set(self._queued, executor=self.name)
+        context = contextvars.copy_context()
+        enqueued = time.perf_counter()
+
+        def call() -> T:
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                executor_queue_depth.set(self._queued, executor=self.name)
+                executor_active.set(self._active, executor=self.name)
+            executor_wait.observe(time.perf_counter() - enqueued, executor=self.name)
+            _current.executor = self
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                _current.executor = None
+                with self._lock:
+                    self._active -= 1
+                    executor_active.set(self._active, executor=self.name)
+
+        try:
+            return self._executor.submit(call)
+        except RuntimeError:
+            # 线程池已关闭
+            with self._lock:
+                self._queued -= 1
+                executor_queue_depth.set(self._queued, executor=self.name)
+            raise
+
+    def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """在线程中同步提交并等待结果（已在本线程池的线程中时直接执行，避免嵌套等待占满线程池）"""
+        if getattr(_current, "executor", None) is self:
+            return fn(*args, **kwargs)
+        return self.submit(fn, *args, **kwargs).result()
+
+    def run(self, fn: Callable[..., T], *args, **kwargs) -> "asyncio.Future[T]":
+        """在协程中提交，返回可 await 的 Future（准入检查在调用时立即进行）"""
+        return asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": self._queued,
+                "rejected": self.rejected,
+            }
+
+
+settings = get_settings()
+llm_executor = BoundedExecutor("llm", settings.llm_executor_workers, settings.llm_executor_queue)
+mcp_executor = BoundedExecutor("mcp", settings.mcp_executor_workers, settings.mcp_executor_queue)
+image_executor = BoundedExecutor("image", settings.image_executor_workers, settings.image_executor_queue)
+io_executor = BoundedExecutor("io", settings.io_executor_workers, settings.io_executor_queue)
+
+EXECUTORS = {executor.name: executor for executor in (llm_executor, mcp_executor, image_executor, io_executor)}
+
+
+def shutdown_executors() -> None:
+    for executor in EXECUTORS.values():
+        executor.shutdown()
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: executor.stats() for name, executor in EXECUTORS.items()}
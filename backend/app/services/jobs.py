@@ -0,0 +1,310 @@
+"""
+后台规划任务
+
+提交后立即返回任务 ID，由固定数量的 worker 从本地有界队列中取出执行，
+HTTP 请求的并发与实际执行的并发互不影响；队列满时拒绝提交（JobQueueFull，接口返回 429）。
+
+任务的进度事件和流水线检查点持久化在 SQLite 中：
+- 客户端断开后可以按最后收到的事件 ID 重新订阅，补发之后的事件
+- 失败的任务重试时从检查点继续，已完成的检索、骨架、逐天结果和配图不再重新生成
+- 服务重启时未完成的任务重新入队
+- 任务记录只在检查点推进和状态变化时写入，不是每个事件都写（逐 token 推送的草稿事件不单独保存）；
+  进程内订阅者实时收到全部事件，服务重启后只能补发最后一次写入时的事件
+
+用户自带的 API Key 不写入磁盘，只保存在本进程内存中：
+- 本进程内失败的任务可以重试
+- 服务重启后这类任务标记为失败，重试返回 409（任务摘要中 retryable 为 false），需要重新提交
+
+队列在进程内，多个 worker 进程共用同一个数据库时只有提交任务的进程会执行它。
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Hashable, List, Optional, Tuple
+
+from app.config import get_settings
+from app.models.schemas import TripPlanRequest
+from app.services.cache import SQLiteCache
+from app.services.executors import io_executor
+from app.services.metrics import get_request_id, reset_request_id, set_request_id
+from app.services.trip_pipeline import plan_events
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class JobQueueFull(Exception):
+    """等待队列已满"""
+
+
+def _checkpoint_progress(checkpoint: Dict[str, Any]) -> Hashable:
+    """检查点推进的标记：各步骤是否存在，以及已完成的检索和逐天结果数"""
+    return tuple(sorted(
+        (key, len(value) if isinstance(value, dict) else value is not None) for key, value in checkpoint.items()
+    ))
+
+
+class Job:
+    def __init__(self, job_id: str, request: TripPlanRequest, status: str = QUEUED,
+                 events: Optional[List[Dict[str, Any]]] = None, checkpoint: Optional[Dict[str, Any]] = None,
+                 error: Optional[str] = None, attempts: int = 0, has_api_keys: bool = False,
+                 created_at: Optional[float] = None, updated_at: Optional[float] = None):
+        self.id = job_id
+        self.request = request
+        self.status = status
+        # 进度事件，下标即 SSE 的事件 ID
+        self.events: List[Dict[str, Any]] = events or []
+        self.checkpoint: Dict[str, Any] = checkpoint or {}
+        self.error = error
+        self.attempts = attempts
+        self.has_api_keys = has_api_keys
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+        self.changed = asyncio.Condition()
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            # 用户自带的 API Key 不写入磁盘
+            "request": self.request.model_dump(exclude={"api_keys"}),
+            "status": self.status,
+            "events": self.events,
+            "checkpoint": self.checkpoint,
+            "error": self.error,
+            "attempts": self.attempts,
+            "has_api_keys": self.has_api_keys,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_record(cls, job_id: str, record: Dict[str, Any]) -> "Job":
+        return cls(job_id, TripPlanRequest.model_validate(record["request"]), **{
+            k: record[k] for k in
+            ("status", "events", "checkpoint", "error", "attempts", "has_api_keys", "created_at", "updated_at")
+        })
+
+    def summary(self) -> Dict[str, Any]:
+        last = self.events[-1] if self.events else {}
+        summary = {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": last.get("progress", 0),
+            "message": last.get("status"),
+            "error": self.error,
+            "attempts": self.attempts,
+            "last_event_id": len(self.events) - 1,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+        if self.status == SUCCEEDED:
+            summary["data"] = self.checkpoint.get("plan")
+        if self.status == FAILED:
+            summary["retryable"] = self.retryable
+        return summary
+
+    @property
+    def retryable(self) -> bool:
+        # 自带 API Key 的任务只有在本进程仍保存着 Key 时才能重试
+        return not self.has_api_keys or self.request.api_keys is not None
+
+
+class JobQueue:
+    def __init__(self):
+        self._store: Optional[SQLiteCache] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # 本进程中排队或运行中的任务，订阅者在这里等待新事件
+        self._active: Dict[str, Job] = {}
+        # 任务 ID -> 用户自带的 API Key（只在内存中，供本进程内重试）
+        self._api_keys: Dict[str, Any] = {}
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _get_store(self) -> SQLiteCache:
+        if self._store is None:
+            settings = get_settings()
+            self._store = SQLiteCache(
+                path=os.path.join(settings.cache_dir, "cache.sqlite3"),
+                namespace="trip_jobs",
+                ttl=settings.job_ttl,
+                max_entries=settings.job_max_entries
+            )
+        return self._store
+
+    async def start(self) -> None:
+        settings = get_settings()
+        self._queue = asyncio.Queue(maxsize=max(1, settings.job_queue_size))
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(max(1, settings.job_workers))]
+        await self._recover()
+
+    async def stop(self) -> None:
+        # 运行中的任务保持 running 状态，下次启动时从检查点继续
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _recover(self) -> None:
+        records = await io_executor.run(self._get_store().items)
+        recovered = 0
+        for job_id, record in sorted(records, key=lambda item: item[1]["created_at"]):
+            if record["status"] in FINISHED:
+                continue
+            job = Job.from_record(job_id, record)
+            if job.has_api_keys:
+                await self._fail(job, "服务重启后自带的 API Key 已丢失（不写入磁盘），请重新提交任务")
+                continue
+            job.status = QUEUED
+            try:
+                self._enqueue(job)
+            except JobQueueFull:
+                await self._fail(job, "服务重启时等待队列已满，请重试")
+                continue
+            await self._save(job)
+            recovered += 1
+        if recovered:
+            logger.info(f"request={get_request_id()} 恢复 {recovered} 个未完成的规划任务")
+
+    def _enqueue(self, job: Job) -> None:
+        if self._queue is None:
+            raise RuntimeError("Job queue is not started")
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFull(f"规划任务队列已满（{self._queue.maxsize}），请稍后再试")
+        self._active[job.id] = job
+
+    async def submit(self, request: TripPlanRequest) -> Job:
+        job = Job(uuid.uuid4().hex, request, has_api_keys=request.api_keys is not None)
+        job.events.append({"step": 0, "status": "⏳ 已加入队列", "progress": 0})
+        self._enqueue(job)
+        self.submitted += 1
+        if job.has_api_keys:
+            self._remember_api_keys(job.id, request.api_keys)
+        await self._save(job)
+        return job
+
+    def _remember_api_keys(self, job_id: str, api_keys: Any) -> None:
+        self._api_keys[job_id] = api_keys
+        # 与任务记录相同的条数上限，先淘汰最早提交的
+        while len(self._api_keys) > get_settings().job_max_entries:
+            self._api_keys.pop(next(iter(self._api_keys)))
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        job = self._active.get(job_id)
+        if job is None:
+            record = await io_executor.run(self._get_store().get, job_id)
+            job = Job.from_record(job_id, record) if record else None
+            if job is not None and job.has_api_keys:
+                job.request.api_keys = self._api_keys.get(job_id)
+        return job
+
+    async def retry(self, job_id: str) -> Job:
+        """重新执行失败的任务，从检查点继续"""
+        job = await self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if job.status != FAILED:
+            raise ValueError(f"任务状态为 {job.status}，只有失败的任务可以重试")
+        if not job.retryable:
+            raise ValueError("任务使用的自带 API Key 不写入磁盘，服务重启后已丢失，请重新提交任务")
+        self._enqueue(job)
+        job.status, job.error = QUEUED, None
+        await self._append(job, {"step": 0, "status": "🔁 已重新加入队列", "progress": 0})
+        return job
+
+    async def events(self, job_id: str, last_event_id: int = -1) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """产出 (事件 ID, 事件)，从 last_event_id 之后开始，任务结束后停止"""
+        job = await self.get(job_id)
+        if job is None:
+            return
+        sent = max(last_event_id + 1, 0)
+        while True:
+            # 不在本进程队列中的任务不会再有新事件
+            live = self._active.get(job.id) is job
+            async with job.changed:
+                if live:
+                    await job.changed.wait_for(lambda: len(job.events) > sent or job.status in FINISHED)
+                pending = job.events[sent:]
+                finished = job.status in FINISHED or not live
+            for event_id, event in enumerate(pending, start=sent):
+                yield event_id, event
+            sent += len(pending)
+            if finished and sent >= len(job.events):
+                return
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job.status = RUNNING
+        job.attempts += 1
+        # 任务 ID 作为请求 ID，日志和耗时统计据此关联
+        token = set_request_id(job.id)
+        progress = _checkpoint_progress(job.checkpoint)
+        try:
+            async for event in plan_events(job.request, job.checkpoint):
+                # 检查点推进后紧接着的事件才写入数据库，其余事件只通知进程内的订阅者
+                previous, progress = progress, _checkpoint_progress(job.checkpoint)
+                await self._append(job, event, persist=progress != previous)
+        except Exception as e:
+            logger.error(f"Trip job {job.id} failed: {e}")
+            await self._append(job, {"error": str(e), "status": "❌ 发生错误"})
+            await self._fail(job, str(e))
+        else:
+            async with job.changed:
+                job.status = SUCCEEDED
+                job.changed.notify_all()
+            self.succeeded += 1
+            self._api_keys.pop(job.id, None)
+            await self._save(job)
+        finally:
+            reset_request_id(token)
+            self._active.pop(job.id, None)
+
+    async def _append(self, job: Job, event: Dict[str, Any], persist: bool = True) -> None:
+        async with job.changed:
+            job.events.append(event)
+            job.changed.notify_all()
+        if persist:
+            await self._save(job)
+
+    async def _fail(self, job: Job, error: str) -> None:
+        async with job.changed:
+            job.status, job.error = FAILED, error
+            job.changed.notify_all()
+        self.failed += 1
+        await self._save(job)
+
+    async def _save(self, job: Job) -> None:
+        job.updated_at = time.time()
+        record = job.to_record()
+        await io_executor.run(self._get_store().set, job.id, record)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue": self._queue.maxsize if self._queue else 0,
+            "workers": len(self._workers),
+            "active": len(self._active),
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+job_queue = JobQueue()
@@ -0,0 +1,111 @@
+"""
+笔记关键词倒排索引
+
+中文按字切分为单字和二元组（bigram），拉丁字母/数字按整词切分。查询时先用倒排表求候选集合，
+含中文的关键词再用原文做一次子串校验（二元组全部命中不代表连续出现）。
+"""
+
+import html
+import math
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Set, Tuple
+
+_CJK = r"\u3400-\u9fff\uf900-\ufaff"
+_TERM_RE = re.compile(rf"[{_CJK}]+|[a-z0-9]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def normalize_text(text: str) -> str:
+    """去掉 HTML 标签（RSS 描述中含图片链接），统一全角/半角和大小写"""
+    text = _TAG_RE.sub(" ", html.unescape(text or ""))
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def _index_terms(text: str) -> Set[str]:
+    terms = set()
+    for run in _TERM_RE.findall(text):
+        if _CJK_RE.match(run):
+            terms.update(run)
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.add(run)
+    return terms
+
+
+def _query_terms(keyword: str) -> List[str]:
+    terms = []
+    for run in _TERM_RE.findall(keyword):
+        if _CJK_RE.match(run) and len(run) > 1:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return terms
+
+
+class KeywordIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Set[str]] = {}
+        # doc_id -> (标题, 标题+描述, 标题词项)
+        self._docs: Dict[str, Tuple[str, str, Set[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, doc_id: str, title: str, description: str) -> None:
+        title = normalize_text(title)
+        text = f"{title} {normalize_text(description)}"
+        terms = _index_terms(text)
+        with self._lock:
+            self._remove(doc_id)
+            self._docs[doc_id] = (title, text, _index_terms(title))
+            for term in terms:
+                self._postings.setdefault(term, set()).add(doc_id)
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in _index_terms(doc[1]):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, keyword: str) -> Dict[str, int]:
+        """
+        按空格拆分的关键词任意一个命中即匹配，返回 {doc_id: 匹配分}
+
+        每个命中的关键词在标题中计 2 分，仅在描述中计 1 分。
+        """
+        scores: Dict[str, int] = {}
+        with self._lock:
+            for kw in normalize_text(keyword).split():
+                terms = _query_terms(kw)
+                if not terms:
+                    continue
+                candidates = set.intersection(*(self._postings.get(t, set()) for t in terms))
+                has_cjk = bool(_CJK_RE.search(kw))
+                for doc_id in candidates:
+                    title, text, title_terms = self._docs[doc_id]
+                    if has_cjk:
+                        if kw not in text:
+                            continue
+                        in_title = kw in title
+                    else:
+                        in_title = all(t in title_terms for t in terms)
+                    scores[doc_id] = scores.get(doc_id, 0) + (2 if in_title else 1)
+        return scores
+
+
+def rank_score(match_score: int, liked_count: int) -> float:
+    """匹配分与点赞数的综合排序分：点赞数取对数，避免热门笔记压过相关性"""
+    return match_score * (1 + math.log1p(max(liked_count, 0)))
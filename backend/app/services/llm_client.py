@@ -0,0 +1,250 @@
+"""
+异步 LLM 调用
+
+直接请求 OpenAI 兼容接口的 /chat/completions，进程内所有 Agent 共享一个 httpx.AsyncClient
+（HTTP keep-alive 连接池），每个 API Key 另有并发上限，用户自带的 Key 不会占满整个连接池。
+等待 LLM 响应时不占用线程，一个 worker 可以同时进行上百个规划。
+
+按 requirements.txt 中固定的 hello-agents 0.2.9 编写：HelloAgentsLLM.invoke 返回文本，
+SimpleAgent 的工具调用是文本协议（回答中的 [TOOL_CALL:工具名:参数]），不是 Function Calling。
+
+arun_agent() 是 SimpleAgent.run 的异步版本：多轮工具调用，结束后写入对话历史。提示词、工具调用解析和执行
+复用 SimpleAgent 自身的方法，与线程中的同步路径行为一致。MCP 工具本身是同步的，在 mcp 线程池中执行。
+LLM 调用失败时抛出 HelloAgentsException，由调用方记为检索失败。
+
+UsageRecordingLLM 包装交给 SimpleAgent 的 LLM：HelloAgentsLLM.invoke / stream_invoke 不返回 token 用量，
+包装类用同一个 OpenAI 客户端发出相同的请求并记录 usage；流式调用请求 stream_options.include_usage。
+
+Anthropic / Gemini 地址不是 OpenAI 兼容接口，uses_async_llm() 返回 False，调用方继续走线程中的同步路径。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+from hello_agents import HelloAgentsLLM, SimpleAgent
+from hello_agents.core.exceptions import HelloAgentsException
+from hello_agents.core.message import Message
+
+from app.config import get_settings
+from app.services.executors import mcp_executor
+from app.services.metrics import record_llm_usage, span
+
+logger = logging.getLogger(__name__)
+
+_NON_OPENAI_HOSTS = ("anthropic.com", "googleapis.com", "generativelanguage")
+
+_client: Optional[httpx.AsyncClient] = None
+# API Key 摘要 -> 并发上限
+_key_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_llm_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        settings = get_settings()
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.llm_http_max_connections,
+                max_keepalive_connections=settings.llm_http_max_keepalive,
+                keepalive_expiry=60,
+            ),
+        )
+        _key_limits.clear()
+    return _client
+
+
+async def close_llm_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _key_limit(llm: HelloAgentsLLM) -> asyncio.Semaphore:
+    key = hashlib.sha256(f"{llm.base_url}|{llm.api_key}".encode("utf-8")).hexdigest()[:16]
+    if key not in _key_limits:
+        _key_limits[key] = asyncio.Semaphore(get_settings().llm_max_connections_per_key)
+    return _key_limits[key]
+
+
+def uses_async_llm(llm: HelloAgentsLLM) -> bool:
+    if not get_settings().llm_async:
+        return False
+    base_url = (llm.base_url or "").lower()
+    return bool(base_url) and not any(host in base_url for host in _NON_OPENAI_HOSTS)
+
+
+class UsageRecordingLLM:
+    """
+    记录 token 用量的 HelloAgentsLLM 包装，其余属性和方法透传
+
+    invoke / stream_invoke 发出与 HelloAgentsLLM 相同的请求（同一个 OpenAI 客户端和默认参数），
+    返回值也相同（文本 / 文本片段）。call 为指标中的调用名，流式调用记为 "{call}_stream"。
+    """
+
+    def __init__(self, llm: HelloAgentsLLM, call: str):
+        self._llm = llm
+        self._call = call
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._llm, name)
+
+    def invoke(self, messages: List[Dict[str, Any]], **kwargs) -> str:
+        try:
+            response = self._llm._client.chat.completions.create(
+                model=self._llm.model,
+                messages=messages,
+                temperature=kwargs.pop("temperature", self._llm.temperature),
+                max_tokens=kwargs.pop("max_tokens", self._llm.max_tokens),
+                **kwargs
+            )
+        except Exception as e:
+            raise HelloAgentsException(f"LLM调用失败: {str(e)}")
+        record_llm_usage(self._call, response)
+        return response.choices[0].message.content or ""
+
+    def stream_invoke(self, messages: List[Dict[str, Any]], **kwargs) -> Iterator[str]:
+        temperature = kwargs.get("temperature")
+        try:
+            response = self._llm._client.chat.completions.create(
+                model=self._llm.model,
+                messages=messages,
+                temperature=temperature if temperature is not None else self._llm.temperature,
+                max_tokens=self._llm.max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            for chunk in response:
+                # 最后一个片段没有 choices，只带 usage
+                if chunk.usage:
+                    record_llm_usage(f"{self._call}_stream", chunk)
+                for choice in chunk.choices:
+                    if choice.delta.content:
+                        yield choice.delta.content
+        except Exception as e:
+            raise HelloAgentsException(f"LLM调用失败: {str(e)}")
+
+
+def _request(llm: HelloAgentsLLM, messages: List[Dict[str, Any]], **body) -> Dict[str, Any]:
+    """与 HelloAgentsLLM.invoke 相同的默认参数"""
+    payload = {"model": llm.model, "messages": messages, "temperature": llm.temperature}
+    if llm.max_tokens:
+        payload["max_tokens"] = llm.max_tokens
+    payload.update(body)
+    return {
+        "url": f"{llm.base_url.rstrip('/')}/chat/completions",
+        "json": payload,
+        "headers": {"Authorization": f"Bearer {llm.api_key}"},
+        "timeout": llm.timeout,
+    }
+
+
+async def achat(llm: HelloAgentsLLM, messages: List[Dict[str, Any]], call: str, **body) -> Dict[str, Any]:
+    """非流式调用，返回接口原始 JSON（choices / usage）"""
+    async with _key_limit(llm):
+        with span("llm", call):
+            try:
+                response = await get_llm_client().post(**_request(llm, messages, **body))
+                response.raise_for_status()
+                data = response.json()
+            except httpx.HTTPStatusError as e:
+                raise HelloAgentsException(f"LLM API调用失败: {e.response.status_code} {e.response.text[:200]}")
+            except httpx.HTTPError as e:
+                raise HelloAgentsException(f"LLM API调用失败: {type(e).__name__}: {e}")
+    record_llm_usage(call, data)
+    return data
+
+
+async def ainvoke(llm: HelloAgentsLLM, messages: List[Dict[str, Any]], call: str) -> str:
+    """HelloAgentsLLM.invoke 的异步版本，同样返回回答文本"""
+    data = await achat(llm, messages, call)
+    return data["choices"][0]["message"].get("content") or ""
+
+
+async def astream(llm: HelloAgentsLLM, messages: List[Dict[str, Any]], call: str) -> AsyncIterator[str]:
+    """流式调用，按片段产出文本"""
+    async with _key_limit(llm):
+        with span("llm", call):
+            request = _request(llm, messages, stream=True, stream_options={"include_usage": True})
+            try:
+                async with get_llm_client().stream("POST", **request) as response:
+                    if response.is_error:
+                        await response.aread()
+                        raise HelloAgentsException(
+                            f"LLM API流式调用失败: {response.status_code} {response.text[:200]}"
+                        )
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        if chunk.get("usage"):
+                            record_llm_usage(call, chunk)
+                        for choice in chunk.get("choices") or []:
+                            content = (choice.get("delta") or {}).get("content")
+                            if content:
+                                yield content
+            except httpx.HTTPError as e:
+                raise HelloAgentsException(f"LLM API流式调用失败: {type(e).__name__}: {e}")
+
+
+def _history_messages(agent: SimpleAgent) -> List[Dict[str, Any]]:
+    return [{"role": message.role, "content": message.content} for message in agent.get_history()]
+
+
+async def astream_agent(agent: SimpleAgent, input_text: str, call: str) -> AsyncIterator[str]:
+    """SimpleAgent.stream_run 的异步版本，完整回答写入对话历史"""
+    messages = [{"role": "system", "content": agent.system_prompt}] if agent.system_prompt else []
+    messages += _history_messages(agent) + [{"role": "user", "content": input_text}]
+    full_response = ""
+    async for chunk in astream(agent.llm, messages, call):
+        full_response += chunk
+        yield chunk
+    agent.add_message(Message(input_text, "user"))
+    agent.add_message(Message(full_response, "assistant"))
+
+
+# 与 SimpleAgent.run 的 max_tool_iterations 默认值相同
+MAX_TOOL_ITERATIONS = 3
+
+
+async def arun_agent(agent: SimpleAgent, input_text: str, call: str) -> str:
+    """SimpleAgent.run 的异步版本，LLM 调用失败时抛出 HelloAgentsException"""
+    messages = [{"role": "system", "content": agent._get_enhanced_system_prompt()}]
+    messages += _history_messages(agent) + [{"role": "user", "content": input_text}]
+    final_response = ""
+    if not agent.enable_tool_calling:
+        final_response = await ainvoke(agent.llm, messages, call)
+    else:
+        iteration = 0
+        while iteration < MAX_TOOL_ITERATIONS:
+            # 失败时不吞掉异常：返回空结果会被当作成功的检索写入缓存
+            response = await ainvoke(agent.llm, messages, call)
+            tool_calls = agent._parse_tool_calls(response)
+            if not tool_calls:
+                final_response = response
+                break
+
+            tool_results = []
+            clean_response = response
+            for tool_call in tool_calls:
+                result = await mcp_executor.run(agent._execute_tool_call, tool_call["tool_name"], tool_call["parameters"])
+                tool_results.append(result)
+                clean_response = clean_response.replace(tool_call["original"], "")
+            messages.append({"role": "assistant", "content": clean_response})
+            tool_results_text = "\n\n".join(tool_results)
+            messages.append({"role": "user", "content": f"工具执行结果：\n{tool_results_text}\n\n请基于这些结果给出完整的回答。"})
+            iteration += 1
+
+        if iteration >= MAX_TOOL_ITERATIONS and not final_response:
+            final_response = await ainvoke(agent.llm, messages, call)
+
+    agent.add_message(Message(input_text, "user"))
+    agent.add_message(Message(final_response, "assistant"))
+    return final_response
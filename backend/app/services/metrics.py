@@ -0,0 +1,219 @@
+"""
+耗时统计与 Prometheus 指标
+
+进程内的 Counter / Gauge / Histogram，由 /metrics 以 Prometheus 文本格式输出（不依赖 prometheus_client）。
+span() 记录一个阶段的耗时（Agent 运行、MCP 工具调用、LLM 调用、图片搜索、RSSHub 抓取、JSON 解析等），
+异常时 status 标签为 error。请求 ID 保存在 contextvar 中，由 HTTP 中间件设置，
+提交到命名线程池（executors.py）的任务会继承它，日志和 SSE 事件据此关联同一个请求。
+"""
+
+import logging
+import math
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def set_request_id(request_id: str):
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token) -> None:
+    _request_id.reset(token)
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """Prometheus 文本格式的各行"""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = self._header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = self._header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # 标签 -> [各桶计数, 总和, 总数]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = {key: ([*s[0]], s[1], s[2]) for key, s in self._series.items()}
+        lines = self._header()
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {bucket_count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency (time to response headers)",
+    ["method", "route", "status"],
+)
+stage_duration = Histogram(
+    "trip_stage_duration_seconds", "Latency of pipeline stages (agents, tools, LLM, fetches, parsing)",
+    ["stage", "name", "status"],
+)
+llm_tokens = Counter("llm_tokens_total", "LLM tokens by call site and kind", ["call", "kind"])
+executor_queue_depth = Gauge("executor_queue_depth", "Tasks waiting for a worker thread", ["executor"])
+executor_active = Gauge("executor_active_threads", "Tasks currently running", ["executor"])
+executor_wait = Histogram("executor_wait_seconds", "Time tasks spent queued before running", ["executor"])
+executor_rejected = Counter("executor_rejected_total", "Tasks rejected by admission control", ["executor"])
+
+
+@contextmanager
+def span(stage: str, name: str = "") -> Iterator[Dict[str, Any]]:
+    """
+    记录一个阶段的耗时
+
+    yield 出的字典可以在阶段内设置 status（例如缓存命中时设为 "hit"），未设置时按是否异常记为 ok / error。
+    """
+    labels: Dict[str, Any] = {}
+    started = time.perf_counter()
+    try:
+        yield labels
+    except BaseException:
+        labels.setdefault("status", "error")
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        status = labels.get("status", "ok")
+        stage_duration.observe(elapsed, stage=stage, name=name, status=status)
+        logger.debug(f"[span] request={get_request_id()} stage={stage} name={name} status={status} {elapsed:.3f}s")
+
+
+def record_llm_usage(call: str, response: Any) -> None:
+    """
+    记录响应中 usage 的 token 数（没有 usage 的响应忽略）
+
+    response 可以是接口返回的 JSON 字典，也可以是 OpenAI SDK 的响应对象。
+    """
+    usage = (response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)) or {}
+    for kind in ("prompt_tokens", "completion_tokens"):
+        count = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+        if count:
+            llm_tokens.inc(count, call=call, kind=kind.replace("_tokens", ""))
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
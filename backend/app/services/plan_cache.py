@@ -0,0 +1,101 @@
+"""
+行程计划缓存
+
+相同城市、天数、偏好、预算、交通和住宿的请求复用已生成的完整行程（含图片），跳过整条 Agent 流水线。
+缓存键不包含 api_keys 和具体日期；命中后按新请求的 start_date 重新推算每天的日期。
+旧的天气预报对应的是原来的日期，日期不同时去掉天气信息，不把其他日子的预报当作新日期的预报。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import unicodedata
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+
+from app.config import get_settings
+from app.models.schemas import TripPlan, TripPlanRequest
+from app.services.cache import SQLiteCache, normalize_key
+from app.services.metrics import get_request_id
+
+logger = logging.getLogger(__name__)
+
+# 参与缓存键的请求字段
+PLAN_KEY_FIELDS = ["city", "days", "preferences", "budget", "transportation", "accommodation"]
+
+_plan_cache: Optional[SQLiteCache] = None
+
+
+def get_plan_cache() -> SQLiteCache:
+    global _plan_cache
+    if _plan_cache is None:
+        settings = get_settings()
+        _plan_cache = SQLiteCache(
+            path=os.path.join(settings.cache_dir, "cache.sqlite3"),
+            namespace="trip_plan",
+            ttl=settings.plan_cache_ttl,
+            max_entries=settings.plan_cache_max_entries
+        )
+    return _plan_cache
+
+
+def _canonical(value: Any) -> str:
+    """在 normalize_key 基础上去掉标点，"喜欢美食。" 与 "喜欢美食" 视为同一请求"""
+    text = normalize_key(str(value))
+    return "".join(ch for ch in text if not unicodedata.category(ch).startswith("P")).strip()
+
+
+def plan_cache_key(request: TripPlanRequest) -> str:
+    canonical = {name: _canonical(getattr(request, name)) for name in PLAN_KEY_FIELDS}
+    raw = json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _parse_date(value: str) -> Optional[date]:
+    try:
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def redate_plan(plan: Dict[str, Any], start_date: str, end_date: str) -> Dict[str, Any]:
+    """把缓存的行程平移到新的开始日期：每天的日期由 day_index 推算，日期变化时去掉天气信息"""
+    new_start = _parse_date(start_date)
+    old_start = _parse_date(plan.get("start_date", ""))
+    plan = {**plan, "start_date": start_date, "end_date": end_date}
+    if new_start is None:
+        return plan
+
+    plan["days"] = [
+        {**day, "date": (new_start + timedelta(days=day.get("day_index", i))).isoformat()}
+        for i, day in enumerate(plan.get("days", []))
+    ]
+    if old_start != new_start:
+        plan["weather_info"] = []
+    return plan
+
+
+def get_cached_plan(request: TripPlanRequest) -> Optional[TripPlan]:
+    """查找可复用的行程，命中时返回按新日期调整后的副本"""
+    if not get_settings().plan_cache_enabled:
+        return None
+    cached = get_plan_cache().get(plan_cache_key(request))
+    if cached is None:
+        return None
+    try:
+        plan = TripPlan.model_validate(redate_plan(cached, request.start_date, request.end_date))
+    except Exception as e:
+        logger.warning(f"Cached plan is invalid, ignoring: {e}")
+        return None
+    logger.info(f"request={get_request_id()} 行程缓存命中: {request.city.strip()} {request.days}天")
+    return plan
+
+
+def store_plan(request: TripPlanRequest, trip_plan: TripPlan) -> None:
+    if not get_settings().plan_cache_enabled:
+        return
+    try:
+        get_plan_cache().set(plan_cache_key(request), trip_plan.model_dump())
+    except Exception as e:
+        logger.warning(f"Failed to cache trip plan: {e}")
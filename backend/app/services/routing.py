@@ -0,0 +1,189 @@
+"""
+景点路线优化
+
+用景点经纬度计算球面距离矩阵（haversine，向量化），在代码中完成两件事：
+- 聚类（cluster 模式）：按距离把整份计划的景点重新分配到各天，每天的景点数与原计划相同，
+  聚类与天的对应关系按与原分配重合最多的方式匹配（尽量保持当日描述仍然适用），
+  匹配后再按各天自己的景点数做一次带容量的分配
+- 排序：以当晚酒店为起终点，最近邻构造 + 2-opt 改进得到当天的游览顺序
+
+没有坐标的景点保留在原来那天，排在有坐标的景点之后。
+"""
+
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.models.schemas import Attraction, DayPlan, Location, TripPlan
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_matrix(points: np.ndarray) -> np.ndarray:
+    """points 为 (n, 2) 的 [经度, 纬度]，返回 (n, n) 的距离矩阵（公里）"""
+    radians = np.radians(points)
+    lon, lat = radians[:, 0], radians[:, 1]
+    dlon = lon[:, None] - lon[None, :]
+    dlat = lat[:, None] - lat[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _tour_length(dist: np.ndarray, tour: Sequence[int]) -> float:
+    return float(dist[tour[:-1], tour[1:]].sum())
+
+
+def order_route(dist: np.ndarray, start: int = 0, max_passes: int = 20) -> List[int]:
+    """
+    以 start 为起终点的闭合路线：最近邻构造后做 2-opt 改进
+
+    返回不含起点的访问顺序（下标）。
+    """
+    n = len(dist)
+    if n <= 2:
+        return [i for i in range(n) if i != start]
+
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[start] = False
+    tour = [start]
+    while unvisited.any():
+        candidates = np.where(unvisited, dist[tour[-1]], np.inf)
+        nxt = int(np.argmin(candidates))
+        tour.append(nxt)
+        unvisited[nxt] = False
+    tour.append(start)
+
+    tour = np.array(tour)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            # 反转 tour[i:j+1] 的收益，对所有 j 一次算出
+            j = np.arange(i + 1, n)
+            a, b = tour[i - 1], tour[i]
+            c, d = tour[j], tour[j + 1]
+            delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                k = j[best]
+                tour[i:k + 1] = tour[i:k + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return [int(i) for i in tour[1:-1]]
+
+
+def _assign(dist: np.ndarray, medoids: Sequence[int], capacities: Sequence[int]) -> np.ndarray:
+    """按 (点, 组) 距离从小到大贪心分配，组满则跳过"""
+    n, k = len(dist), len(medoids)
+    order = np.argsort(dist[:, medoids], axis=None)
+    remaining = np.array(capacities, dtype=int)
+    labels = np.full(n, -1)
+    for flat in order:
+        point, group = divmod(int(flat), k)
+        if labels[point] == -1 and remaining[group] > 0:
+            labels[point] = group
+            remaining[group] -= 1
+    return labels
+
+
+def cluster_points(dist: np.ndarray, capacities: Sequence[int], max_iter: int = 20,
+                   medoids: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, List[int]]:
+    """
+    带容量的 k-medoids：按距离把点分成 len(capacities) 组，第 i 组最多 capacities[i] 个点
+
+    medoids 为各组的初始中心（默认最远点初始化）。返回每个点的组号和最终的中心。
+    """
+    k = len(capacities)
+    if medoids is None:
+        medoids = [int(np.argmax(dist.sum(axis=1)))]
+        while len(medoids) < k:
+            medoids.append(int(np.argmax(dist[:, medoids].min(axis=1))))
+    medoids = list(medoids)
+
+    labels = np.full(len(dist), -1)
+    for _ in range(max_iter):
+        new_labels = _assign(dist, medoids, capacities)
+        new_medoids = []
+        for group in range(k):
+            members = np.flatnonzero(new_labels == group)
+            if len(members) == 0:
+                new_medoids.append(medoids[group])
+                continue
+            costs = dist[np.ix_(members, members)].sum(axis=1)
+            new_medoids.append(int(members[np.argmin(costs)]))
+        if np.array_equal(new_labels, labels) and new_medoids == medoids:
+            break
+        labels, medoids = new_labels, new_medoids
+    return labels, medoids
+
+
+def _match_groups_to_days(labels: np.ndarray, original_days: np.ndarray, k: int) -> List[int]:
+    """把聚类组对应到天：优先保留与原分配重合最多的组合"""
+    overlap = np.zeros((k, k), dtype=int)
+    np.add.at(overlap, (labels, original_days), 1)
+    mapping = [-1] * k
+    used_days = set()
+    for flat in np.argsort(-overlap, axis=None):
+        group, day = divmod(int(flat), k)
+        if mapping[group] == -1 and day not in used_days:
+            mapping[group] = day
+            used_days.add(day)
+    return mapping
+
+
+def _point(location: Optional[Location]) -> Optional[Tuple[float, float]]:
+    if location is None:
+        return None
+    return location.longitude, location.latitude
+
+
+def _order_day(day: DayPlan, anchor: Optional[Tuple[float, float]]) -> None:
+    located = [a for a in day.attractions if a.location is not None]
+    unlocated = [a for a in day.attractions if a.location is None]
+    if len(located) < 2:
+        return
+    points = np.array([_point(a.location) for a in located])
+    if anchor is None:
+        # 没有酒店坐标时以当天景点的中心为起点
+        anchor = tuple(points.mean(axis=0))
+    dist = haversine_matrix(np.vstack([anchor, points]))
+    order = order_route(dist, start=0)
+    day.attractions = [located[i - 1] for i in order] + unlocated
+
+
+def optimize_routes(trip_plan: TripPlan, recluster: bool = False) -> TripPlan:
+    """按坐标优化景点的分天和游览顺序，原地修改并返回 trip_plan"""
+    days = sorted(trip_plan.days, key=lambda d: d.day_index)
+    if not days:
+        return trip_plan
+
+    if recluster and len(days) > 1:
+        located: List[Tuple[int, Attraction]] = [
+            (i, a) for i, day in enumerate(days) for a in day.attractions if a.location is not None
+        ]
+        capacities = [sum(1 for a in day.attractions if a.location is not None) for day in days]
+        if len(located) > len(days):
+            points = np.array([_point(a.location) for _, a in located])
+            dist = haversine_matrix(points)
+            labels, medoids = cluster_points(dist, capacities)
+            mapping = _match_groups_to_days(labels, np.array([i for i, _ in located]), len(days))
+            # 组与天对应后，以各天的中心和景点数重新分配，组号即天的下标
+            day_medoids = [medoids[mapping.index(day)] for day in range(len(days))]
+            labels, _ = cluster_points(dist, capacities, medoids=day_medoids)
+            regrouped: List[List[Attraction]] = [[] for _ in days]
+            for (_, attraction), day in zip(located, labels):
+                regrouped[day].append(attraction)
+            for day, attractions in zip(days, regrouped):
+                day.attractions = attractions + [a for a in day.attractions if a.location is None]
+
+    last_hotel = None
+    for day in days:
+        hotel = _point(day.hotel.location) if day.hotel else None
+        # 当天没有酒店坐标时沿用前一晚的酒店作为起点
+        anchor = hotel or last_hotel
+        _order_day(day, anchor)
+        last_hotel = hotel or last_hotel
+    return trip_plan
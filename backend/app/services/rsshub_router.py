@@ -0,0 +1,143 @@
+"""
+RSSHub 实例路由
+
+为每个 RSSHub 实例维护最近 N 次请求的成功率和延迟（EWMA），并实现熔断：
+- closed: 正常路由；窗口内请求数达到 min_requests 且错误率超过阈值时熔断（open）
+- open: 不参与路由，open_seconds 之后进入 half_open
+- half_open: 允许试探请求，成功则恢复 closed，失败则重新 open
+
+路由时按延迟从低到高选择可用实例（延迟未知时按配置顺序），可选对慢请求做对冲（hedging）：
+首选实例在 hedge_delay 秒内未返回时，同时向次选实例发起同样的请求，取先成功的结果。
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from app.services.metrics import get_request_id
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class InstanceHealth:
+    def __init__(self, url: str, window: int):
+        self.url = url
+        self.results: Deque[bool] = deque(maxlen=window)
+        self.latency_ewma: Optional[float] = None
+        self.state = CLOSED
+        self.opened_at = 0.0
+
+    @property
+    def error_rate(self) -> float:
+        if not self.results:
+            return 0.0
+        return 1 - sum(self.results) / len(self.results)
+
+
+class RSSHubRouter:
+    def __init__(self, urls: List[str], window: int = 20, error_threshold: float = 0.5,
+                 min_requests: int = 5, open_seconds: float = 60.0, hedge_delay: float = 0.0):
+        self.instances = {url: InstanceHealth(url, window) for url in urls}
+        self._order = list(urls)
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self.hedge_delay = hedge_delay
+
+    def record(self, url: str, ok: bool, latency: float) -> None:
+        inst = self.instances.get(url)
+        if inst is None:
+            return
+        inst.results.append(ok)
+        if ok:
+            inst.latency_ewma = latency if inst.latency_ewma is None else 0.3 * latency + 0.7 * inst.latency_ewma
+
+        if inst.state == HALF_OPEN:
+            if ok:
+                inst.state = CLOSED
+                inst.results.clear()
+                inst.results.append(True)
+                logger.info(f"request={get_request_id()} RSSHub 恢复: {url}")
+            else:
+                inst.state = OPEN
+                inst.opened_at = time.monotonic()
+        elif inst.state == CLOSED and len(inst.results) >= self.min_requests and inst.error_rate >= self.error_threshold:
+            inst.state = OPEN
+            inst.opened_at = time.monotonic()
+            logger.warning(f"request={get_request_id()} RSSHub 熔断: {url}, 错误率 {inst.error_rate:.0%}")
+
+    def _available(self, inst: InstanceHealth) -> bool:
+        if inst.state == OPEN and time.monotonic() - inst.opened_at >= self.open_seconds:
+            inst.state = HALF_OPEN
+        return inst.state != OPEN
+
+    def ordered(self) -> List[str]:
+        """可用实例，按延迟从低到高排序（延迟未知的排在后面，同等情况下保持配置顺序）"""
+        available = [inst for inst in self.instances.values() if self._available(inst)]
+        available.sort(key=lambda inst: (
+            inst.latency_ewma if inst.latency_ewma is not None else float("inf"),
+            self._order.index(inst.url)
+        ))
+        return [inst.url for inst in available]
+
+    async def call(self, fn: Callable[[str], Awaitable[Optional[T]]]) -> Optional[T]:
+        """
+        依次在可用实例上执行 fn(base_url)，返回第一个非 None 结果
+
+        设置了 hedge_delay 时，首选实例超过该时间未返回即并行请求次选实例。
+        """
+        urls = self.ordered()
+        if not urls:
+            logger.warning(f"request={get_request_id()} 所有 RSSHub 实例均已熔断")
+            return None
+        if self.hedge_delay <= 0 or len(urls) < 2:
+            for url in urls:
+                result = await fn(url)
+                if result is not None:
+                    return result
+            return None
+        return await self._hedged(fn, urls)
+
+    async def _hedged(self, fn: Callable[[str], Awaitable[Optional[T]]], urls: List[str]) -> Optional[T]:
+        remaining = list(urls)
+        tasks: Dict[asyncio.Task, str] = {}
+        try:
+            while remaining or tasks:
+                if remaining:
+                    url = remaining.pop(0)
+                    tasks[asyncio.create_task(fn(url))] = url
+                timeout = self.hedge_delay if remaining else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    url = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        logger.warning(f"RSSHub request to {url} failed: {e}")
+                        continue
+                    if result is not None:
+                        return result
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            url: {
+                "state": inst.state,
+                "error_rate": round(inst.error_rate, 3),
+                "latency_ms": round(inst.latency_ewma * 1000) if inst.latency_ewma is not None else None,
+                "samples": len(inst.results),
+            }
+            for url, inst in self.instances.items()
+        }
+
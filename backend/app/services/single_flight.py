@@ -0,0 +1,112 @@
+"""
+请求合并（single-flight）
+
+同一时刻到达的相同请求只执行一次：
+- SingleFlight: 普通协程调用，后到的请求等待同一个结果
+- StreamFlight: SSE 流，由一个后台任务生成事件并广播给所有订阅者，
+  后加入的订阅者先补发已产生的事件，因此每个客户端看到的进度事件完全相同
+
+计算在独立任务中运行，单个客户端断开不会取消其他订阅者正在等待的计算。
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, TypeVar
+
+from app.services.metrics import get_request_id
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+            self.leaders += 1
+        else:
+            self.shared += 1
+            logger.info(f"request={get_request_id()} 合并相同请求: {key[:16]}")
+        return await asyncio.shield(future)
+
+    def in_flight(self, key: str) -> bool:
+        """是否有相同的请求正在执行（加入它不会增加负载）"""
+        return key in self._calls
+
+    def _forget(self, key: str, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled() and future.exception() is not None:
+            # 已由等待方处理；这里读取一次避免 "exception was never retrieved" 警告
+            logger.debug(f"Single-flight call {key[:16]} failed: {future.exception()}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "shared": self.shared}
+
+
+class _Broadcast:
+    def __init__(self):
+        self.events: List[str] = []
+        self.done = False
+        self.condition = asyncio.Condition()
+        self.task: asyncio.Task = None
+
+
+class StreamFlight:
+    def __init__(self):
+        self._streams: Dict[str, _Broadcast] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def subscribe(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            broadcast.task = asyncio.create_task(self._produce(key, broadcast, factory()))
+            self.leaders += 1
+        else:
+            self.shared += 1
+            logger.info(f"request={get_request_id()} 合并相同的流式请求: {key[:16]}")
+
+        sent = 0
+        while True:
+            async with broadcast.condition:
+                await broadcast.condition.wait_for(lambda: len(broadcast.events) > sent or broadcast.done)
+                pending = broadcast.events[sent:]
+                finished = broadcast.done
+            for event in pending:
+                yield event
+            sent += len(pending)
+            if finished and sent >= len(broadcast.events):
+                return
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._streams
+
+    async def _produce(self, key: str, broadcast: _Broadcast, events: AsyncIterator[str]) -> None:
+        try:
+            async for event in events:
+                async with broadcast.condition:
+                    broadcast.events.append(event)
+                    broadcast.condition.notify_all()
+        except Exception as e:
+            logger.error(f"Shared stream {key[:16]} failed: {e}")
+        finally:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+            async with broadcast.condition:
+                broadcast.done = True
+                broadcast.condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._streams), "leaders": self.leaders, "shared": self.shared}
@@ -0,0 +1,162 @@
+"""
+行程生成流水线
+
+流式接口和后台任务共用：检索 → 规划（逐 token 流式或逐天并行）→ 配图 → 写入行程缓存，
+以事件字典的形式产出进度。
+
+传入 checkpoint 字典时，每个完成的步骤都会写入其中（成功的检索结果、行程骨架、已生成的天、
+解析后的行程、配图后的行程），内容可以 JSON 序列化。用同一个 checkpoint 重新运行时跳过已完成的步骤，
+写入检查点之后总会紧接着产出一个事件，调用方在处理事件时保存即可。
+
+规划阶段逐天推送的 day 事件是草稿（draft 为 true）：之后的路线优化可能在天之间调整景点、
+预算也由代码重新计算，最终以最后一个事件 data 中的完整行程为准。
+
+prefetch_research() 在用户填写表单时提前运行与日期、预算无关的检索，结果进入检索缓存，
+随后的规划请求直接使用（仍在进行中的检索则等待同一个结果）。
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+
+from pydantic import ValidationError
+
+from app.agents.agent_pool import agent_pool
+from app.agents.json_stream import DayStreamParser
+from app.agents.research_cache import get_research
+from app.agents.trip_planner_agent import ResearchResult, TripPlannerAgent, research_queries
+from app.config import get_effective_keys
+from app.models.schemas import DayPlan, TripPlan, TripPlanRequest, TripPrefetchRequest
+from app.services import plan_cache
+from app.services.executors import io_executor, llm_executor
+from app.services.metrics import get_request_id
+from app.services.unsplash_service import UnsplashService
+
+logger = logging.getLogger(__name__)
+
+STEPS = [
+    {"step": 1, "status": "🔍 正在搜索景点、查询天气、搜索酒店...", "progress": 10},
+    {"step": 4, "status": "📋 正在生成行程计划...", "progress": 75},
+    {"step": 5, "status": "🖼️ 正在获取图片...", "progress": 90},
+]
+RESEARCH_LABELS = {"attraction": "景点搜索", "weather": "天气查询", "hotel": "酒店搜索"}
+
+
+def day_event(day_plan: DayPlan, done: int, total: int) -> Dict[str, Any]:
+    """规划阶段每生成完一天推送的事件，内容是后处理之前的草稿，由最终行程替换"""
+    return {
+        "step": 4,
+        "status": f"📅 第{day_plan.day_index + 1}天行程已生成",
+        "progress": min(75 + 15 * done // max(total, 1), 89),
+        "day": day_plan.model_dump(),
+        "draft": True,
+    }
+
+
+async def _planning_events(agent: TripPlannerAgent, request: TripPlanRequest,
+                           checkpoint: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """检索和规划，完成后 checkpoint["plan"] 为处理完的行程（尚未配图）"""
+    saved = checkpoint.setdefault("research", {})
+    research = {name: ResearchResult(**data) for name, data in saved.items()}
+
+    # 步骤1-3: 并行运行检索 Agent，按完成顺序推送
+    yield STEPS[0]
+    await asyncio.sleep(0)  # 让出控制权确保数据发送
+    async for result in agent.iter_research(request, skip=research):
+        research[result.name] = result
+        if result.ok:
+            saved[result.name] = result.to_checkpoint()
+        label = RESEARCH_LABELS[result.name]
+        event = {
+            "step": len(research) + 1,
+            "status": f"✅ {label}完成" if result.ok else f"⚠️ {label}失败",
+            "progress": 10 + 20 * len(research),
+            "agent": result.name,
+            "elapsed": round(result.elapsed, 2),
+        }
+        if result.cached:
+            event["cached"] = True
+        yield event
+
+    # 步骤4: 生成计划（附带规划输入压缩统计）
+    agent._check_research(research)
+    compaction = agent.compact_research(request, research)
+    yield {**STEPS[1], "compaction": compaction}
+    await asyncio.sleep(0)
+    if agent.use_per_day_planning(request):
+        # 长行程：骨架调用后逐天并行生成，按完成顺序推送
+        if "skeleton" not in checkpoint:
+            checkpoint["skeleton"] = await agent.aplan_skeleton(request, research)
+        skeleton = checkpoint["skeleton"]
+        saved_days = checkpoint.setdefault("days", {})
+        days = [DayPlan.model_validate(day) for day in saved_days.values()]
+        async for day_plan in agent.iter_day_plans(request, research, skeleton, skip=map(int, saved_days)):
+            days.append(day_plan)
+            saved_days[str(day_plan.day_index)] = day_plan.model_dump()
+            yield day_event(day_plan, len(days), request.days)
+        trip_plan = agent.assemble_plan(request, skeleton, days)
+    else:
+        planner_query = agent.build_planner_query(request, research)
+        # 逐 token 接收规划结果，每天的行程对象闭合后立即推送
+        parser = DayStreamParser()
+        async for chunk in agent.astream_planner(planner_query):
+            for day in parser.feed(chunk):
+                try:
+                    day_plan = DayPlan.model_validate(day)
+                except ValidationError as e:
+                    logger.warning(f"request={get_request_id()} 第{parser.items_parsed}天行程格式错误: {e}")
+                    continue
+                yield day_event(day_plan, parser.items_parsed, request.days)
+        # 解析失败时可能再次调用 LLM 修复，放到 LLM 线程池中执行
+        trip_plan = await llm_executor.run(agent._parse_trip_plan, parser.text)
+        trip_plan = agent.finalize_plan(request, trip_plan)
+    checkpoint["plan"] = trip_plan.model_dump()
+
+
+async def plan_events(request: TripPlanRequest,
+                      checkpoint: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """运行完整流水线，逐步产出进度事件，最后一个事件的 data 为完整行程"""
+    checkpoint = {} if checkpoint is None else checkpoint
+    if request.use_cache and "plan" not in checkpoint:
+        cached_plan = await io_executor.run(plan_cache.get_cached_plan, request)
+        if cached_plan is not None:
+            checkpoint.update(plan=cached_plan.model_dump(), enriched=True)
+            yield {"step": 6, "status": "✅ 完成！", "progress": 100, "cached": True, "data": checkpoint["plan"]}
+            return
+
+    effective_keys = get_effective_keys(request.api_keys)
+    if "plan" not in checkpoint:
+        async with agent_pool.lease(effective_keys) as agent:
+            async for event in _planning_events(agent, request, checkpoint):
+                yield event
+    trip_plan = TripPlan.model_validate(checkpoint["plan"])
+
+    # 步骤5: 获取图片
+    if not checkpoint.get("enriched"):
+        yield STEPS[2]
+        await asyncio.sleep(0)
+        unsplash_service = UnsplashService(effective_keys["unsplash_access_key"])
+        await unsplash_service.enrich_trip_plan(trip_plan, count=5)
+        await io_executor.run(plan_cache.store_plan, request, trip_plan)
+        checkpoint.update(plan=trip_plan.model_dump(), enriched=True)
+
+    # 完成
+    yield {"step": 6, "status": "✅ 完成！", "progress": 100, "data": checkpoint["plan"]}
+
+
+async def prefetch_research(request: TripPrefetchRequest, skip: Iterable[str] = ()) -> Dict[str, Any]:
+    """预取检索结果，返回各检索的状态（cached / ok / 错误信息）；全部已缓存时不借用 Agent"""
+    queries = research_queries(request)
+    skip = set(skip) if request.accommodation else {*skip, "hotel"}
+    names = [name for name in RESEARCH_LABELS if name not in skip]
+    status = {}
+    for name in names:
+        if await io_executor.run(get_research, name, queries[name]) is not None:
+            status[name] = "cached"
+    missing = [name for name in names if name not in status]
+    if missing:
+        async with agent_pool.lease(get_effective_keys(request.api_keys)) as agent:
+            async for result in agent.iter_research(request, skip=set(RESEARCH_LABELS) - set(missing)):
+                status[result.name] = "cached" if result.cached else ("ok" if result.ok else result.error)
+    logger.info(f"request={get_request_id()} 检索预取完成: {request.city} {status}")
+    return status
@@ -1,27 +1,192 @@
+import asyncio
+import json
+import os
+import time
 import requests
-from typing import Optional, List, Dict
+import httpx
+from typing import Optional, List, Dict, Tuple
 import logging
 from hello_agents import HelloAgentsLLM, SimpleAgent
+from app.config import get_settings
+from app.models.schemas import TripPlan
+from app.services.cache import SQLiteCache, normalize_key
+from app.services.metrics import span
+from app.services.executors import ExecutorSaturated, image_executor
+from app.services.llm_client import UsageRecordingLLM, ainvoke, uses_async_llm
 
 logger = logging.getLogger(__name__)
 
+# 进程内共享的 HTTP 连接池（同步/异步各一个），避免每次搜索重新建立 TLS 连接
+_session = requests.Session()
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=10.0,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+    return _async_client
+
+
+async def close_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+# 景点名称翻译缓存（持久化），键为规范化后的中文名称，值为英文名称
+_translation_cache: Optional[SQLiteCache] = None
+
+
+def get_translation_cache() -> SQLiteCache:
+    global _translation_cache
+    if _translation_cache is None:
+        settings = get_settings()
+        _translation_cache = SQLiteCache(
+            path=os.path.join(settings.cache_dir, "cache.sqlite3"),
+            namespace="translation",
+            ttl=settings.translation_cache_ttl,
+            max_entries=settings.translation_cache_max_entries
+        )
+    return _translation_cache
+
+
+# 搜索结果缓存：unsplash_search 以 (查询词, per_page) 为键保存结果，空结果也会缓存（负缓存）；
+# unsplash_chain 记住每个原始查询在回退链中第一个有结果的查询词，下次直接跳过去
+_search_caches: Dict[str, SQLiteCache] = {}
+
+
+def get_search_cache(namespace: str) -> SQLiteCache:
+    if namespace not in _search_caches:
+        settings = get_settings()
+        _search_caches[namespace] = SQLiteCache(
+            path=os.path.join(settings.cache_dir, "cache.sqlite3"),
+            namespace=namespace,
+            ttl=settings.unsplash_cache_ttl,
+            max_entries=settings.unsplash_cache_max_entries
+        )
+    return _search_caches[namespace]
+
+
+def _search_key(query: str, per_page: int) -> str:
+    return f"{per_page}:{normalize_key(query)}"
+
+
 class UnsplashService:
     def __init__(self, access_key: str):
         self.access_key = access_key
         self.base_url = "https://api.unsplash.com"
         self.llm = HelloAgentsLLM()
+        self._translate_llm = UsageRecordingLLM(self.llm, "translate")
         self.translator = SimpleAgent(
             name="UnsplashTranslator",
             llm=self.llm,
             system_prompt="You are a translator for Chinese tourist attractions. Translate the attraction name to its official English name. Return ONLY the English name, nothing else."
         )
 
-    def _translate_to_english(self, text: str, city: str = "") -> str:
-        """使用 LLM 将景点名称翻译为英文"""
+    def _translator_messages(self, prompt: str) -> List[Dict[str, str]]:
+        # 不经过 SimpleAgent.run：并发翻译时共享对话历史会串数据，且历史会越积越长
+        return [
+            {"role": "system", "content": self.translator.system_prompt},
+            {"role": "user", "content": prompt},
+        ]
+
+    def _invoke_translator(self, prompt: str) -> str:
+        with span("llm", "translate"):
+            response = self._translate_llm.invoke(self._translator_messages(prompt))
+        # hello-agents 0.2.9 的 invoke 返回文本，兼容带 content 属性的响应对象
+        return getattr(response, "content", response).strip()
+
+    async def _ainvoke_translator(self, prompt: str) -> str:
+        return (await ainvoke(self.llm, self._translator_messages(prompt), "translate")).strip()
+
+    @staticmethod
+    def _batch_prompt(texts: List[str]) -> str:
+        return (
+            "Translate each of these Chinese attraction names to English. "
+            "Return ONLY a JSON array of strings in the same order, nothing else.\n"
+            + json.dumps(texts, ensure_ascii=False)
+        )
+
+    @staticmethod
+    def _parse_batch(response: str, texts: List[str]) -> Optional[List[str]]:
+        """解析批量翻译结果，数量不符时返回 None"""
+        parsed = json.loads(response[response.find("["):response.rfind("]") + 1])
+        if isinstance(parsed, list) and len(parsed) == len(texts) and all(isinstance(t, str) and t.strip() for t in parsed):
+            return [t.strip() for t in parsed]
+        logger.warning(f"批量翻译结果数量不符: {len(texts)} -> {response[:200]}")
+        return None
+
+    def translate_many(self, texts: List[str]) -> Dict[str, str]:
+        """
+        批量翻译景点名称，先查缓存，未命中的合并为一次 LLM 调用
+
+        批量结果无法解析或数量不符时退回逐个翻译。返回 {原文: 英文名}。
+        """
+        cache = get_translation_cache()
+        keys = {text: normalize_key(text) for text in texts}
+        cached = cache.get_many(keys.values())
+        result = {text: cached[key] for text, key in keys.items() if key in cached}
+        missing = [text for text in dict.fromkeys(texts) if text not in result]
+        if not missing:
+            return result
+
+        translated = None
+        if len(missing) > 1:
+            try:
+                translated = self._parse_batch(self._invoke_translator(self._batch_prompt(missing)), missing)
+                if translated:
+                    cache.set_many({keys[text]: t for text, t in zip(missing, translated)})
+            except Exception as e:
+                logger.warning(f"批量翻译失败，退回逐个翻译: {e}")
+
+        if translated is None:
+            translated = [self._translate_to_english(text)[1] for text in missing]
+        result.update(zip(missing, translated))
+        logger.info(f"批量翻译: {len(texts)} 个名称, 缓存命中 {len(texts) - len(missing)} 个")
+        return result
+
+    async def atranslate_many(self, texts: List[str]) -> Dict[str, str]:
+        """translate_many 的异步版本：LLM 走共享连接池，缓存读写在图片线程池中执行"""
+        if not uses_async_llm(self.llm):
+            return await image_executor.run(self.translate_many, texts)
+        cache = get_translation_cache()
+        keys = {text: normalize_key(text) for text in texts}
+        cached = await image_executor.run(cache.get_many, list(keys.values()))
+        result = {text: cached[key] for text, key in keys.items() if key in cached}
+        missing = [text for text in dict.fromkeys(texts) if text not in result]
+        if not missing:
+            return result
+
+        translated = None
+        if len(missing) > 1:
+            try:
+                translated = self._parse_batch(await self._ainvoke_translator(self._batch_prompt(missing)), missing)
+                if translated:
+                    await image_executor.run(cache.set_many, {keys[text]: t for text, t in zip(missing, translated)})
+            except Exception as e:
+                logger.warning(f"批量翻译失败，退回逐个翻译: {e}")
+
+        if translated is None:
+            translated = [r[1] for r in await asyncio.gather(*(self._atranslate_to_english(text) for text in missing))]
+        result.update(zip(missing, translated))
+        logger.info(f"批量翻译: {len(texts)} 个名称, 缓存命中 {len(texts) - len(missing)} 个")
+        return result
+
+    def _translate_to_english(self, text: str, city: str = "") -> Tuple[str, str, str]:
+        """使用 LLM 将景点名称翻译为英文（优先读取翻译缓存），返回 (搜索词, 英文名, 城市)"""
+        cache = get_translation_cache()
+        key = normalize_key(text)
         try:
-            prompt = f"Translate this Chinese attraction name to English: {text}"
-            response = self.translator.run(prompt)
-            translated = response.strip()
+            translated = cache.get(key)
+            if translated is None:
+                prompt = f"Translate this Chinese attraction name to English: {text}"
+                translated = self._invoke_translator(prompt)
+                cache.set(key, translated)
             # 添加 China Landmark 后缀提高搜索准确性
             search_query = f"{translated} China Landmark"
             logger.info(f"关键词翻译: {text} -> {search_query}")
@@ -30,54 +195,162 @@ class UnsplashService:
             logger.error(f"翻译关键词失败: {e}")
             return f"{text} China Landmark", text, city
 
-    def _do_search(self, query: str, per_page: int) -> List[Dict]:
-        """执行实际的 Unsplash API 搜索"""
-        url = f"{self.base_url}/search/photos"
-        params = {
+    async def _atranslate_to_english(self, text: str, city: str = "") -> Tuple[str, str, str]:
+        """_translate_to_english 的异步版本"""
+        if not uses_async_llm(self.llm):
+            return await image_executor.run(self._translate_to_english, text, city)
+        cache = get_translation_cache()
+        key = normalize_key(text)
+        try:
+            translated = await image_executor.run(cache.get, key)
+            if translated is None:
+                translated = await self._ainvoke_translator(f"Translate this Chinese attraction name to English: {text}")
+                await image_executor.run(cache.set, key, translated)
+            search_query = f"{translated} China Landmark"
+            logger.info(f"关键词翻译: {text} -> {search_query}")
+            return search_query, translated, city
+        except Exception as e:
+            logger.error(f"翻译关键词失败: {e}")
+            return f"{text} China Landmark", text, city
+
+    def _search_params(self, query: str, per_page: int) -> Dict:
+        return {
             "query": query,
             "per_page": per_page,
             "client_id": self.access_key,
             "order_by": "relevant",
             "content_filter": "high"
         }
+
+    def _do_search(self, query: str, per_page: int) -> List[Dict]:
+        """执行实际的 Unsplash API 搜索"""
+        url = f"{self.base_url}/search/photos"
         logger.info(f"正在请求 Unsplash API: query={query}")
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
+        with span("unsplash", "search"):
+            response = _session.get(url, params=self._search_params(query, per_page), timeout=10)
+            response.raise_for_status()
         return response.json().get("results", [])
 
+    async def _ado_search(self, query: str, per_page: int) -> List[Dict]:
+        """异步版本的 Unsplash API 搜索，复用共享连接池"""
+        url = f"{self.base_url}/search/photos"
+        logger.info(f"正在请求 Unsplash API: query={query}")
+        with span("unsplash", "search"):
+            response = await get_async_client().get(url, params=self._search_params(query, per_page))
+            response.raise_for_status()
+        return response.json().get("results", [])
+
+    @staticmethod
+    def _fallback_queries(search_query: str, translated: str, city_name: str) -> List[str]:
+        """回退链：翻译后的关键词 -> 城市+Architecture -> 仅翻译后的名称"""
+        queries = [search_query]
+        if city_name:
+            queries.append(f"{city_name} Architecture")
+        queries.append(translated)
+        return queries
+
+    @staticmethod
+    def _to_photos(results: List[Dict]) -> List[Dict]:
+        logger.info(f"Unsplash 搜索结果数量: {len(results)}")
+        photos = []
+        for result in results:
+            photos.append({
+                "url": result["urls"]["regular"],
+                "description": result.get("description", ""),
+                "photographer": result["user"]["name"]
+            })
+        return photos
+
+    def _cached_results(self, query: str, per_page: int) -> Optional[List[Dict]]:
+        """读取缓存的搜索结果；过期的负缓存（空结果）视为未命中"""
+        entry = get_search_cache("unsplash_search").get(_search_key(query, per_page))
+        if entry is None:
+            return None
+        if not entry["photos"] and time.time() - entry["cached_at"] > get_settings().unsplash_negative_cache_ttl:
+            return None
+        return entry["photos"]
+
+    def _store_results(self, query: str, per_page: int, photos: List[Dict]) -> None:
+        get_search_cache("unsplash_search").set(
+            _search_key(query, per_page), {"photos": photos, "cached_at": time.time()}
+        )
+
+    def _chain_key(self, query: str, per_page: int, city: str) -> str:
+        return _search_key(f"{query}|{city}", per_page)
+
+    def _cached_chain(self, chain_key: str, per_page: int) -> Optional[List[Dict]]:
+        """按回退链记录的查询词读取缓存结果"""
+        winner = get_search_cache("unsplash_chain").get(chain_key)
+        return self._cached_results(winner, per_page) if winner else None
+
     def search_photos(self, query: str, per_page: int = 10, city: str = "") -> List[Dict]:
         try:
+            chain_key = self._chain_key(query, per_page, city)
+            photos = self._cached_chain(chain_key, per_page)
+            if photos:
+                return photos
+
             # 翻译并构建搜索关键词
             search_query, translated, city_name = self._translate_to_english(query, city)
             
-            # 第一次搜索
-            results = self._do_search(search_query, per_page)
-            
-            # 回退搜索：如果无结果，使用城市+Architecture
-            if not results and city_name:
-                fallback_query = f"{city_name} Architecture"
-                logger.info(f"回退搜索: {fallback_query}")
-                results = self._do_search(fallback_query, per_page)
-            
-            # 再次回退：仅使用翻译后的名称
-            if not results:
-                logger.info(f"再次回退搜索: {translated}")
-                results = self._do_search(translated, per_page)
-            
-            logger.info(f"Unsplash 搜索结果数量: {len(results)}")
-            
             photos = []
-            for result in results:
-                photos.append({
-                    "url": result["urls"]["regular"],
-                    "description": result.get("description", ""),
-                    "photographer": result["user"]["name"]
-                })
+            for i, q in enumerate(self._fallback_queries(search_query, translated, city_name)):
+                if i > 0:
+                    logger.info(f"回退搜索: {q}")
+                photos = self._cached_results(q, per_page)
+                if photos is None:
+                    photos = self._to_photos(self._do_search(q, per_page))
+                    self._store_results(q, per_page, photos)
+                if photos:
+                    get_search_cache("unsplash_chain").set(chain_key, q)
+                    break
+            return photos
+        except Exception as e:
+            logger.error(f"搜索图片失败: {e}")
+            return []
+
+    async def asearch_photos(self, query: str, per_page: int = 10, city: str = "") -> List[Dict]:
+        """search_photos 的异步版本：缓存读写在图片线程池中执行，翻译和搜索走共享的异步连接池"""
+        try:
+            chain_key = self._chain_key(query, per_page, city)
+            photos = await image_executor.run(self._cached_chain, chain_key, per_page)
+            if photos:
+                return photos
+
+            search_query, translated, city_name = await self._atranslate_to_english(query, city)
+
+            photos = []
+            for i, q in enumerate(self._fallback_queries(search_query, translated, city_name)):
+                if i > 0:
+                    logger.info(f"回退搜索: {q}")
+                photos = await image_executor.run(self._cached_results, q, per_page)
+                if photos is None:
+                    photos = self._to_photos(await self._ado_search(q, per_page))
+                    await image_executor.run(self._store_results, q, per_page, photos)
+                if photos:
+                    await image_executor.run(get_search_cache("unsplash_chain").set, chain_key, q)
+                    break
             return photos
         except Exception as e:
             logger.error(f"搜索图片失败: {e}")
             return []
 
+    async def preload_cities(self, cities: List[str], per_page: int = 5) -> int:
+        """预热热门城市的回退查询（城市+Architecture），该查询被同城所有景点共用。返回实际请求次数"""
+        fetched = 0
+        for city in cities:
+            query = f"{city} Architecture"
+            if await image_executor.run(self._cached_results, query, per_page) is not None:
+                continue
+            try:
+                photos = self._to_photos(await self._ado_search(query, per_page))
+                await image_executor.run(self._store_results, query, per_page, photos)
+                fetched += 1
+            except Exception as e:
+                logger.error(f"预热城市图片失败 {city}: {e}")
+        logger.info(f"Unsplash 预热完成: {len(cities)} 个城市, 请求 {fetched} 次")
+        return fetched
+
     def get_photo_url(self, query: str, city: str = "") -> Optional[str]:
         photos = self.search_photos(query, per_page=1, city=city)
         return photos[0].get("url") if photos else None
@@ -86,3 +359,49 @@ class UnsplashService:
         """获取多张图片URL，返回实际搜索到的数量（最多count张）"""
         photos = self.search_photos(query, per_page=count, city=city)
         return [p.get("url") for p in photos if p.get("url")]
+
+    async def aget_photo_urls(self, query: str, count: int = 5, city: str = "") -> List[str]:
+        photos = await self.asearch_photos(query, per_page=count, city=city)
+        return [p.get("url") for p in photos if p.get("url")]
+
+    async def enrich_trip_plan(self, trip_plan: TripPlan, count: int = 5) -> TripPlan:
+        """
+        为行程中缺少图片的景点批量补充图片
+
+        同名景点（跨天重复出现）只搜索一次，翻译和搜索以 UNSPLASH_CONCURRENCY 为上限并发执行。
+        """
+        names = []
+        for day in trip_plan.days:
+            for attraction in day.attractions:
+                if not attraction.image_urls and attraction.name not in names:
+                    names.append(attraction.name)
+        if not names:
+            return trip_plan
+        if not self.access_key:
+            logger.warning("未配置 Unsplash Access Key，跳过图片获取")
+            return trip_plan
+
+        settings = get_settings()
+        queries = [f"{name} {trip_plan.city}" for name in names]
+        if settings.translation_batch and len(queries) > 1:
+            # 一次 LLM 调用预先翻译全部名称，后续逐个搜索时直接命中缓存
+            try:
+                await self.atranslate_many(queries)
+            except ExecutorSaturated as e:
+                logger.warning(f"跳过批量翻译: {e}")
+
+        semaphore = asyncio.Semaphore(settings.unsplash_concurrency)
+
+        async def fetch(query: str) -> List[str]:
+            async with semaphore:
+                return await self.aget_photo_urls(query, count=count, city=trip_plan.city)
+
+        url_lists = await asyncio.gather(*(fetch(query) for query in queries))
+        urls_by_name = dict(zip(names, url_lists))
+        logger.info(f"图片获取完成: {len(names)} 个景点")
+
+        for day in trip_plan.days:
+            for attraction in day.attractions:
+                if not attraction.image_urls:
+                    attraction.image_urls = list(urls_by_name.get(attraction.name, []))
+        return trip_plan
@@ -0,0 +1,182 @@
+"""
+小红书博主笔记存储
+
+由后台刷新任务写入、预览接口读取的进程内存储。每个博主保存最近一次成功解析的笔记
+（按笔记 ID 合并历史，最多保留 max_notes_per_blogger 条），可选持久化到 JSON 文件，
+重启后无需等待第一轮刷新即可提供数据。写入时同步维护关键词倒排索引，查询不再线性扫描。
+
+持久化文件也可能被其他进程更新（例如离线预热命令）：reload_if_changed() 在文件修改时间变化后
+按博主合并磁盘上更新的数据，save() 写入前先做一次合并，不会用旧数据覆盖别人刚写入的笔记。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.services.keyword_index import KeywordIndex, rank_score
+
+logger = logging.getLogger(__name__)
+
+
+class FeedStore:
+    def __init__(self, path: Optional[str] = None, max_notes_per_blogger: int = 200):
+        self.path = path
+        self.max_notes_per_blogger = max_notes_per_blogger
+        self._lock = threading.Lock()
+        # blogger_id -> {"notes": [...], "updated_at": float, "last_error": str | None}
+        self._feeds: Dict[str, Dict[str, Any]] = {}
+        # 索引文档 ID 为 "博主ID:笔记ID"（解析不到笔记 ID 时各博主会出现相同的 note_N）
+        self._index = KeywordIndex()
+        self._notes_by_doc: Dict[str, Dict] = {}
+        # 最近一次读入或写出时文件的修改时间
+        self._mtime_ns: Optional[int] = None
+
+    def _index_feed(self, blogger_id: str, old_notes: List[Dict], new_notes: List[Dict]) -> None:
+        """调用方持有锁"""
+        new_ids = {f"{blogger_id}:{note['id']}" for note in new_notes}
+        for note in old_notes:
+            doc_id = f"{blogger_id}:{note['id']}"
+            if doc_id not in new_ids:
+                self._index.remove(doc_id)
+                self._notes_by_doc.pop(doc_id, None)
+        for note in new_notes:
+            doc_id = f"{blogger_id}:{note['id']}"
+            if self._notes_by_doc.get(doc_id) is not note:
+                self._index.add(doc_id, note.get("title", ""), note.get("description", ""))
+                self._notes_by_doc[doc_id] = note
+
+    def update(self, blogger_id: str, notes: List[Dict]) -> None:
+        """写入一次成功抓取的结果，与已有笔记按 ID 合并"""
+        with self._lock:
+            feed = self._feeds.setdefault(blogger_id, {"notes": [], "updated_at": None, "last_error": None})
+            merged = {note["id"]: note for note in feed["notes"]}
+            merged.update({note["id"]: note for note in notes})
+            ordered = sorted(merged.values(), key=lambda n: n.get("published") or "", reverse=True)
+            self._index_feed(blogger_id, feed["notes"], ordered[:self.max_notes_per_blogger])
+            feed["notes"] = ordered[:self.max_notes_per_blogger]
+            feed["updated_at"] = time.time()
+            feed["last_error"] = None
+
+    def mark_error(self, blogger_id: str, error: str) -> None:
+        """记录抓取失败，保留上一次的笔记继续提供服务"""
+        with self._lock:
+            feed = self._feeds.setdefault(blogger_id, {"notes": [], "updated_at": None, "last_error": None})
+            feed["last_error"] = error
+
+    def has_feed(self, blogger_id: str) -> bool:
+        with self._lock:
+            feed = self._feeds.get(blogger_id)
+            return bool(feed and feed["updated_at"])
+
+    def all_notes(self) -> List[Dict]:
+        with self._lock:
+            return [note for feed in self._feeds.values() for note in feed["notes"]]
+
+    def search(self, keyword: str, limit: int) -> List[Dict]:
+        """通过倒排索引按关键词查询，按匹配分与点赞数综合排序"""
+        if not keyword.strip():
+            notes = sorted(self.all_notes(), key=lambda n: n.get("liked_count", 0), reverse=True)
+            return notes[:limit]
+        scores = self._index.search(keyword)
+        with self._lock:
+            hits = [(self._notes_by_doc[doc_id], score) for doc_id, score in scores.items() if doc_id in self._notes_by_doc]
+        hits.sort(key=lambda h: rank_score(h[1], h[0].get("liked_count", 0)), reverse=True)
+        return [note for note, _ in hits[:limit]]
+
+    def updated_at(self) -> Optional[float]:
+        """数据新鲜度：所有已成功抓取的博主中最早的一次刷新时间"""
+        with self._lock:
+            times = [feed["updated_at"] for feed in self._feeds.values() if feed["updated_at"]]
+        return min(times) if times else None
+
+    def updated_at_iso(self) -> Optional[str]:
+        ts = self.updated_at()
+        return datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "bloggers": len(self._feeds),
+                "notes": sum(len(feed["notes"]) for feed in self._feeds.values()),
+                "indexed": len(self._index),
+                "errors": {bid: feed["last_error"] for bid, feed in self._feeds.items() if feed["last_error"]},
+            }
+
+    def _file_mtime_ns(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read_file(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load feed store {self.path}: {e}")
+            return None
+
+    def reload_if_changed(self) -> int:
+        """
+        文件在上次读写之后被修改时，按博主合并磁盘上的数据，返回更新的博主数量
+
+        只采用比内存中更新（updated_at 更晚）的博主数据，本进程尚未保存的刷新结果不会丢失。
+        """
+        if not self.path:
+            return 0
+        mtime_ns = self._file_mtime_ns()
+        if mtime_ns is None or mtime_ns == self._mtime_ns:
+            return 0
+        feeds = self._read_file()
+        if feeds is None:
+            return 0
+        changed = 0
+        with self._lock:
+            for blogger_id, feed in feeds.items():
+                current = self._feeds.get(blogger_id)
+                if current is not None and (current["updated_at"] or 0) >= (feed.get("updated_at") or 0):
+                    continue
+                self._index_feed(blogger_id, current["notes"] if current else [], feed["notes"])
+                self._feeds[blogger_id] = feed
+                changed += 1
+            self._mtime_ns = mtime_ns
+        if changed:
+            logger.info(f"Reloaded {changed} feeds from {self.path}")
+        return changed
+
+    def save(self) -> None:
+        """写入磁盘（先合并磁盘上更新的数据；先写临时文件再替换，避免中途退出留下半个文件）"""
+        if not self.path:
+            return
+        self.reload_if_changed()
+        with self._lock:
+            data = json.dumps(self._feeds, ensure_ascii=False)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        self._mtime_ns = self._file_mtime_ns()
+
+    def load(self) -> int:
+        """从磁盘恢复，返回恢复的博主数量"""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        mtime_ns = self._file_mtime_ns()
+        feeds = self._read_file()
+        if feeds is None:
+            return 0
+        with self._lock:
+            self._mtime_ns = mtime_ns
+            self._feeds = feeds
+            self._index = KeywordIndex()
+            self._notes_by_doc = {}
+            for blogger_id, feed in feeds.items():
+                self._index_feed(blogger_id, [], feed["notes"])
+        return len(feeds)
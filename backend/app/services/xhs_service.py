@@ -4,15 +4,28 @@
 
 import httpx
 import asyncio
+import logging
+import os
+import random
 import re
+import time
 import urllib.parse
 import feedparser
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 from app.config import get_settings
+from app.services.xhs_feed_store import FeedStore
+from app.services.rsshub_router import RSSHubRouter
+from app.services.executors import io_executor
+from app.services.metrics import get_request_id, span
+
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+# 预览接口最多返回的笔记数
+MAX_PREVIEW_NOTES = 6
+
 # ============================================================
 # 旅游博主列表
 # ============================================================
@@ -58,46 +71,123 @@ def _fix_localhost_url(url: str) -> str:
     return url.replace("localhost", "127.0.0.1")
 
 
+# ============================================================
+# 共享 HTTP 客户端：全应用复用一个连接池（keep-alive，安装 h2 时启用 HTTP/2），
+# 由 FastAPI lifespan 创建和关闭；在 lifespan 之外使用时按需创建
+# ============================================================
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+_rsshub_client: Optional[httpx.AsyncClient] = None
+
+
+def get_rsshub_client() -> httpx.AsyncClient:
+    global _rsshub_client
+    if _rsshub_client is None or _rsshub_client.is_closed:
+        _rsshub_client = httpx.AsyncClient(
+            timeout=settings.xhs_fetch_timeout,
+            trust_env=False,
+            http2=_HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+        )
+    return _rsshub_client
+
+
+async def close_rsshub_client() -> None:
+    global _rsshub_client
+    if _rsshub_client is not None:
+        await _rsshub_client.aclose()
+        _rsshub_client = None
+
+
+# 按健康状况和延迟在主实例与备用实例之间路由（键为修正后的 URL）
+rsshub_router = RSSHubRouter(
+    [_fix_localhost_url(url) for url in [settings.xhs_rsshub_base_url, settings.xhs_rsshub_fallback_url]],
+    window=settings.xhs_router_window,
+    error_threshold=settings.xhs_router_error_threshold,
+    min_requests=settings.xhs_router_min_requests,
+    open_seconds=settings.xhs_router_open_seconds,
+    hedge_delay=settings.xhs_hedge_delay
+)
+_health_task: Optional[asyncio.Task] = None
+
+
 async def check_rsshub_health() -> Dict[str, Any]:
-    """检查 RSSHub 服务健康状态"""
+    """检查 RSSHub 服务健康状态，结果同时反馈给路由器"""
     results = {}
     
     for url in [settings.xhs_rsshub_base_url, settings.xhs_rsshub_fallback_url]:
         fixed_url = _fix_localhost_url(url)
+        started = time.monotonic()
         try:
-            async with httpx.AsyncClient(timeout=5.0, trust_env=False) as client:
-                health_url = f"{fixed_url}/healthz"
-                print(f"[DEBUG] 健康检查: {health_url}")
-                resp = await client.get(health_url)
-                print(f"[DEBUG] 响应: {resp.status_code}")
-                results[url] = {"status": "ok" if resp.status_code == 200 else "error", "code": resp.status_code}
+            health_url = f"{fixed_url}/healthz"
+            logger.debug(f"request={get_request_id()} 健康检查: {health_url}")
+            resp = await get_rsshub_client().get(health_url, timeout=5.0)
+            logger.debug(f"request={get_request_id()} 响应: {resp.status_code}")
+            rsshub_router.record(fixed_url, resp.status_code == 200, time.monotonic() - started)
+            results[url] = {"status": "ok" if resp.status_code == 200 else "error", "code": resp.status_code}
         except Exception as e:
-            print(f"[DEBUG] 健康检查异常: {type(e).__name__}: {e}")
+            logger.warning(f"request={get_request_id()} 健康检查异常: {type(e).__name__}: {e}")
+            rsshub_router.record(fixed_url, False, time.monotonic() - started)
             results[url] = {"status": "error", "error": str(e)}
+        results[url]["router"] = rsshub_router.snapshot().get(fixed_url)
     
     return results
 
 
+async def _health_loop() -> None:
+    while True:
+        await asyncio.sleep(settings.xhs_health_interval)
+        try:
+            await check_rsshub_health()
+        except Exception as e:
+            logger.warning(f"request={get_request_id()} 健康检查任务异常: {type(e).__name__}: {e}")
+
+
+def start_health_monitor() -> None:
+    """定期探测各实例，让熔断中的实例尽快恢复、延迟数据保持更新"""
+    global _health_task
+    if _health_task is None and settings.xhs_health_interval > 0:
+        _health_task = asyncio.create_task(_health_loop())
+
+
+async def stop_health_monitor() -> None:
+    global _health_task
+    if _health_task is not None:
+        _health_task.cancel()
+        await asyncio.gather(_health_task, return_exceptions=True)
+        _health_task = None
+
+
 async def get_xhs_notes(keyword: str) -> Dict[str, Any]:
     """
     获取小红书笔记数据
-    策略：先尝试本地 RSSHub，失败后切换到公共实例
+    启用后台刷新时只读取本地笔记存储；否则实时抓取：先尝试本地 RSSHub，失败后切换到公共实例
     """
-    rsshub_urls = [settings.xhs_rsshub_base_url, settings.xhs_rsshub_fallback_url]
+    if settings.xhs_refresh_enabled:
+        # 预热命令等其他进程可能更新了持久化文件（只比较修改时间，未变化时不读文件）
+        await io_executor.run(feed_store.reload_if_changed)
+        return _get_notes_from_store(keyword)
+
+    rsshub_urls = rsshub_router.ordered()
     
-    print(f"[XHS] 开始获取笔记，关键词: {keyword}")
+    logger.info(f"request={get_request_id()} 开始获取笔记，关键词: {keyword}")
     
     for base_url in rsshub_urls:
-        print(f"[XHS] 尝试 RSSHub: {base_url}")
+        logger.info(f"request={get_request_id()} 尝试 RSSHub: {base_url}")
         result = await _try_get_notes(base_url, keyword)
         
         if result["status"] == "success" and result["data"]:
-            print(f"[XHS] 成功从 {base_url} 获取 {len(result['data'])} 条笔记")
+            logger.info(f"request={get_request_id()} 成功从 {base_url} 获取 {len(result['data'])} 条笔记")
+            result["updated_at"] = datetime.now().isoformat(timespec="seconds")
             return result
         
-        print(f"[XHS] {base_url} 失败，尝试下一个...")
+        logger.warning(f"request={get_request_id()} {base_url} 失败，尝试下一个...")
     
-    print("[XHS] 所有 RSSHub 实例失败，返回降级响应")
+    logger.warning(f"request={get_request_id()} 所有 RSSHub 实例失败，返回降级响应")
     return {
         "status": "fallback",
         "data": [],
@@ -106,55 +196,152 @@ async def get_xhs_notes(keyword: str) -> Dict[str, Any]:
     }
 
 
+class _HostRateLimiter:
+    """按主机限速：同一主机相邻两次请求至少间隔 min_interval 秒"""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last: Dict[str, float] = {}
+
+    async def wait(self, host: str) -> None:
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            delay = self._last.get(host, 0.0) + self.min_interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._last[host] = loop.time()
+
+
+_rate_limiter = _HostRateLimiter(settings.xhs_host_min_interval)
+
+
+# 条件请求：每个订阅 URL 记录 ETag / Last-Modified 及上次解析结果，304 时直接复用
+_feed_validators: Dict[str, Dict[str, Any]] = {}
+
+
+def _conditional_headers(url: str) -> Dict[str, str]:
+    cached = _feed_validators.get(url)
+    if not cached:
+        return {}
+    headers = {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
+
+async def _fetch_blogger_feed(
+    base_url: str,
+    blogger: Dict[str, Any],
+    semaphore: asyncio.Semaphore,
+) -> Optional[List[Dict]]:
+    """请求单个博主的 RSS 并解析，请求失败返回 None；订阅未变化（304）时返回上次的解析结果"""
+    url = f"{base_url}/xiaohongshu/user/{blogger['id']}/notes"
+    async with semaphore:
+        await _rate_limiter.wait(urllib.parse.urlsplit(base_url).netloc)
+        started = time.monotonic()
+        with span("rsshub", "feed") as labels:
+            try:
+                logger.debug(f"request={get_request_id()} 请求: {blogger['name']}")
+                response = await get_rsshub_client().get(url, headers=_conditional_headers(url))
+                logger.debug(f"request={get_request_id()} {blogger['name']}: status={response.status_code}, len={len(response.content)}")
+                labels["status"] = "ok" if response.status_code in (200, 304) else "error"
+            except httpx.TimeoutException:
+                logger.warning(f"request={get_request_id()} 超时: {blogger['name']}")
+                labels["status"] = "timeout"
+                rsshub_router.record(base_url, False, time.monotonic() - started)
+                return None
+            except Exception as e:
+                logger.warning(f"request={get_request_id()} 异常 {blogger['name']}: {type(e).__name__}: {e}")
+                labels["status"] = "error"
+                rsshub_router.record(base_url, False, time.monotonic() - started)
+                return None
+        # 4xx（如博主 ID 失效）说明实例本身可用，只有 5xx 计为实例故障
+        rsshub_router.record(base_url, response.status_code < 500, time.monotonic() - started)
+
+    if response.status_code == 304 and url in _feed_validators:
+        logger.debug(f"request={get_request_id()} {blogger['name']}: 未变化，跳过解析")
+        return _feed_validators[url]["notes"]
+
+    if response.status_code != 200:
+        logger.debug(f"request={get_request_id()} 响应内容: {response.text[:200]}")
+        return None
+
+    notes = _parse_rss(response.text, blogger["name"], blogger.get("tags", []))
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if etag or last_modified:
+        _feed_validators[url] = {"etag": etag, "last_modified": last_modified, "notes": notes}
+    return notes
+
+
+async def _fetch_blogger_notes(
+    base_url: str,
+    blogger: Dict[str, Any],
+    keyword: str,
+    semaphore: asyncio.Semaphore,
+) -> Optional[List[Dict]]:
+    """请求单个博主的 RSS 并按关键词筛选，请求失败返回 None"""
+    notes = await _fetch_blogger_feed(base_url, blogger, semaphore)
+    if notes is None:
+        return None
+    # 严格匹配：只保留匹配关键词的笔记
+    filtered = _filter_by_keyword(notes, keyword) if notes else []
+    if filtered:
+        logger.debug(f"request={get_request_id()} {blogger['name']}: 匹配 {len(filtered)} 条")
+    return filtered
+
+
 async def _try_get_notes(base_url: str, keyword: str) -> Dict[str, Any]:
-    """尝试从指定 RSSHub 实例获取笔记 - 搜索所有博主，严格匹配关键词"""
+    """
+    尝试从指定 RSSHub 实例获取笔记 - 搜索所有博主，严格匹配关键词
+
+    并发数受 XHS_FETCH_CONCURRENCY 限制，同一主机的请求间隔受 XHS_HOST_MIN_INTERVAL 限制；
+    整体耗时不超过 XHS_FETCH_DEADLINE 秒，匹配数凑够 MAX_PREVIEW_NOTES 条即提前结束。
+    """
     matched_notes = []  # 只存储匹配关键词的笔记
     fixed_base_url = _fix_localhost_url(base_url)
     success_count = 0
     
-    print(f"[DEBUG] _try_get_notes: 原始URL={base_url}, 修正后={fixed_base_url}")
-    print(f"[DEBUG] 开始搜索全部 {len(TRAVEL_BLOGGERS)} 个博主...")
+    logger.debug(f"request={get_request_id()} _try_get_notes: 原始URL={base_url}, 修正后={fixed_base_url}")
+    logger.debug(f"request={get_request_id()} 开始搜索全部 {len(TRAVEL_BLOGGERS)} 个博主...")
     
     # 并发请求所有博主，提高效率
-    async with httpx.AsyncClient(timeout=30.0, trust_env=False) as client:
-        for i, blogger in enumerate(TRAVEL_BLOGGERS):
-            if i > 0:
-                await asyncio.sleep(0.5)  # 减少间隔，加快搜索
-            
-            url = f"{fixed_base_url}/xiaohongshu/user/{blogger['id']}/notes"
-            
-            try:
-                print(f"[DEBUG] [{i+1}/{len(TRAVEL_BLOGGERS)}] 请求: {blogger['name']}")
-                response = await client.get(url)
-                print(f"[DEBUG] {blogger['name']}: status={response.status_code}, len={len(response.text)}")
-                
-                if response.status_code != 200:
-                    print(f"[DEBUG] 响应内容: {response.text[:200]}")
-                    continue
-                
-                success_count += 1
-                notes = _parse_rss(response.text, blogger["name"], blogger.get("tags", []))
-                
-                if notes:
-                    # 严格匹配：只添加匹配关键词的笔记
-                    filtered = _filter_by_keyword(notes, keyword)
-                    if filtered:
-                        matched_notes.extend(filtered)
-                        print(f"[DEBUG] {blogger['name']}: 匹配 {len(filtered)} 条")
-                            
-            except httpx.TimeoutException:
-                print(f"[DEBUG] 超时: {blogger['name']}")
-            except Exception as e:
-                print(f"[DEBUG] 异常 {blogger['name']}: {type(e).__name__}: {e}")
+    semaphore = asyncio.Semaphore(settings.xhs_fetch_concurrency)
+    pending = {
+        asyncio.create_task(_fetch_blogger_notes(fixed_base_url, blogger, keyword, semaphore))
+        for blogger in TRAVEL_BLOGGERS
+    }
+    deadline = asyncio.get_running_loop().time() + settings.xhs_fetch_deadline
+    try:
+        while pending and len(matched_notes) < MAX_PREVIEW_NOTES:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                logger.warning(f"request={get_request_id()} 达到总时限 {settings.xhs_fetch_deadline}s，放弃剩余 {len(pending)} 个博主")
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                notes = task.result()
+                if notes is not None:
+                    success_count += 1
+                    matched_notes.extend(notes)
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
     
-    print(f"[DEBUG] 搜索完成: 成功请求 {success_count}/{len(TRAVEL_BLOGGERS)} 个博主, 匹配 {len(matched_notes)} 条笔记")
+    logger.info(f"request={get_request_id()} 搜索完成: 成功请求 {success_count}/{len(TRAVEL_BLOGGERS)} 个博主, 匹配 {len(matched_notes)} 条笔记")
     
     # 严格匹配：有匹配结果才返回 success，否则返回 fallback
     if matched_notes:
         matched_notes.sort(key=lambda x: x.get("liked_count", 0), reverse=True)
         return {
             "status": "success",
-            "data": matched_notes[:6],
+            "data": matched_notes[:MAX_PREVIEW_NOTES],
             "search_url": _build_search_url(keyword)
         }
     
@@ -162,6 +349,92 @@ async def _try_get_notes(base_url: str, keyword: str) -> Dict[str, Any]:
     return {"status": "fallback", "data": [], "search_url": _build_search_url(keyword)}
 
 
+# ============================================================
+# 后台刷新：定期抓取每个博主的笔记写入 feed_store，预览接口只读存储
+# ============================================================
+feed_store = FeedStore(
+    path=os.path.join(settings.cache_dir, "xhs_feeds.json") if settings.xhs_feed_persist else None,
+    max_notes_per_blogger=settings.xhs_feed_max_notes_per_blogger
+)
+_refresh_tasks: List[asyncio.Task] = []
+
+
+async def refresh_blogger(blogger: Dict[str, Any], semaphore: asyncio.Semaphore) -> bool:
+    """抓取单个博主的笔记写入存储，由路由器选择最快的可用 RSSHub 实例"""
+    notes = await rsshub_router.call(lambda base_url: _fetch_blogger_feed(base_url, blogger, semaphore))
+    if notes is not None:
+        feed_store.update(blogger["id"], notes)
+        return True
+    feed_store.mark_error(blogger["id"], "all RSSHub instances failed")
+    return False
+
+
+async def refresh_all_feeds() -> int:
+    """立即刷新全部博主一次，返回成功数量"""
+    semaphore = asyncio.Semaphore(settings.xhs_fetch_concurrency)
+    results = await asyncio.gather(*(refresh_blogger(b, semaphore) for b in TRAVEL_BLOGGERS))
+    await io_executor.run(feed_store.save)
+    return sum(results)
+
+
+async def _refresh_loop(blogger: Dict[str, Any], semaphore: asyncio.Semaphore) -> None:
+    interval = settings.xhs_refresh_interval
+    jitter = settings.xhs_refresh_jitter
+    # 存储里已有数据（从磁盘恢复）时错开首次刷新，否则立即抓取
+    if feed_store.has_feed(blogger["id"]):
+        await asyncio.sleep(random.uniform(0, interval * jitter))
+    while True:
+        try:
+            ok = await refresh_blogger(blogger, semaphore)
+            logger.info(f"request={get_request_id()} 刷新 {blogger['name']}: {'成功' if ok else '失败'}")
+            await io_executor.run(feed_store.save)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"request={get_request_id()} 刷新 {blogger['name']} 异常: {type(e).__name__}: {e}")
+        await asyncio.sleep(interval * random.uniform(1 - jitter, 1 + jitter))
+
+
+def start_feed_refresher() -> None:
+    """启动后台刷新任务（每个博主一个任务，各自带抖动的刷新周期）"""
+    if _refresh_tasks:
+        return
+    restored = feed_store.load()
+    logger.info(f"request={get_request_id()} 从磁盘恢复 {restored} 个博主的笔记")
+    semaphore = asyncio.Semaphore(settings.xhs_fetch_concurrency)
+    for blogger in TRAVEL_BLOGGERS:
+        _refresh_tasks.append(asyncio.create_task(_refresh_loop(blogger, semaphore)))
+
+
+async def stop_feed_refresher() -> None:
+    for task in _refresh_tasks:
+        task.cancel()
+    await asyncio.gather(*_refresh_tasks, return_exceptions=True)
+    _refresh_tasks.clear()
+    feed_store.save()
+
+
+def _get_notes_from_store(keyword: str) -> Dict[str, Any]:
+    """从本地笔记存储的关键词索引中查询，不发起任何网络请求"""
+    updated_at = feed_store.updated_at_iso()
+    matched = feed_store.search(keyword, MAX_PREVIEW_NOTES)
+    logger.debug(f"request={get_request_id()} 索引查询: {keyword} -> 匹配 {len(matched)} 条")
+    if matched:
+        return {
+            "status": "success",
+            "data": matched,
+            "search_url": _build_search_url(keyword),
+            "updated_at": updated_at
+        }
+    return {
+        "status": "fallback",
+        "data": [],
+        "search_url": _build_search_url(keyword),
+        "updated_at": updated_at,
+        "message": "暂无匹配的笔记，请点击链接直接搜索" if updated_at else "笔记数据尚未就绪，请点击链接直接搜索"
+    }
+
+
 def _parse_rss(xml_content: str, author_name: str, author_tags: List[str]) -> List[Dict]:
     """解析 RSS XML，提取完整笔记信息"""
     notes = []
@@ -179,7 +452,7 @@ def _parse_rss(xml_content: str, author_name: str, author_tags: List[str]) -> Li
             note_id = _extract_note_id(link, i)
             title = getattr(entry, 'title', '无标题')
             
-            print(f"[DEBUG] 笔记: {title[:30]}... | 图片: {cover_image[:80] if cover_image else '无'}")
+            logger.debug(f"request={get_request_id()} 笔记: {title[:30]}... | 图片: {cover_image[:80] if cover_image else '无'}")
             
             notes.append({
                 "id": note_id,
@@ -194,7 +467,7 @@ def _parse_rss(xml_content: str, author_name: str, author_tags: List[str]) -> Li
             })
             
     except Exception as e:
-        print(f"[XHS] RSS 解析错误: {e}")
+        logger.warning(f"request={get_request_id()} RSS 解析错误: {e}")
     
     return notes
 
@@ -282,7 +555,7 @@ def _filter_by_keyword(notes: List[Dict], keyword: str) -> List[Dict]:
         return any(kw in title or kw in desc for kw in keywords)
     
     matched = [note for note in notes if match_note(note)]
-    print(f"[DEBUG] 关键词筛选: {keyword} -> 匹配 {len(matched)}/{len(notes)} 条")
+    logger.debug(f"request={get_request_id()} 关键词筛选: {keyword} -> 匹配 {len(matched)}/{len(notes)} 条")
     return matched
 
 
@@ -0,0 +1,41 @@
+"""测试准入控制：LLM 线程池排队已满时，与进行中的请求相同的规划请求合并而不是返回 429"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.routes import trip
+from app.models.schemas import TripPlanRequest
+
+
+def make_request(city="北京"):
+    return TripPlanRequest(city=city, start_date="2026-10-20", end_date="2026-10-21", days=2,
+                           preferences="历史文化", budget="中等", transportation="地铁", accommodation="经济型酒店")
+
+
+def test_identical_request_joins_when_saturated(monkeypatch):
+    saturated = False
+    monkeypatch.setattr(trip.llm_executor, "saturated", lambda: saturated)
+
+    async def scenario():
+        nonlocal saturated
+        release = asyncio.Event()
+
+        async def slow_plan(request):
+            await release.wait()
+            return {"city": request.city}
+
+        monkeypatch.setattr(trip, "_generate_plan", slow_plan)
+        leader = asyncio.create_task(trip.create_trip_plan(make_request()))
+        await asyncio.sleep(0)
+        saturated = True
+
+        follower = asyncio.create_task(trip.create_trip_plan(make_request()))
+        with pytest.raises(HTTPException) as rejected:
+            await trip.create_trip_plan(make_request(city="上海"))
+        release.set()
+        return await leader, await follower, rejected.value.status_code
+
+    leader, follower, status = asyncio.run(scenario())
+    assert leader == follower == {"city": "北京"}
+    assert status == 429
@@ -0,0 +1,60 @@
+"""测试 Agent 复用池：全局实例上限、空闲淘汰"""
+import pytest
+
+from app.agents import agent_pool as pool_module
+from app.agents.agent_pool import AgentPool, AgentPoolExhausted, _PooledAgent
+
+
+class FakeAgent:
+    reusable = True
+    mcp_healthy = True
+
+    def __init__(self):
+        self.closed = False
+
+    def reset(self):
+        pass
+
+    def check_health(self):
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+def keys(name):
+    return {"llm_api_key": name, "llm_model_id": "", "llm_base_url": "", "amap_api_key": ""}
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = AgentPool(max_idle=2, idle_ttl=600, health_interval=600, max_total=2)
+    monkeypatch.setattr(pool, "_create", lambda effective_keys: _PooledAgent(agent=FakeAgent()))
+    return pool
+
+
+def test_total_cap_evicts_idle_of_other_keys(pool):
+    a = pool.acquire(keys("a"))
+    b = pool.acquire(keys("b"))
+    pool.release(keys("a"), a)
+
+    # 已有 2 个实例，新 Key 需要先关闭最久未用的空闲实例
+    c = pool.acquire(keys("c"))
+    assert a.closed and not b.closed and c is not a
+    assert pool.stats()["total"] == 2
+
+    # 全部借出时拒绝新建
+    with pytest.raises(AgentPoolExhausted):
+        pool.acquire(keys("d"))
+    assert pool.stats()["rejected"] == 1
+
+
+def test_evict_idle_closes_expired(pool, monkeypatch):
+    agent = pool.acquire(keys("a"))
+    pool.release(keys("a"), agent)
+    now = pool_module.time.monotonic()
+    monkeypatch.setattr(pool_module.time, "monotonic", lambda: now + 601)
+
+    assert pool.evict_idle() == 1
+    assert agent.closed
+    assert pool.stats()["total"] == 0
@@ -0,0 +1,86 @@
+"""测试后台规划任务：只在检查点推进时写入任务记录，自带 API Key 的任务只能在本进程内重试"""
+import asyncio
+
+import pytest
+
+from app.models.schemas import ApiKeys, TripPlanRequest
+from app.services import jobs
+from app.services.jobs import FAILED, SUCCEEDED, JobQueue
+
+
+def make_request(**kwargs):
+    return TripPlanRequest(city="北京", start_date="2026-10-20", end_date="2026-10-21", days=2,
+                           preferences="历史文化", budget="中等", transportation="地铁", accommodation="经济型酒店",
+                           **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_DIR", str(tmp_path))
+
+
+async def run_job(queue, job):
+    async for _ in queue.events(job.id):
+        pass
+
+
+def test_saves_only_at_checkpoint_boundaries(monkeypatch):
+    async def fake_plan_events(request, checkpoint):
+        for i in range(20):
+            yield {"status": "token", "progress": i}
+        checkpoint["plan"] = {"city": request.city}
+        yield {"status": "done", "progress": 100, "data": checkpoint["plan"]}
+
+    monkeypatch.setattr(jobs, "plan_events", fake_plan_events)
+
+    async def scenario():
+        queue = JobQueue()
+        saves = []
+        original_save = queue._save
+
+        async def counting_save(job):
+            saves.append(len(job.events))
+            await original_save(job)
+
+        monkeypatch.setattr(queue, "_save", counting_save)
+        await queue.start()
+        job = await queue.submit(make_request())
+        await run_job(queue, job)
+        await queue.stop()
+        stored = await JobQueue().get(job.id)
+        return saves, stored
+
+    saves, stored = asyncio.run(scenario())
+    # 提交、检查点推进后的事件、成功
+    assert saves == [1, 22, 22]
+    assert stored.status == SUCCEEDED and len(stored.events) == 22
+
+
+def test_api_key_job_retry(monkeypatch):
+    async def failing_plan_events(request, checkpoint):
+        raise RuntimeError("LLM 不可用")
+        yield
+
+    monkeypatch.setattr(jobs, "plan_events", failing_plan_events)
+
+    async def scenario():
+        queue = JobQueue()
+        await queue.start()
+        job = await queue.submit(make_request(api_keys=ApiKeys(llm_api_key="sk-user")))
+        await run_job(queue, job)
+        failed = await queue.get(job.id)
+        # 同一进程内 Key 仍在内存中，可以重试
+        assert failed.status == FAILED and failed.summary()["retryable"]
+        retried = await queue.retry(job.id)
+        assert retried.request.api_keys.llm_api_key == "sk-user"
+        await run_job(queue, retried)
+        await queue.stop()
+
+        # 模拟服务重启：Key 没有写入磁盘
+        restarted = JobQueue()
+        reloaded = await restarted.get(job.id)
+        assert reloaded.summary()["retryable"] is False
+        with pytest.raises(ValueError):
+            await restarted.retry(job.id)
+
+    asyncio.run(scenario())
@@ -0,0 +1,66 @@
+"""测试异步 Agent 循环：按 hello-agents 0.2.9 的文本协议解析工具调用，LLM 调用失败时抛出异常"""
+import asyncio
+
+import pytest
+from hello_agents import HelloAgentsLLM, SimpleAgent
+from hello_agents.core.exceptions import HelloAgentsException
+from hello_agents.tools import Tool, ToolParameter
+
+from app.services import llm_client
+
+
+class WeatherTool(Tool):
+    def __init__(self):
+        super().__init__(name="get_weather", description="查询天气")
+        self.calls = []
+
+    def get_parameters(self):
+        return [
+            ToolParameter(name="city", type="string", description="城市"),
+            ToolParameter(name="days", type="integer", description="天数"),
+        ]
+
+    def run(self, parameters):
+        self.calls.append(parameters)
+        return f"{parameters['city']} 晴"
+
+
+def make_agent(tool):
+    llm = HelloAgentsLLM(model="fake", api_key="test", base_url="http://127.0.0.1:9")
+    agent = SimpleAgent(name="weather", llm=llm, system_prompt="你是天气助手")
+    agent.add_tool(tool)
+    return agent
+
+
+def test_runs_text_tool_calls(monkeypatch):
+    tool = WeatherTool()
+    agent = make_agent(tool)
+    requests = []
+    replies = ["先查天气 [TOOL_CALL:get_weather:city=北京,days=3]", "北京晴"]
+
+    async def fake_ainvoke(llm, messages, call):
+        requests.append(list(messages))
+        return replies.pop(0)
+
+    monkeypatch.setattr(llm_client, "ainvoke", fake_ainvoke)
+    answer = asyncio.run(llm_client.arun_agent(agent, "北京天气", "weather"))
+
+    assert answer == "北京晴"
+    assert tool.calls == [{"city": "北京", "days": 3}]
+    assert requests[0][0]["content"].startswith("你是天气助手")
+    assert "get_weather" in requests[0][0]["content"]
+    assert requests[1][-2] == {"role": "assistant", "content": "先查天气 "}
+    assert "北京 晴" in requests[1][-1]["content"]
+    assert [m.role for m in agent.get_history()] == ["user", "assistant"]
+
+
+def test_llm_failure_raises(monkeypatch):
+    agent = make_agent(WeatherTool())
+
+    async def failing_achat(llm, messages, call, **body):
+        raise HelloAgentsException("LLM API调用失败: 500")
+
+    monkeypatch.setattr(llm_client, "achat", failing_achat)
+    with pytest.raises(HelloAgentsException):
+        asyncio.run(llm_client.arun_agent(agent, "北京天气", "weather"))
+    assert agent.get_history() == []
@@ -0,0 +1,63 @@
+"""测试规划结果按片段修复：只重新生成出错的那一天并拼回原文"""
+import json
+from types import SimpleNamespace
+
+from hello_agents import HelloAgentsLLM
+
+from app.agents.trip_planner_agent import TripPlannerAgent
+
+
+class FakeCompletions:
+    """OpenAI 客户端替身：按顺序返回预设回答，并记录收到的消息"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def create(self, messages, **kwargs):
+        self.calls.append(messages)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.responses.pop(0)))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+        )
+
+
+def make_llm(completions) -> HelloAgentsLLM:
+    # 真实的 HelloAgentsLLM（0.2.9 的 invoke 返回文本），只替换底层客户端
+    llm = HelloAgentsLLM(model="fake", api_key="test", base_url="http://127.0.0.1:9")
+    llm._client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return llm
+
+
+def make_agent(llm) -> TripPlannerAgent:
+    # 不启动 MCP 服务，只需要规划 Agent 的系统提示词
+    agent = TripPlannerAgent.__new__(TripPlannerAgent)
+    agent.llm = llm
+    agent.planner_agent = SimpleNamespace(system_prompt="你是行程规划专家")
+    return agent
+
+
+def test_repairs_invalid_day():
+    plan = {
+        "city": "北京",
+        "start_date": "2026-10-20",
+        "end_date": "2026-10-21",
+        "days": [
+            {"date": "2026-10-20", "day_index": "第一天", "attractions": [{"name": "故宫"}]},
+            {"date": "2026-10-21", "day_index": 1, "attractions": [{"name": "天坛"}]},
+        ],
+    }
+    fixed_day = {"date": "2026-10-20", "day_index": 0, "attractions": [{"name": "故宫"}]}
+    completions = FakeCompletions([json.dumps(fixed_day, ensure_ascii=False)])
+
+    trip_plan = make_agent(make_llm(completions))._parse_trip_plan(json.dumps(plan, ensure_ascii=False))
+
+    assert len(completions.calls) == 1
+    assert "days[0]" in completions.calls[0][1]["content"]
+    assert [day.day_index for day in trip_plan.days] == [0, 1]
+    assert [day.attractions[0].name for day in trip_plan.days] == ["故宫", "天坛"]
+
+
+if __name__ == "__main__":
+    test_repairs_invalid_day()
+    print("✅ 测试通过")
@@ -0,0 +1,42 @@
+"""测试景点重新分天：聚类后每天的景点数与原计划相同"""
+import random
+
+from app.models.schemas import Attraction, DayPlan, Location, TripPlan
+from app.services.routing import optimize_routes
+
+
+def make_plan(rng: random.Random) -> TripPlan:
+    days = []
+    for day_index in range(rng.randint(2, 5)):
+        attractions = [
+            Attraction(
+                name=f"景点{day_index}-{i}",
+                location=Location(longitude=116 + rng.uniform(-0.5, 0.5), latitude=39.9 + rng.uniform(-0.5, 0.5)),
+            )
+            for i in range(rng.randint(0, 6))
+        ]
+        if rng.random() < 0.3:
+            attractions.append(Attraction(name=f"无坐标{day_index}"))
+        days.append(DayPlan(date=f"2026-10-{20 + day_index}", day_index=day_index, attractions=attractions))
+    return TripPlan(city="北京", start_date="2026-10-20", end_date="2026-10-25", days=days)
+
+
+def test_recluster_keeps_per_day_counts():
+    rng = random.Random(42)
+    for _ in range(300):
+        plan = make_plan(rng)
+        before = [len(day.attractions) for day in plan.days]
+        names = sorted(a.name for day in plan.days for a in day.attractions)
+        unlocated = [[a.name for a in day.attractions if a.location is None] for day in plan.days]
+
+        optimize_routes(plan, recluster=True)
+
+        assert [len(day.attractions) for day in plan.days] == before
+        assert sorted(a.name for day in plan.days for a in day.attractions) == names
+        # 没有坐标的景点留在原来那天
+        assert [[a.name for a in day.attractions if a.location is None] for day in plan.days] == unlocated
+
+
+if __name__ == "__main__":
+    test_recluster_keeps_per_day_counts()
+    print("✅ 测试通过")
@@ -0,0 +1,36 @@
+"""测试 MCP 工具结果缓存：只缓存解析为成功的结果，MCPTool 和高德接口的错误返回不写入缓存"""
+import json
+
+import pytest
+
+from app.agents.tool_cache import ToolResultCache
+
+WEATHER = {"city": "北京市", "forecasts": [{"date": "2026-10-20", "dayweather": "晴"}]}
+
+
+def result(tool_name, data):
+    # MCPTool.run 成功时的返回格式
+    return f"工具 '{tool_name}' 执行结果:\n{json.dumps(data, ensure_ascii=False)}"
+
+
+@pytest.mark.parametrize("value", [
+    "MCP 操作失败: Failed to connect",
+    "异步操作失败: Connection closed",
+    "错误：必须指定 tool_name 参数",
+    "工具 'maps_weather' 执行结果:\nGet weather failed: INVALID_USER_KEY",
+    result("maps_weather", {"status": "0", "info": "INVALID_USER_KEY", "infocode": "10001"}),
+    result("maps_weather", {"city": "北京市", "forecasts": []}),
+    result("maps_text_search", {"suggestion": {}, "pois": []}),
+])
+def test_failures_are_not_cached(value):
+    cache = ToolResultCache(max_bytes=1 << 20)
+    cache.set("maps_weather", {"city": "北京"}, value)
+    assert cache.get("maps_weather", {"city": "北京"}) is None
+
+
+def test_successful_result_is_cached():
+    cache = ToolResultCache(max_bytes=1 << 20)
+    value = result("maps_weather", WEATHER)
+    cache.set("maps_weather", {"city": "北京"}, value)
+    # 参数规范化后命中同一条缓存
+    assert cache.get("maps_weather", {"city": " 北京 "}) == value
@@ -0,0 +1,54 @@
+"""测试景点名称翻译：LLM 按 hello-agents 0.2.9 的接口返回文本，token 用量照常记录"""
+from types import SimpleNamespace
+
+from hello_agents import HelloAgentsLLM
+
+from app.services import unsplash_service
+from app.services.llm_client import UsageRecordingLLM
+from app.services.metrics import llm_tokens
+from app.services.unsplash_service import UnsplashService
+
+
+def fake_client(content):
+    """OpenAI 客户端替身，返回与 chat.completions.create 相同结构的响应"""
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=12, completion_tokens=3),
+        )
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))), calls
+
+
+def make_service(content):
+    llm = HelloAgentsLLM(model="fake", api_key="test", base_url="http://127.0.0.1:9")
+    llm._client, calls = fake_client(content)
+    # 不创建翻译 Agent，只需要系统提示词
+    service = UnsplashService.__new__(UnsplashService)
+    service.llm = llm
+    service._translate_llm = UsageRecordingLLM(llm, "translate")
+    service.translator = SimpleNamespace(system_prompt="Translate the attraction name.")
+    return service, calls
+
+
+def test_library_invoke_returns_text():
+    service, _ = make_service("Forbidden City")
+    assert service.llm.invoke([{"role": "user", "content": "故宫"}]) == "Forbidden City"
+
+
+def test_translate_to_english(tmp_path, monkeypatch):
+    monkeypatch.setattr(unsplash_service, "get_settings", lambda: SimpleNamespace(
+        cache_dir=str(tmp_path), translation_cache_ttl=60, translation_cache_max_entries=10))
+    monkeypatch.setattr(unsplash_service, "_translation_cache", None)
+    service, calls = make_service(" Forbidden City\n")
+    before = dict(llm_tokens._values)
+
+    assert service._translate_to_english("故宫", "北京") == ("Forbidden City China Landmark", "Forbidden City", "北京")
+    assert calls[0]["messages"][0]["content"] == "Translate the attraction name."
+    assert llm_tokens._values[("translate", "prompt")] - before.get(("translate", "prompt"), 0) == 12
+    # 第二次读取翻译缓存，不再调用 LLM
+    assert service._translate_to_english("故宫")[1] == "Forbidden City"
+    assert len(calls) == 1
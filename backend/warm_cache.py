@@ -0,0 +1,279 @@
+"""
+缓存预热命令（离线批处理，建议每晚运行一次）
+
+为热门城市预先填充检索缓存（景点 / 酒店）、景点名称翻译缓存和 Unsplash 图片缓存，
+并刷新小红书笔记存储、统计各搜索关键词能匹配到的笔记数，早高峰的请求大多直接命中缓存。
+
+用法:
+    python warm_cache.py                                  # 城市取 UNSPLASH_PRELOAD_CITIES
+    python warm_cache.py --cities 北京,上海 --keywords 北京美食,外滩夜景
+    python warm_cache.py --targets top_destinations.json  # {"cities": [...], "search_keywords": [...]}
+
+- 各城市以 --concurrency 为上限并发预热，每完成一项输出一行进度
+- 每项完成后写入进度文件，中途退出后重新运行会跳过已完成的项（--fresh 重新开始），全部完成后删除进度文件
+- 结束时把各项结果和缓存统计写入摘要文件
+
+天气检索的缓存有效期很短（RESEARCH_CACHE_WEATHER_TTL），离线预热没有意义，不在这里预热。
+小红书笔记写入服务共用的存储文件，运行中的服务在查询时发现文件修改后按博主合并更新的数据。
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+from app.agents.agent_pool import agent_pool
+from app.agents.compaction import parse_pois
+from app.agents.research_cache import get_research, research_cache_stats
+from app.agents.trip_planner_agent import research_queries
+from app.config import get_settings
+from app.models.schemas import TripPrefetchRequest
+from app.services import unsplash_service, xhs_service
+from app.services.executors import shutdown_executors
+from app.services.llm_client import close_llm_client
+from app.services.trip_pipeline import prefetch_research
+
+# 与前端表单默认值一致，预热结果才能被默认请求命中
+DEFAULT_PREFERENCES = "喜欢历史古迹和自然风光"
+DEFAULT_ACCOMMODATION = "四星级酒店"
+# 与行程配图（enrich_trip_plan）使用的每个景点图片数一致
+PHOTOS_PER_ATTRACTION = 5
+
+
+def _split(value: str) -> List[str]:
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def load_targets(args: argparse.Namespace) -> Dict[str, Any]:
+    """合并 --targets 文件和命令行参数，去重后保持顺序"""
+    cities, keywords = [], []
+    if args.targets:
+        with open(args.targets, encoding="utf-8") as f:
+            data = json.load(f)
+        cities += data.get("cities", [])
+        keywords += data.get("search_keywords", [])
+    cities += _split(args.cities)
+    keywords += _split(args.keywords)
+    if not cities:
+        cities = _split(get_settings().unsplash_preload_cities)
+    return {
+        "cities": list(dict.fromkeys(cities)),
+        "search_keywords": list(dict.fromkeys(keywords)),
+        "preferences": _split(args.preferences) or [DEFAULT_PREFERENCES],
+        "accommodations": _split(args.accommodations) or [DEFAULT_ACCOMMODATION],
+    }
+
+
+class WarmState:
+    """已完成项的进度文件，目标列表变化时作废"""
+
+    def __init__(self, path: str, targets: Dict[str, Any], fresh: bool):
+        self.path = path
+        self.digest = hashlib.sha256(json.dumps(targets, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+        self.done: Dict[str, Any] = {}
+        if not fresh and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("digest") == self.digest:
+                self.done = saved["done"]
+                print(f"[WARM] 从进度文件继续，已完成 {len(self.done)} 项")
+
+    def complete(self, task_id: str, result: Any) -> None:
+        self.done[task_id] = result
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"digest": self.digest, "done": self.done}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def finish(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CacheWarmer:
+    def __init__(self, targets: Dict[str, Any], state: WarmState, args: argparse.Namespace):
+        self.targets = targets
+        self.state = state
+        self.args = args
+        settings = get_settings()
+        self.unsplash = (
+            unsplash_service.UnsplashService(settings.unsplash_access_key)
+            if settings.unsplash_access_key and not args.skip_images else None
+        )
+        task_ids = self._task_ids()
+        self.total = len(task_ids)
+        self.finished = len(set(task_ids) & set(state.done))
+
+    def _research_requests(self, city: str) -> List[TripPrefetchRequest]:
+        return [
+            TripPrefetchRequest(city=city, preferences=preferences, accommodation=accommodation)
+            for preferences in self.targets["preferences"]
+            for accommodation in self.targets["accommodations"]
+        ]
+
+    def _task_ids(self) -> List[str]:
+        ids = []
+        for city in self.targets["cities"]:
+            ids += [f"research|{r.city}|{r.preferences}|{r.accommodation}" for r in self._research_requests(city)]
+            if self.unsplash:
+                ids.append(f"images|{city}")
+        if not self.args.skip_xhs:
+            ids.append("xhs")
+        return ids
+
+    async def _step(self, task_id: str, coro_fn) -> Any:
+        """执行一项（已完成的直接返回上次结果），失败时记录错误并继续"""
+        if task_id in self.state.done:
+            return self.state.done[task_id]
+        started = time.perf_counter()
+        try:
+            result = await coro_fn()
+        except Exception as e:
+            print(f"[WARM] ❌ {task_id}: {type(e).__name__}: {e}")
+            return {"error": str(e)}
+        self.state.complete(task_id, result)
+        self.finished += 1
+        print(f"[WARM] ({self.finished}/{self.total}) {task_id} 完成, 耗时 {time.perf_counter() - started:.1f}s: {result}")
+        return result
+
+    def _attraction_names(self, city: str) -> List[str]:
+        """从已缓存的景点检索中取出 POI 名称（每个偏好各取前若干个）"""
+        names = []
+        for request in self._research_requests(city):
+            record = get_research("attraction", research_queries(request)["attraction"])
+            if record is None:
+                continue
+            pois = [poi["name"] for _, _, raw in record["tool_calls"] for poi in parse_pois(raw)]
+            names += pois[:self.args.attractions_per_city]
+        return list(dict.fromkeys(names))
+
+    async def _warm_research(self, request: TripPrefetchRequest) -> Dict[str, Any]:
+        status = await prefetch_research(request, skip=("weather",))
+        failed = {name: error for name, error in status.items() if error not in ("ok", "cached")}
+        if failed:
+            # 不记为完成，重新运行时再试
+            raise RuntimeError(f"检索失败: {failed}")
+        return status
+
+    async def _warm_images(self, city: str) -> Dict[str, Any]:
+        names = await asyncio.to_thread(self._attraction_names, city)
+        # 与 enrich_trip_plan 相同的查询词，行程配图时直接命中翻译和搜索缓存
+        queries = [f"{name} {city}" for name in names]
+        if queries:
+            await self.unsplash.atranslate_many(queries)
+        fetched = await self.unsplash.preload_cities([city], per_page=PHOTOS_PER_ATTRACTION)
+        with_photos = 0
+        for query in queries:
+            if await self.unsplash.aget_photo_urls(query, count=PHOTOS_PER_ATTRACTION, city=city):
+                with_photos += 1
+        return {"attractions": len(queries), "with_photos": with_photos, "city_fallback_fetched": fetched}
+
+    async def warm_city(self, city: str, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        async with semaphore:
+            result = {}
+            for request in self._research_requests(city):
+                task_id = f"research|{request.city}|{request.preferences}|{request.accommodation}"
+                result[task_id] = await self._step(task_id, lambda: self._warm_research(request))
+            if self.unsplash:
+                result[f"images|{city}"] = await self._step(f"images|{city}", lambda: self._warm_images(city))
+            return result
+
+    async def _warm_xhs(self) -> Dict[str, Any]:
+        settings = get_settings()
+        if not settings.xhs_refresh_enabled or not settings.xhs_feed_persist:
+            return {"skipped": "未启用小红书笔记存储（XHS_REFRESH_ENABLED / XHS_FEED_PERSIST），没有可预热的数据"}
+        # 先读入已有笔记，抓取失败的博主保留旧数据
+        await asyncio.to_thread(xhs_service.feed_store.load)
+        refreshed = await xhs_service.refresh_all_feeds()
+        keywords = {
+            keyword: len(xhs_service.feed_store.search(keyword, xhs_service.MAX_PREVIEW_NOTES))
+            for keyword in self.targets["search_keywords"]
+        }
+        return {"bloggers": len(xhs_service.TRAVEL_BLOGGERS), "refreshed": refreshed, "keywords": keywords}
+
+    async def run(self) -> Dict[str, Any]:
+        print(f"[WARM] 开始预热: {len(self.targets['cities'])} 个城市, "
+              f"{len(self.targets['search_keywords'])} 个关键词, 共 {self.total} 项")
+        semaphore = asyncio.Semaphore(max(1, self.args.concurrency))
+        results = await asyncio.gather(*(self.warm_city(city, semaphore) for city in self.targets["cities"]))
+        summary = {"cities": dict(zip(self.targets["cities"], results))}
+        if not self.args.skip_xhs:
+            summary["xhs"] = await self._step("xhs", self._warm_xhs)
+        return summary
+
+
+def cache_stats() -> Dict[str, Any]:
+    return {
+        "research": research_cache_stats(),
+        "translation": unsplash_service.get_translation_cache().stats(),
+        "unsplash_search": unsplash_service.get_search_cache("unsplash_search").stats(),
+        "xhs_feeds": xhs_service.feed_store.stats(),
+    }
+
+
+async def main(args: argparse.Namespace) -> int:
+    settings = get_settings()
+    targets = load_targets(args)
+    if not targets["cities"] and not targets["search_keywords"]:
+        print("[WARM] 没有需要预热的城市或关键词")
+        return 1
+    os.makedirs(settings.cache_dir, exist_ok=True)
+    state = WarmState(args.state or os.path.join(settings.cache_dir, "warm_cache_state.json"), targets, args.fresh)
+    warmer = CacheWarmer(targets, state, args)
+    started_at = datetime.now().isoformat(timespec="seconds")
+    started = time.perf_counter()
+    try:
+        summary = await warmer.run()
+    finally:
+        agent_pool.close()
+        await unsplash_service.close_async_client()
+        await xhs_service.close_rsshub_client()
+        await close_llm_client()
+
+    failed = warmer.total - warmer.finished
+    summary = {
+        "started_at": started_at,
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "elapsed": round(time.perf_counter() - started, 1),
+        "targets": targets,
+        "completed": warmer.finished,
+        "failed": failed,
+        **summary,
+        "cache_stats": cache_stats(),
+    }
+    summary_path = args.summary or os.path.join(settings.cache_dir, "warm_cache_summary.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    if failed:
+        print(f"[WARM] ⚠️ {failed} 项失败，重新运行会只执行未完成的项")
+    else:
+        state.finish()
+    print(f"[WARM] ✅ 预热结束: 完成 {warmer.finished}/{warmer.total} 项, 耗时 {summary['elapsed']}s, 摘要: {summary_path}")
+    return 1 if failed else 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="预热热门城市的检索、翻译、图片缓存和小红书笔记")
+    parser.add_argument("--targets", help='JSON 文件: {"cities": [...], "search_keywords": [...]}')
+    parser.add_argument("--cities", default="", help="城市，逗号分隔（都未指定时使用 UNSPLASH_PRELOAD_CITIES）")
+    parser.add_argument("--keywords", default="", help="小红书搜索关键词，逗号分隔")
+    parser.add_argument("--preferences", default="", help=f"旅行偏好，逗号分隔（默认 {DEFAULT_PREFERENCES}）")
+    parser.add_argument("--accommodations", default="", help=f"住宿类型，逗号分隔（默认 {DEFAULT_ACCOMMODATION}）")
+    parser.add_argument("--concurrency", type=int, default=2, help="同时预热的城市数")
+    parser.add_argument("--attractions-per-city", type=int, default=15, help="每个城市预热图片的景点数")
+    parser.add_argument("--skip-images", action="store_true", help="不预热翻译和图片缓存")
+    parser.add_argument("--skip-xhs", action="store_true", help="不刷新小红书笔记")
+    parser.add_argument("--fresh", action="store_true", help="忽略进度文件，从头开始")
+    parser.add_argument("--state", help="进度文件路径（默认 CACHE_DIR/warm_cache_state.json）")
+    parser.add_argument("--summary", help="摘要文件路径（默认 CACHE_DIR/warm_cache_summary.json）")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    exit_code = asyncio.run(main(parse_args()))
+    shutdown_executors()
+    raise SystemExit(exit_code)
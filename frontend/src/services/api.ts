@@ -1,5 +1,5 @@
 import axios from 'axios';
-import type { TripPlan, TripPlanRequest, XHSResponse, ApiKeys } from '@/types';
+import type { TripPlan, TripPlanRequest, XHSResponse, ApiKeys, DayPlan } from '@/types';
 
 const apiClient = axios.create({
   baseURL: 'http://127.0.0.1:18080/api',
@@ -50,11 +50,33 @@ export const generateTripPlan = async (request: TripPlanRequest): Promise<TripPl
   }
 };
 
+// 本次会话已预取过的 城市|偏好|住宿类型，相同组合不再重复请求
+const prefetchedKeys = new Set<string>();
+
+// 填写表单时预取目的地的景点、天气和酒店检索，失败不影响正常生成
+export const prefetchTrip = async (city: string, preferences: string, accommodation: string): Promise<void> => {
+  const key = `${city}|${preferences}|${accommodation}`;
+  if (prefetchedKeys.has(key)) return;
+  prefetchedKeys.add(key);
+  try {
+    const storedKeys = loadApiKeys();
+    const hasKeys = Object.values(storedKeys).some(v => v);
+    const request = { city, preferences, accommodation };
+    await apiClient.post('/trip/prefetch', hasKeys ? { ...request, api_keys: storedKeys } : request);
+  } catch (error) {
+    // 失败的组合允许下次再试
+    prefetchedKeys.delete(key);
+    console.debug('Prefetch skipped:', error);
+  }
+};
+
 export interface StreamProgress {
   step: number;
   status: string;
   progress: number;
   data?: TripPlan;
+  day?: DayPlan;  // 规划阶段每生成完一天推送一次
+  draft?: boolean;  // day 为路线优化、预算计算之前的草稿，最终以 data 为准
   error?: string;
 }
 
@@ -115,4 +115,5 @@ export interface XHSResponse {
   data: XHSNote[];
   search_url: string;
   message?: string;
+  updated_at?: string;
 }